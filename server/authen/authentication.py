@@ -1,8 +1,9 @@
 from rest_framework.authentication import TokenAuthentication as BaseTokenAuthentication
 from rest_framework import exceptions
-from rest_framework.authtoken.models import Token
 from django.utils.translation import gettext_lazy as _
 
+from .token_cache import get_token_cache, resolve_request_token
+
 
 class BearerTokenAuthentication(BaseTokenAuthentication):
     """
@@ -13,36 +14,17 @@ class BearerTokenAuthentication(BaseTokenAuthentication):
     keyword = "Bearer"
 
     def authenticate(self, request):
-        auth = request.META.get("HTTP_AUTHORIZATION", "")
-
-        if not auth:
-            # Try to get from query params as fallback
-            token_param = request.GET.get("token")
-            if token_param:
-                return self.authenticate_credentials(token_param)
+        # Shares the lookup BearerTokenAuthMiddleware already made, if any
+        key, token = resolve_request_token(request)
+        if key is None:
             return None
-
-        # Handle various formats more flexibly
-        auth = auth.strip()  # Remove any whitespace
-
-        # Case 1: Just the token with no prefix
-        if " " not in auth:
-            return self.authenticate_credentials(auth)
-
-        # Case 2: Standard prefixed tokens
-        parts = auth.split(" ", 1)  # Split only on first space
-        prefix, token = parts
-
-        if prefix not in ["Bearer", "Token"]:
-            # Try using the whole string as token (in case it contains spaces)
-            return self.authenticate_credentials(auth)
-
-        return self.authenticate_credentials(token)
+        return self._check_token(token)
 
     def authenticate_credentials(self, key):
-        try:
-            token = Token.objects.get(key=key)
-        except Token.DoesNotExist:
+        return self._check_token(get_token_cache().get(key))
+
+    def _check_token(self, token):
+        if token is None:
             raise exceptions.AuthenticationFailed(_("Invalid token."))
 
         if not token.user.is_active:
@@ -0,0 +1,265 @@
+import logging
+import smtplib
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+from django.core.mail.message import sanitize_address
+from django.db.models import F, Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, "EMAIL_OUTBOX", {})
+
+
+def render_email(template_name, context):
+    """
+    Plain text and HTML bodies of an email from the templates
+    <template_name>.txt and <template_name>.html. Templates are compiled once
+    by the cached loader and then only rendered.
+    """
+    text = get_template(f"{template_name}.txt").render(context)
+    html = get_template(f"{template_name}.html").render(context)
+    return text, html
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    EMAIL_BACKEND that queues messages in the QueuedEmail outbox instead of
+    talking to the mail server, so send_mail() and EmailMessage.send() cost
+    one INSERT. The send_queued_email worker delivers them.
+    """
+
+    def send_messages(self, email_messages):
+        queued = []
+        for message in email_messages:
+            recipients = message.recipients()
+            if not recipients:
+                continue
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            queued.append(
+                QueuedEmail(
+                    subject=str(message.subject)[:255],
+                    from_email=sanitize_address(message.from_email, encoding),
+                    recipients=[sanitize_address(r, encoding) for r in recipients],
+                    message=message.message().as_bytes(linesep="\r\n"),
+                )
+            )
+        try:
+            QueuedEmail.objects.bulk_create(queued)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(queued)
+
+
+def claim_emails(worker_id, limit):
+    """
+    Claim up to limit due emails, oldest first, with one conditional UPDATE
+    tagged with a fresh claim id. Emails left "sending" past the lease (a
+    worker died mid-batch) are claimed again.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    lease = timedelta(seconds=_config().get("LEASE_SECONDS", 300))
+    due = Q(status="pending", available_at__lte=now) | Q(
+        status="sending", locked_at__lt=now - lease
+    )
+    candidates = list(
+        QueuedEmail.objects.filter(due)
+        .order_by("available_at")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+
+    claim_id = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+    QueuedEmail.objects.filter(due, id__in=candidates).update(
+        status="sending",
+        locked_by=claim_id,
+        locked_at=now,
+        attempts=F("attempts") + 1,
+    )
+    return list(
+        QueuedEmail.objects.filter(locked_by=claim_id, status="sending").order_by(
+            "available_at"
+        )
+    )
+
+
+def purge_emails(older_than, batch_size):
+    """
+    Delete up to batch_size sent or dead emails last due before older_than;
+    the number deleted
+    """
+    ids = list(
+        QueuedEmail.objects.filter(
+            status__in=("sent", "dead"), available_at__lt=older_than
+        )
+        .order_by("available_at")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    QueuedEmail.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def _is_permanent(error):
+    """5xx replies and refused recipients will fail the same way next time"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code
+
+
+class EmailOutboxWorker:
+    """
+    Delivers queued emails in batches over one SMTP connection, opened on
+    the first batch and kept for the following ones until the outbox runs
+    dry (if the server drops it meanwhile, it is reopened). Failures are
+    retried with exponential backoff; permanent ones and those past
+    MAX_ATTEMPTS are left "dead" with their last error. While idle it
+    deletes finished emails older than PURGE_AFTER_DAYS.
+    """
+
+    def __init__(self, worker_id, batch_size=None, poll_interval=None):
+        config = _config()
+        self.worker_id = worker_id
+        self.batch_size = batch_size or config.get("BATCH_SIZE", 100)
+        self.poll_interval = poll_interval or config.get("POLL_INTERVAL", 1.0)
+        self.purge_after_days = config.get("PURGE_AFTER_DAYS", 7)
+        self.purge_batch_size = config.get("PURGE_BATCH_SIZE", 1000)
+        self.purge_interval = config.get("PURGE_INTERVAL", 60)
+        self.next_purge = 0.0
+        self.backend = SMTPBackend(fail_silently=False)
+
+    def _connection(self):
+        if self.backend.connection is None:
+            self.backend.open()
+        return self.backend.connection
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception as e:
+            logger.error(f"Error closing SMTP connection: {str(e)}")
+
+    def _send(self, email):
+        refused = self._connection().sendmail(
+            email.from_email, email.recipients, bytes(email.message)
+        )
+        if refused:
+            # Accepted for the other recipients; those refused are not retried
+            logger.warning(f"Email {email.id} refused for {', '.join(refused)}")
+
+    def deliver(self, emails):
+        """
+        Send claimed emails; (email, error or None, permanent) for each.
+        Raises if no connection to the server can be opened.
+        """
+        self._connection()
+        results = []
+        for email in emails:
+            try:
+                try:
+                    self._send(email)
+                except smtplib.SMTPServerDisconnected:
+                    # The server dropped the connection: reopen and try again once
+                    self.backend.connection = None
+                    self._send(email)
+                results.append((email, None, False))
+            except Exception as e:
+                results.append((email, e, _is_permanent(e)))
+        return results
+
+    def record(self, results):
+        now = timezone.now()
+        max_attempts = _config().get("MAX_ATTEMPTS", 5)
+        retry_delay = _config().get("RETRY_DELAY_SECONDS", 30)
+
+        sent = [email.id for email, error, _ in results if error is None]
+        if sent:
+            # The body is not needed once delivered
+            QueuedEmail.objects.filter(id__in=sent).update(
+                status="sent", sent_at=now, last_error="", locked_by="", message=b""
+            )
+
+        failed = []
+        for email, error, permanent in results:
+            if error is None:
+                continue
+            email.last_error = f"{type(error).__name__}: {str(error)}"
+            email.locked_by = ""
+            if not permanent and email.attempts < max_attempts:
+                email.status = "pending"
+                email.available_at = now + timedelta(
+                    seconds=retry_delay * 2 ** (email.attempts - 1)
+                )
+            else:
+                email.status = "dead"
+                logger.error(
+                    f"Email {email.id} dead after {email.attempts} attempts: "
+                    f"{email.last_error}"
+                )
+            failed.append(email)
+        if failed:
+            QueuedEmail.objects.bulk_update(
+                failed, ["status", "available_at", "last_error", "locked_by"]
+            )
+
+    def run_once(self):
+        """One claim/deliver/record round; the number of emails handled"""
+        emails = claim_emails(self.worker_id, self.batch_size)
+        if not emails:
+            return 0
+        try:
+            results = self.deliver(emails)
+        except Exception as e:
+            # No connection to the server: the whole batch waits for a retry
+            logger.error(f"Error connecting to the mail server: {str(e)}")
+            self.backend.connection = None
+            results = [(email, e, False) for email in emails]
+        self.record(results)
+        return len(emails)
+
+    def purge(self):
+        """
+        Delete one batch of old finished emails, at most once per
+        purge_interval unless the last batch was full; the number deleted
+        """
+        now = time.monotonic()
+        if now < self.next_purge:
+            return 0
+        older_than = timezone.now() - timedelta(days=self.purge_after_days)
+        purged = purge_emails(older_than, self.purge_batch_size)
+        if purged < self.purge_batch_size:
+            self.next_purge = now + self.purge_interval
+        return purged
+
+    def run(self, once=False):
+        """Deliver until interrupted, or with once until nothing is due"""
+        try:
+            while True:
+                if self.run_once():
+                    continue
+                # Idle: don't hold the server's connection while waiting
+                self.close()
+                if self.purge():
+                    continue
+                if once:
+                    return
+                time.sleep(self.poll_interval)
+        finally:
+            self.close()
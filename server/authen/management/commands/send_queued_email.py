@@ -0,0 +1,47 @@
+import os
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from authen.email_outbox import EmailOutboxWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the email worker: deliver queued emails in batches over one "
+        "reused SMTP connection, retrying failures with backoff."
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, "EMAIL_OUTBOX", {})
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=config.get("BATCH_SIZE", 100),
+            help="Most emails claimed per round",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=config.get("POLL_INTERVAL", 1.0),
+            help="Seconds between polls for new emails when idle",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no due emails are left instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        worker = EmailOutboxWorker(
+            worker_id,
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(f"Email worker {worker_id} running")
+        try:
+            worker.run(once=options["once"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping")
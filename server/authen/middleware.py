@@ -1,9 +1,10 @@
 from rest_framework.exceptions import AuthenticationFailed
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
-from rest_framework.authtoken.models import Token
 import re
 
+from .token_cache import get_token_cache, resolve_request_token
+
 
 class BearerTokenAuthMiddleware(MiddlewareMixin):
     """
@@ -30,45 +31,18 @@ class BearerTokenAuthMiddleware(MiddlewareMixin):
         ):
             return None
 
-        # Rest of the middleware implementation...
-
-        # Rest of your middleware code...
-
-        # Check Authorization header first (various formats)
-        auth_header = request.META.get("HTTP_AUTHORIZATION", "")
-        token_key = None
-
-        if auth_header:
-            auth_parts = auth_header.split()
-            if len(auth_parts) == 1:
-                # Just the token
-                token_key = auth_parts[0]
-            elif len(auth_parts) == 2 and auth_parts[0] in ["Bearer", "Token"]:
-                # Bearer or Token prefix
-                token_key = auth_parts[1]
-
-        # Check for token query parameter as fallback
-        if not token_key and request.GET.get("token"):
-            token_key = request.GET.get("token")
-
-        if not token_key:
-            # No token found, continue with view's permission checks
-            return None
-
-        try:
-            token = Token.objects.get(key=token_key)
+        # Resolved once here and reused by BearerTokenAuthentication
+        key, token = resolve_request_token(request)
+        if token is not None:
             # Add authenticated user to request
             request.user = token.user
-        except Token.DoesNotExist:
-            # Token not found but let the view handle authentication failure
-            pass
+        # A missing or unknown token is left to the view's permission checks
 
         return None
 
 
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
 from django.utils.deprecation import MiddlewareMixin
 
 
@@ -97,10 +71,12 @@ class WebSocketTokenAuthMiddleware:
             token_key = auth_header.split(" ")[1]
 
         if token_key:
-            try:
-                token = await database_sync_to_async(Token.objects.get)(key=token_key)
+            # Only go to a thread for the shared cache or the database on a miss
+            cache = get_token_cache()
+            token = cache.peek(token_key) or await database_sync_to_async(
+                cache.get
+            )(token_key)
+            if token is not None and token.user.is_active:
                 return token.user
-            except Token.DoesNotExist:
-                pass
 
         return AnonymousUser()
@@ -1,5 +1,8 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 
 
@@ -104,3 +107,44 @@ class ContactLink(models.Model):
         max_length=100, help_text="Link title (e.g., LinkedIn, GitHub)"
     )
     url = models.URLField(help_text="URL to contact resource")
+
+
+class QueuedEmail(models.Model):
+    """
+    Outbox entry for one email, stored as the complete MIME message. The
+    EMAIL_BACKEND (authen.email_outbox.OutboxEmailBackend) only queues these;
+    the worker (manage.py send_queued_email) delivers them over one reused
+    SMTP connection and retries failures until MAX_ATTEMPTS.
+    """
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("dead", "Dead"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    subject = models.CharField(max_length=255, blank=True, default="")
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    message = models.BinaryField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves the worker's "next due emails" poll
+            models.Index(
+                fields=["status", "available_at"], name="authen_email_due_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
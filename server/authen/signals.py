@@ -1,8 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
 from rest_framework.authtoken.models import Token
 from .models import CustomUser
+from .token_cache import get_token_cache
 
 
 @receiver(post_save, sender=CustomUser)
@@ -13,3 +14,19 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
     """
     if created:
         Token.objects.create(user=instance)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """
+    Stop serving a token from the auth cache once it is gone: logout,
+    password change or reset, and account deletion all delete the token
+    """
+    get_token_cache().invalidate(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(sender, instance, created=False, **kwargs):
+    """Cached tokens carry a copy of their user, so refresh it on every save"""
+    if not created:
+        get_token_cache().invalidate_user(instance.pk)
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import socket
+import unittest
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .email_outbox import EmailOutboxWorker, purge_emails
+from .middleware import WebSocketTokenAuthMiddleware
+from .models import CustomUser, QueuedEmail
+from .token_cache import LocalLRU, get_token_cache
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:  # Local SMTP stand-in, only needed by the outbox tests
+    Controller = None
+
+TOKEN_CACHE = {"CACHE": "default", "TIMEOUT": 300, "LOCAL_SIZE": 100}
+
+
+class LocalLRUTests(TestCase):
+    """The bounded in-process layer of the token cache"""
+
+    def test_evicts_least_recently_used(self):
+        lru = LocalLRU(max_size=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        self.assertEqual(len(lru), 2)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+
+    def test_entries_expire(self):
+        lru = LocalLRU(max_size=2, ttl=-1)
+        lru.set("a", 1)
+        self.assertIsNone(lru.get("a"))
+
+
+class TokenCacheTests(APITestCase):
+    """Cached token -> user lookups and their invalidation"""
+
+    def setUp(self):
+        settings_override = override_settings(TOKEN_CACHE=TOKEN_CACHE)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.user = CustomUser.objects.create_user(
+            username="alice", email="alice@example.com", password="old-password1"
+        )
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token.key}")
+
+    def _me(self):
+        return self.client.get(reverse("auth-me"))
+
+    def test_request_resolves_token_once(self):
+        # Middleware and DRF authentication share one token + user query; the
+        # other one is the profile's contact links
+        with self.assertNumQueries(2):
+            response = self._me()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["username"], "alice")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self._me().status_code, status.HTTP_200_OK)
+
+    def test_shared_cache_fills_empty_local_cache(self):
+        self._me()
+        get_token_cache().clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self._me().status_code, status.HTTP_200_OK)
+
+    def test_unknown_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self._me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_invalidates_token(self):
+        self._me()
+        response = self.client.post(reverse("logout"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates_token(self):
+        self._me()
+        response = self.client.post(
+            reverse("change-password"),
+            {"old_password": "old-password1", "new_password": "new-password2"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['token']}")
+        self.assertEqual(self._me().status_code, status.HTTP_200_OK)
+
+    def test_password_reset_invalidates_token(self):
+        self._me()
+        response = self.client.post(
+            reverse("password-reset-confirm"),
+            {
+                "uid": urlsafe_base64_encode(force_bytes(self.user.pk)),
+                "token": default_token_generator.make_token(self.user),
+                "new_password": "Reset-password3",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_account_deletion_invalidates_token(self):
+        self._me()
+        self.user.delete()
+        self.assertEqual(self._me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changes_are_not_served_stale(self):
+        self._me()
+        self.user.first_name = "Alice"
+        self.user.save()
+        self.assertEqual(self._me().data["first_name"], "Alice")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._me().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_websocket_middleware_uses_cache(self):
+        middleware = WebSocketTokenAuthMiddleware(None)
+        scope = {"query_string": f"token={self.token.key}".encode(), "headers": []}
+
+        user = async_to_sync(middleware.get_user)(scope)
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = async_to_sync(middleware.get_user)(scope)
+        self.assertEqual(user.pk, self.user.pk)
+
+        self.token.delete()
+        user = async_to_sync(middleware.get_user)(scope)
+        self.assertFalse(user.is_authenticated)
+
+
+class RecordingSMTPHandler:
+    """aiosmtpd handler counting SMTP sessions and keeping delivered messages"""
+
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+        self.sessions = 0
+        self.messages = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((list(envelope.rcpt_tos), envelope.content))
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipUnless(Controller, "aiosmtpd is not installed")
+class EmailOutboxTests(APITestCase):
+    """Emails are queued by the request and delivered by the outbox worker"""
+
+    def setUp(self):
+        self.smtp = RecordingSMTPHandler(refuse={"nobody@example.com"})
+        controller = Controller(self.smtp, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        self.addCleanup(controller.stop)
+
+        settings_override = override_settings(
+            EMAIL_BACKEND="authen.email_outbox.OutboxEmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=controller.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_OUTBOX={"MAX_ATTEMPTS": 2, "RETRY_DELAY_SECONDS": 0},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_password_reset_only_queues_the_email(self):
+        CustomUser.objects.create_user(
+            username="alice", email="alice@example.com", password="old-password1"
+        )
+
+        response = self.client.post(
+            reverse("password-reset-request"), {"email": "alice@example.com"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.smtp.sessions, 0)
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.status, "pending")
+        self.assertEqual(queued.recipients, ["alice@example.com"])
+
+        EmailOutboxWorker("test").run(once=True)
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, "sent")
+        [(recipients, content)] = self.smtp.messages
+        self.assertEqual(recipients, ["alice@example.com"])
+        self.assertIn(b"text/plain", content)
+        self.assertIn(b"text/html", content)
+        self.assertIn(b"reset-password?uid=", content)
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(5):
+            mail.send_mail("Hi", "Body", "hub@example.com", [f"user{i}@example.com"])
+        self.assertEqual(self.smtp.sessions, 0)
+
+        EmailOutboxWorker("test", batch_size=2).run(once=True)
+
+        self.assertEqual(self.smtp.sessions, 1)
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(QueuedEmail.objects.filter(status="sent").count(), 5)
+
+    def test_refused_email_is_dead_lettered(self):
+        mail.send_mail("Hi", "Body", "hub@example.com", ["nobody@example.com"])
+        mail.send_mail("Hi", "Body", "hub@example.com", ["alice@example.com"])
+
+        EmailOutboxWorker("test").run(once=True)
+
+        dead = QueuedEmail.objects.get(recipients=["nobody@example.com"])
+        self.assertEqual(dead.status, "dead")
+        self.assertEqual(dead.attempts, 1)
+        self.assertIn("SMTPRecipientsRefused", dead.last_error)
+        sent = QueuedEmail.objects.get(recipients=["alice@example.com"])
+        self.assertEqual(sent.status, "sent")
+
+    def test_unreachable_server_is_retried(self):
+        mail.send_mail("Hi", "Body", "hub@example.com", ["alice@example.com"])
+
+        with self.settings(EMAIL_PORT=free_port()):
+            EmailOutboxWorker("test").run_once()
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.status, "pending")
+        self.assertEqual(queued.attempts, 1)
+
+        EmailOutboxWorker("test").run(once=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, "sent")
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_sent_email_keeps_no_body(self):
+        mail.send_mail("Hi", "Body", "hub@example.com", ["alice@example.com"])
+
+        EmailOutboxWorker("test").run(once=True)
+
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.status, "sent")
+        self.assertEqual(bytes(queued.message), b"")
+
+    def test_old_finished_emails_are_purged_in_batches(self):
+        long_ago = timezone.now() - timedelta(days=8)
+        for subject, email_status, available_at in (
+            ("old-sent-1", "sent", long_ago),
+            ("old-sent-2", "sent", long_ago),
+            ("old-dead", "dead", long_ago),
+            ("old-pending", "pending", long_ago),
+            ("new-sent", "sent", timezone.now()),
+        ):
+            QueuedEmail.objects.create(
+                subject=subject,
+                from_email="hub@example.com",
+                recipients=["alice@example.com"],
+                message=b"",
+                status=email_status,
+                available_at=available_at,
+            )
+        older_than = timezone.now() - timedelta(days=7)
+
+        self.assertEqual(purge_emails(older_than, batch_size=2), 2)
+        self.assertEqual(purge_emails(older_than, batch_size=2), 1)
+        self.assertEqual(purge_emails(older_than, batch_size=2), 0)
+        self.assertEqual(
+            set(QueuedEmail.objects.values_list("subject", flat=True)),
+            {"old-pending", "new-sent"},
+        )
+
+    def test_idle_worker_purges_old_emails(self):
+        QueuedEmail.objects.create(
+            from_email="hub@example.com",
+            recipients=["alice@example.com"],
+            message=b"",
+            status="dead",
+            available_at=timezone.now() - timedelta(days=8),
+        )
+
+        EmailOutboxWorker("test").run(once=True)
+
+        self.assertFalse(QueuedEmail.objects.exists())
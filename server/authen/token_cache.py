@@ -0,0 +1,176 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+
+class LocalLRU:
+    """Thread-safe, size-bounded LRU whose entries expire after ttl seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TokenCache:
+    """
+    Token key -> Token (with its user loaded), looked up in a small
+    in-process LRU, then the shared Django cache, then the database. The LRU
+    holds pickles, so every request gets its own user instance to modify.
+
+    Entries are dropped from this process's LRU and the shared cache when a
+    token is deleted or its user is saved (see authen.signals). Other
+    processes may keep serving their LRU copy for up to LOCAL_TIMEOUT
+    seconds, so keep it short; CACHE should name a cache shared by all
+    workers (e.g. Redis) for invalidation to reach them.
+    """
+
+    key_prefix = "authen:token:"
+
+    def __init__(
+        self, cache_alias="default", timeout=300, local_size=10000, local_timeout=5
+    ):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.local = LocalLRU(local_size, local_timeout)
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _cache_key(self, key):
+        # Raw tokens never end up in the cache backend
+        return self.key_prefix + hashlib.sha256(key.encode()).hexdigest()
+
+    def peek(self, key):
+        """The token if it is in this process's LRU; never does I/O"""
+        data = self.local.get(self._cache_key(key)) if key else None
+        return pickle.loads(data) if data is not None else None
+
+    def get(self, key):
+        """The Token for key with .user loaded, or None if there is no such token"""
+        if not key:
+            return None
+        cache_key = self._cache_key(key)
+        data = self.local.get(cache_key)
+        if data is not None:
+            return pickle.loads(data)
+
+        token = self.cache.get(cache_key)
+        if token is None:
+            try:
+                token = Token.objects.select_related("user").get(key=key)
+            except Token.DoesNotExist:
+                return None
+            self.cache.set(cache_key, token, self.timeout)
+        self.local.set(cache_key, pickle.dumps(token, pickle.HIGHEST_PROTOCOL))
+        return token
+
+    def invalidate(self, key):
+        cache_key = self._cache_key(key)
+        self.local.delete(cache_key)
+        self.cache.delete(cache_key)
+
+    def invalidate_user(self, user_id):
+        for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+            self.invalidate(key)
+
+    def clear(self):
+        """Forget this process's entries (the shared cache expires on its own)"""
+        self.local.clear()
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        config = getattr(settings, "TOKEN_CACHE", {})
+        _token_cache = TokenCache(
+            cache_alias=config.get("CACHE", "default"),
+            timeout=config.get("TIMEOUT", 300),
+            local_size=config.get("LOCAL_SIZE", 10000),
+            local_timeout=config.get("LOCAL_TIMEOUT", 5),
+        )
+    return _token_cache
+
+
+def get_token_key(request):
+    """
+    The token a request carries: the Authorization header as '<token>',
+    'Bearer <token>' or 'Token <token>', else the ?token= query parameter
+    """
+    auth = request.META.get("HTTP_AUTHORIZATION", "").strip()
+    if not auth:
+        return request.GET.get("token") or None
+    if " " not in auth:
+        return auth
+    prefix, token = auth.split(" ", 1)
+    if prefix not in ["Bearer", "Token"]:
+        # Try using the whole string as token (in case it contains spaces)
+        return auth
+    return token
+
+
+def resolve_request_token(request):
+    """
+    (token key, Token or None) for a request, looked up once and remembered
+    on the underlying HttpRequest, so BearerTokenAuthMiddleware and
+    BearerTokenAuthentication share one lookup
+    """
+    request = getattr(request, "_request", request)  # unwrap a DRF Request
+    resolved = getattr(request, "_token_auth", None)
+    if resolved is None:
+        key = get_token_key(request)
+        resolved = (key, get_token_cache().get(key) if key else None)
+        request._token_auth = resolved
+    return resolved
+
+
+@receiver(setting_changed)
+def reset_token_cache(setting, **kwargs):
+    global _token_cache
+    if setting in ("TOKEN_CACHE", "CACHES"):
+        _token_cache = None
@@ -992,6 +992,7 @@ class UserContactLinksAPIView(APIView):
 # In views.py, at the top of the file with other imports
 from django.core.mail import EmailMultiAlternatives
 from datetime import datetime  # Ensure this import is added
+from .email_outbox import render_email
 
 
 class PasswordResetRequestView(generics.GenericAPIView):
@@ -1014,90 +1015,23 @@ class PasswordResetRequestView(generics.GenericAPIView):
                     f"{settings.FRONTEND_URL}/reset-password?uid={uid}&token={token}"
                 )
 
-                # Create improved HTML email content
-                email_body = f"""
-                <!DOCTYPE html>
-                <html lang="en">
-                <head>
-                    <meta charset="UTF-8">
-                    <style>
-                        body {{
-                            font-family: Arial, sans-serif;
-                            line-height: 1.6;
-                            color: #333;
-                            max-width: 600px;
-                            margin: 0 auto;
-                            padding: 20px;
-                            background-color: #f4f4f4;
-                        }}
-                        .container {{
-                            background-color: white;
-                            border-radius: 8px;
-                            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                            padding: 20px;
-                        }}
-                        .header {{
-                            background-color: #007bff;
-                            color: white;
-                            text-align: center;
-                            padding: 10px;
-                            border-radius: 4px;
-                            margin-bottom: 20px;
-                        }}
-                        .content {{
-                            padding: 15px;
-                        }}
-                        .reset-link {{
-                            display: block;
-                            background-color: #007bff;
-                            color: white;
-                            text-align: center;
-                            padding: 10px;
-                            text-decoration: none;
-                            border-radius: 4px;
-                            margin: 20px 0;
-                        }}
-                        .footer {{
-                            text-align: center;
-                            color: #666;
-                            font-size: 12px;
-                            margin-top: 20px;
-                        }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="header">
-                            <h2>Password Reset</h2>
-                        </div>
-                        <div class="content">
-                            <p>Hi {user.username},</p>
-                            <p>You have requested to reset your password for Startup Hub. Click the button below to reset your password:</p>
-                            
-                            <a href="{reset_url}" class="reset-link">Reset Password</a>
-                            
-                            <p>If you did not request this password reset, please ignore this email or contact support if you have concerns.</p>
-                            
-                            <p>This password reset link will expire in 1 hour.</p>
-                        </div>
-                        <div class="footer">
-                            <p>© {datetime.now().year} Startup Hub. All rights reserved.</p>
-                            <p>If the button doesn't work, copy and paste this link:</p>
-                            <p>{reset_url}</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """
-
-                # Send email using EmailMultiAlternatives for HTML support
+                text_body, html_body = render_email(
+                    "authen/email/password_reset",
+                    {
+                        "username": user.username,
+                        "reset_url": reset_url,
+                        "year": datetime.now().year,
+                    },
+                )
+
+                # Queued by the outbox backend; the email worker delivers it
                 email = EmailMultiAlternatives(
                     subject="Reset Your Startup Hub Password",
-                    body="Plain text fallback for email clients that don't support HTML",
+                    body=text_body,
                     from_email=settings.DEFAULT_FROM_EMAIL,
                     to=[user.email],
                 )
-                email.attach_alternative(email_body, "text/html")
+                email.attach_alternative(html_body, "text/html")
                 email.send()
 
                 return Response(
@@ -7,9 +7,11 @@ class CommunicationConfig(AppConfig):
     name = "communication"
 
     def ready(self):
+        import communication.signals
+
         # Only configure Cloudinary in the main process, not in management commands
 
         if os.environ.get("RUN_MAIN", None) != "true":
-            from .utils.cloudinary_helper import CloudinaryHelper
+            from .utils import CloudinaryHelper
 
             CloudinaryHelper.configure()
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .fanout import send_to_groups
+from .metrics import metrics
+from .models import CallInvitation, IncomingCallNotification
+from .serializers import CallInvitationSerializer, IncomingCallNotificationSerializer
+
+
+def _config():
+    return getattr(settings, "CALL_EXPIRY", {})
+
+
+# model -> (statuses still waiting for an answer, serializer, group event type,
+# event key of the serialized call)
+EXPIRABLE = {
+    IncomingCallNotification: (
+        ("pending", "seen"),
+        IncomingCallNotificationSerializer,
+        "call_notification_update",
+        "notification",
+    ),
+    CallInvitation: (
+        ("pending",),
+        CallInvitationSerializer,
+        "call_invitation_update",
+        "invitation",
+    ),
+}
+
+
+def expire_due(model, batch_size, now=None):
+    """
+    Mark up to batch_size unanswered calls of model whose expires_at has
+    passed as expired, oldest first, and tell both parties once the
+    transaction commits. Rows locked by another sweeper are skipped.
+    Returns the number of calls expired.
+    """
+    statuses, serializer_class, event_type, event_key = EXPIRABLE[model]
+    now = now or timezone.now()
+    with transaction.atomic():
+        calls = list(
+            model.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(status__in=statuses, expires_at__lte=now)
+            .select_related(*(field[:-3] for field in model.sync_user_fields))
+            .order_by("expires_at")[:batch_size]
+        )
+        if not calls:
+            return 0
+        # CallStateQuerySet.update logs the sync events
+        model.objects.filter(id__in=[call.id for call in calls]).update(
+            status="expired"
+        )
+        for call in calls:
+            call.status = "expired"
+
+        def notify():
+            send_to_groups(
+                (f"user_{getattr(call, field)}", {"type": event_type, event_key: data})
+                for call, data in zip(calls, serializer_class(calls, many=True).data)
+                for field in model.sync_user_fields
+            )
+
+        transaction.on_commit(notify)
+    metrics.counter("call_expiry.expired").inc(len(calls))
+    return len(calls)
+
+
+def purge_expired(model, older_than, batch_size):
+    """Delete up to batch_size calls of model that expired before older_than"""
+    ids = list(
+        model.objects.filter(status="expired", expires_at__lt=older_than)
+        .order_by("expires_at")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    model.objects.filter(id__in=ids).delete()
+    metrics.counter("call_expiry.purged").inc(len(ids))
+    return len(ids)
+
+
+def sweep(batch_size=None, purge_after_days=None, now=None):
+    """
+    Expire every overdue call notification and invitation, then delete the
+    ones expired more than purge_after_days ago, in transactions of at most
+    batch_size rows. Returns {"expired": n, "purged": n}.
+    """
+    config = _config()
+    batch_size = batch_size or config.get("BATCH_SIZE", 500)
+    if purge_after_days is None:
+        purge_after_days = config.get("PURGE_AFTER_DAYS", 7)
+    now = now or timezone.now()
+    older_than = now - timedelta(days=purge_after_days)
+
+    totals = {"expired": 0, "purged": 0}
+    for model in EXPIRABLE:
+        while True:
+            expired = expire_due(model, batch_size, now)
+            totals["expired"] += expired
+            if expired < batch_size:
+                break
+        while True:
+            purged = purge_expired(model, older_than, batch_size)
+            totals["purged"] += purged
+            if purged < batch_size:
+                break
+    return totals
@@ -1,3 +1,5 @@
+import asyncio
+import math
 import traceback
 import uuid
 from channels.db import database_sync_to_async
@@ -8,9 +10,22 @@ import json
 import base64
 from django.core.files.base import ContentFile
 from django.utils import timezone
-from .models import Room, Participant, Message
+from .models import Room, Participant, Message, DirectRoomKey
 from .utils import MediaProcessor
-from django.core.cache import cache
+from .write_behind import write_behind
+from .membership import is_room_member_async
+from .presence import device_id_for, get_presence
+from .typing import TypingView, typing_aggregators
+from .uploads import ChunkedUpload, UploadError, split_frame
+from .fanout import chat_message_event, get_user_info
+from .flow_control import (
+    FRAME_CLASSES,
+    OutboundQueue,
+    RateLimiter,
+    outbound_queue_size,
+)
+from . import media_jobs
+from .webrtc_config import WebRTCConfig
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +37,9 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     Unified WebSocket consumer that supports both room-based and username-based connections
     """
 
+    # Chunked uploads a single connection may have open at once
+    MAX_CONCURRENT_UPLOADS = 3
+
     async def connect(self):
         """
         Handle WebSocket connection for both connection types
@@ -48,6 +66,9 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 await self.close(code=4003)  # Authentication failure
                 return
 
+            # Presence is tracked per device; reconnects from one device reuse it
+            self.device_id = device_id_for(self.scope, self.channel_name)
+
             # Determine the connection type based on URL parameters
             if "room_id" in self.scope["url_route"]["kwargs"]:
                 await self.setup_room_connection()
@@ -58,9 +79,28 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 await self.close(code=4004)  # Missing identifier
                 return
 
+            # Frames to the client go through a bounded queue that sheds
+            # typing and presence updates first when the client lags
+            self.outbound = OutboundQueue(self.base_send, outbound_queue_size())
+            self.base_send = self.outbound.put
+            self.rate_limiter = RateLimiter.from_settings(self.user.pk)
+            self.typing_view = TypingView()
+            self.deferred_mark_read = None
+            self.deferred_mark_read_task = None
+
             # Accept the WebSocket connection
             await self.accept()
 
+            # ICE servers come with the join, so starting a call needs no
+            # separate webrtc_config request
+            await self.send_json(
+                {
+                    "type": "room_joined",
+                    "room_id": str(self.room_id),
+                    **await self.get_ice_config(),
+                }
+            )
+
             # Update user's presence status
             await self.update_user_presence(True)
 
@@ -104,8 +144,11 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         self.room_group_name = f"room_{self.room_id}"
         self.user_group_name = f"user_{self.user.id}"
 
-        # Verify user is a participant in the room
-        is_participant = await self.is_room_participant(self.room_id)
+        # Verify user is a participant in the room, unless their connect
+        # ticket already grants it
+        is_participant = self.room_id in self.scope.get(
+            "ticket_rooms", ()
+        ) or await self.is_room_participant(self.room_id)
         if not is_participant:
             logger.warning(
                 f"User {self.user.id} attempted to join room {self.room_id} without being a participant"
@@ -146,6 +189,21 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         Handle WebSocket disconnection
         """
         try:
+            # The client is gone; stop writing to it
+            if getattr(self, "outbound", None) is not None:
+                await self.outbound.close()
+
+            # A throttled read watermark still waiting is applied now
+            task = getattr(self, "deferred_mark_read_task", None)
+            if task is not None and not task.done():
+                task.cancel()
+                await self.apply_deferred_mark_read()
+
+            # Drop unfinished chunked uploads and their temp files
+            for upload in getattr(self, "uploads", {}).values():
+                upload.discard()
+            self.uploads = {}
+
             # Leave groups if they exist
             if hasattr(self, "room_group_name") and hasattr(self, "channel_name"):
                 await self.channel_layer.group_discard(
@@ -159,6 +217,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
             # Update user presence status if we have the necessary attributes
             if hasattr(self, "user") and hasattr(self, "room_id"):
+                self.set_typing(False)
                 await self.update_user_presence(False)
 
                 # Notify other participants about the disconnection
@@ -171,6 +230,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                     },
                 )
 
+            # Persist anything still in the write-behind buffer. Last, so a
+            # failing database cannot keep the cleanup above from running;
+            # the flusher keeps retrying what is left
+            if write_behind.enabled():
+                try:
+                    await write_behind.flush()
+                except Exception as e:
+                    logger.error(f"Write-behind flush on disconnect failed: {str(e)}")
+
             logger.info(
                 f"User {getattr(self, 'user', 'unknown')} disconnected from {getattr(self, 'connection_type', 'unknown')} {getattr(self, 'identifier', 'unknown')}"
             )
@@ -180,6 +248,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
     # Add these methods to ChatConsumer in chat_consumer.py
 
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        """
+        Binary frames carry chunked upload data; text frames are JSON
+        """
+        if text_data is None and bytes_data is not None:
+            await self.handle_upload_chunk(bytes_data)
+            return
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
     # Add to receive_json method to handle incoming_call_status
     async def receive_json(self, content):
         """
@@ -187,6 +264,12 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         """
         message_type = content.get("type")
 
+        limiter = getattr(self, "rate_limiter", None)
+        retry_after = limiter.check(message_type) if limiter else None
+        if retry_after is not None:
+            await self.handle_throttled(message_type, retry_after, content)
+            return
+
         try:
             # Handle different message types
             if message_type == "text_message":
@@ -215,6 +298,16 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 await self.handle_incoming_call_status(
                     content
                 )  # New handler for incoming call status
+            elif message_type == "mark_read":
+                await self.handle_mark_read(content)
+            elif message_type == "heartbeat":
+                await self.handle_heartbeat(content)
+            elif message_type == "upload_begin":
+                await self.handle_upload_begin(content)
+            elif message_type == "upload_commit":
+                await self.handle_upload_commit(content)
+            elif message_type == "upload_abort":
+                await self.handle_upload_abort(content)
             else:
                 logger.warning(f"Unknown message type: {message_type}")
                 await self.send_json(
@@ -229,6 +322,43 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
             logger.error(traceback.format_exc())
 
+    async def handle_throttled(self, message_type, retry_after, content):
+        """Tell the client a frame was dropped by the rate limits"""
+        # Typing updates are superseded by the next one; drop them quietly
+        if FRAME_CLASSES[message_type] == "typing":
+            return
+        # Read watermarks only move forward, so only the newest one matters:
+        # keep it and apply it once the limit allows (if it ever does)
+        if FRAME_CLASSES[message_type] == "receipts":
+            if not math.isinf(retry_after):
+                self.defer_mark_read(content, retry_after)
+            return
+        await self.send_json(
+            {
+                "type": "error",
+                "code": "rate_limited",
+                "message": f"Too many {message_type} frames, slow down",
+                # null: the class is blocked (configured with a rate of 0)
+                "retry_after": (
+                    None if math.isinf(retry_after) else round(retry_after, 3)
+                ),
+            }
+        )
+
+    async def send_low_priority(self, content):
+        """
+        send_json for frames the client can do without (typing, presence),
+        which are the first dropped when its outbound queue is full. Returns
+        False if the frame was dropped.
+        """
+        if getattr(self, "outbound", None) is None:
+            await self.send_json(content)
+            return True
+        text = await self.encode_json(content)
+        return await self.outbound.put(
+            {"type": "websocket.send", "text": text}, low_priority=True
+        )
+
     # Add new handler for incoming_call_status
     async def handle_incoming_call_status(self, content):
         """Handle updates to incoming call notifications"""
@@ -413,6 +543,23 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error in call_notification_update handler: {str(e)}")
 
+    async def call_invitation(self, event):
+        await self.send_json(
+            {"type": "call_invitation", "invitation": event["invitation"]}
+        )
+
+    async def call_invitation_update(self, event):
+        try:
+            invitation = event.get("invitation")
+            if not invitation:
+                return
+
+            await self.send_json(
+                {"type": "call_invitation_update", "invitation": invitation}
+            )
+        except Exception as e:
+            logger.error(f"Error in call_invitation_update handler: {str(e)}")
+
     async def room_call_announcement(self, event):
         try:
             notification = event.get("notification")
@@ -426,17 +573,11 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             logger.error(f"Error in room_call_announcement handler: {str(e)}")
 
     # Database access methods
-    @database_sync_to_async
-    def is_room_participant(self, room_id):
+    async def is_room_participant(self, room_id):
         """
         Check if the current user is a participant in the specified room
         """
-        try:
-            # Verify room exists and user is a participant
-            return Participant.objects.filter(room_id=room_id, user=self.user).exists()
-        except Exception as e:
-            logger.error(f"Error checking room participation: {str(e)}")
-            return False
+        return await is_room_member_async(self.user, room_id)
 
     @database_sync_to_async
     def setup_direct_room(self, username):
@@ -447,18 +588,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             # Find target user
             target_user = User.objects.get(username=username)
 
-            # Ensure consistent room naming
-            sorted_usernames = sorted([self.user.username, username])
-            room_name = f"Chat between {sorted_usernames[0]} and {sorted_usernames[1]}"
-
-            # Find or create the room
-            room, created = Room.objects.get_or_create(
-                name=room_name, room_type="direct"
-            )
-
-            # Ensure both users are participants
-            Participant.objects.get_or_create(user=self.user, room=room)
-            Participant.objects.get_or_create(user=target_user, room=room)
+            # Find or create the room through the canonical user pair
+            room, created = DirectRoomKey.get_or_create_room(self.user, target_user)
 
             return {
                 "room_id": str(room.id),
@@ -473,30 +604,54 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return None
 
     @database_sync_to_async
-    def update_user_presence(self, is_online):
+    def get_ice_config(self):
+        """The user's ICE servers, TURN credentials included (cached)"""
+        ice_config = WebRTCConfig.get_ice_config(self.user)
+        return {
+            "ice_servers": ice_config["ice_servers"],
+            "ice_servers_expires_at": ice_config["expires_at"],
+        }
+
+    async def update_user_presence(self, is_online):
         """
-        Update user's presence status in the room
+        Record this device in the presence store and tell the room when the
+        user as a whole goes online or offline
         """
         try:
-            participant = Participant.objects.get(room_id=self.room_id, user=self.user)
-
-            participant.last_active = timezone.now() if is_online else None
-            participant.save(update_fields=["last_active"])
+            presence = get_presence()
+            # A device may have a socket per room open; it stays online until
+            # the last of them leaves
+            if is_online:
+                changed = await presence.touch(
+                    self.user.id, self.device_id, connection=self.channel_name
+                )
+            else:
+                changed = await presence.leave(
+                    self.user.id, self.device_id, connection=self.channel_name
+                )
 
+            if changed:
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        "type": "presence_update",
+                        "user_id": str(self.user.id),
+                        "username": self.user.username,
+                        "status": "online" if is_online else "offline",
+                    },
+                )
             return True
-        except Participant.DoesNotExist:
-            logger.warning(
-                f"Participant not found for user {self.user.id} in room {self.room_id}"
-            )
-            return False
         except Exception as e:
             logger.error(f"Error updating presence: {str(e)}")
             return False
 
     @database_sync_to_async
-    def save_message(self, content, message_type, image=None, video=None, audio=None):
+    def save_message(
+        self, content, message_type, image=None, video=None, audio=None, variants=None
+    ):
         """
-        Save a message to the database
+        Save a message to the database. variants is an upload_image result
+        whose image_variants/image_placeholder are stored with it.
         """
         try:
             # Verify room exists
@@ -511,6 +666,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 image=image,
                 video=video,
                 audio=audio,
+                image_variants=variants["variants"] if variants else {},
+                image_placeholder=variants["placeholder"] if variants else "",
             )
 
             # Return serialized message data
@@ -526,6 +683,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 "image": message.image,
                 "video": message.video,
                 "audio": message.audio,
+                "image_variants": message.image_variants,
+                "image_placeholder": message.image_placeholder,
                 "sent_at": message.sent_at.isoformat(),
                 "room_id": str(message.room.id),
             }
@@ -536,6 +695,68 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             logger.error(f"Error saving message: {str(e)}")
             return None
 
+    def buffer_message(self, content, message_type):
+        """
+        Build a message with a server-assigned id and timestamp and hand it
+        to the write-behind buffer instead of inserting it inline. None if
+        the buffer is full.
+        """
+        message = Message(
+            id=uuid.uuid4(),
+            room_id=self.room_id,
+            sender=self.user,
+            content=content,
+            message_type=message_type,
+            sent_at=timezone.now(),
+        )
+        if not write_behind.enqueue(message):
+            return None
+
+        return {
+            "id": str(message.id),
+            "content": message.content,
+            "sender_id": str(self.user.id),
+            "sender": {
+                "id": str(self.user.id),
+                "username": self.user.username,
+            },
+            "message_type": message.message_type,
+            "image": None,
+            "video": None,
+            "audio": None,
+            "sent_at": message.sent_at.isoformat(),
+            "room_id": str(self.room_id),
+        }
+
+    @database_sync_to_async
+    def mark_room_read(self, message_id=None):
+        """
+        Move the read watermark forward with a single UPDATE
+        """
+        try:
+            message = None
+            if message_id:
+                message = Message.objects.only("id", "sent_at").get(
+                    id=message_id, room_id=self.room_id
+                )
+
+            watermark = Participant.mark_room_read(self.room_id, self.user, message)
+            if not watermark:
+                return None
+
+            return {
+                "room_id": str(self.room_id),
+                "user_id": str(self.user.id),
+                "last_read_message_id": str(watermark.id),
+                "last_read_at": watermark.sent_at.isoformat(),
+            }
+        except Message.DoesNotExist:
+            logger.warning(f"Message {message_id} not found in room {self.room_id}")
+            return None
+        except Exception as e:
+            logger.error(f"Error marking room read: {str(e)}")
+            return None
+
     @database_sync_to_async
     def save_call_message(self, call_type, status):
         """
@@ -592,7 +813,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
     @database_sync_to_async
     def upload_image(self, image_file):
-        """Upload image to Cloudinary"""
+        """Render and upload the image variants"""
         from .utils import MediaProcessor
 
         try:
@@ -628,14 +849,25 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         """
         Handle text message
         """
-        message = await self.save_message(
-            content=content.get("content"), message_type="text"
-        )
+        # Sending a message ends the sender's typing state
+        self.set_typing(False)
+
+        message = None
+        if write_behind.enabled():
+            # Fan out right away; the row is persisted by the next batch
+            message = self.buffer_message(
+                content=content.get("content"), message_type="text"
+            )
+        if message is None:
+            # Write-behind off, or its buffer is full: insert inline
+            message = await self.save_message(
+                content=content.get("content"), message_type="text"
+            )
 
         if message:
             # Broadcast message to room
             await self.channel_layer.group_send(
-                self.room_group_name, {"type": "chat_message", "message": message}
+                self.room_group_name, chat_message_event(message)
             )
         else:
             await self.send_json({"type": "error", "message": "Failed to save message"})
@@ -656,12 +888,20 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
             decoded_image = base64.b64decode(image_str)
 
-            # Upload to Cloudinary
-            image_url = await self.upload_image(
+            if media_jobs.enabled():
+                await self.send_queued_media(
+                    "image",
+                    ContentFile(decoded_image, name=f"image.{ext}"),
+                    content.get("caption", ""),
+                )
+                return
+
+            # Render the variants and upload them
+            image_upload = await self.upload_image(
                 ContentFile(decoded_image, name=f"image.{ext}")
             )
 
-            if not image_url:
+            if not image_upload:
                 await self.send_json(
                     {"type": "error", "message": "Failed to upload image"}
                 )
@@ -670,11 +910,12 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             message = await self.save_message(
                 content=content.get("caption", ""),
                 message_type="image",
-                image=image_url,
+                image=image_upload["url"],
+                variants=image_upload,
             )
 
             await self.channel_layer.group_send(
-                self.room_group_name, {"type": "chat_message", "message": message}
+                self.room_group_name, chat_message_event(message)
             )
         except Exception as e:
             logger.error(f"Error in handle_image_message: {str(e)}")
@@ -696,6 +937,12 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
             decoded_video = base64.b64decode(video_str)
 
+            if media_jobs.enabled():
+                await self.send_queued_media(
+                    "video", ContentFile(decoded_video, name=f"video.{ext}")
+                )
+                return
+
             # Upload to Cloudinary
             video_upload = await self.upload_video(
                 ContentFile(decoded_video, name=f"video.{ext}")
@@ -715,7 +962,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             )
 
             await self.channel_layer.group_send(
-                self.room_group_name, {"type": "chat_message", "message": message}
+                self.room_group_name, chat_message_event(message)
             )
         except Exception as e:
             logger.error(f"Error in handle_video_message: {str(e)}")
@@ -737,6 +984,12 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
             decoded_audio = base64.b64decode(audio_str)
 
+            if media_jobs.enabled():
+                await self.send_queued_media(
+                    "audio", ContentFile(decoded_audio, name=f"audio.{ext}")
+                )
+                return
+
             # Upload to Cloudinary
             audio_url = await self.upload_audio(
                 ContentFile(decoded_audio, name=f"audio.{ext}")
@@ -753,29 +1006,251 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             )
 
             await self.channel_layer.group_send(
-                self.room_group_name, {"type": "chat_message", "message": message}
+                self.room_group_name, chat_message_event(message)
             )
         except Exception as e:
             logger.error(f"Error in handle_audio_message: {str(e)}")
             await self.send_json({"type": "error", "message": str(e)})
 
-    async def handle_typing_status(self, content):
+    # Chunked binary uploads: upload_begin (JSON) -> binary frames of
+    # <16-byte upload id><data> -> upload_commit (JSON)
+    async def handle_upload_begin(self, content):
+        """Open a chunked upload and tell the client its upload id"""
+        if not hasattr(self, "uploads"):
+            self.uploads = {}
+        if len(self.uploads) >= self.MAX_CONCURRENT_UPLOADS:
+            await self.send_json(
+                {"type": "upload_error", "message": "Too many uploads in progress"}
+            )
+            return
+
+        try:
+            upload = ChunkedUpload(
+                media_type=content.get("media_type"),
+                filename=content.get("filename"),
+                size=content.get("size"),
+                caption=content.get("caption", ""),
+            )
+        except UploadError as e:
+            await self.send_json({"type": "upload_error", "message": str(e)})
+            return
+
+        self.uploads[upload.id] = upload
+        await self.send_json(
+            {
+                "type": "upload_ready",
+                "upload_id": str(upload.id),
+                "client_ref": content.get("client_ref"),
+            }
+        )
+
+    async def handle_upload_chunk(self, frame):
+        """Spool one binary chunk, enforcing the size limit as data arrives"""
+        try:
+            upload_id, chunk = split_frame(frame)
+        except (UploadError, ValueError) as e:
+            await self.send_json({"type": "upload_error", "message": str(e)})
+            return
+
+        upload = getattr(self, "uploads", {}).get(upload_id)
+        if not upload:
+            await self.send_json(
+                {
+                    "type": "upload_error",
+                    "upload_id": str(upload_id),
+                    "message": "Unknown upload",
+                }
+            )
+            return
+
+        try:
+            upload.write(chunk)
+        except UploadError as e:
+            self.uploads.pop(upload_id).discard()
+            await self.send_json(
+                {"type": "upload_error", "upload_id": str(upload_id), "message": str(e)}
+            )
+
+    def pop_upload(self, upload_id):
+        try:
+            return getattr(self, "uploads", {}).pop(uuid.UUID(str(upload_id)), None)
+        except ValueError:
+            return None
+
+    async def handle_upload_commit(self, content):
+        """Hand the spooled file to the media uploader and post the message"""
+        upload_id = content.get("upload_id")
+        upload = self.pop_upload(upload_id)
+        if not upload:
+            await self.send_json(
+                {
+                    "type": "upload_error",
+                    "upload_id": upload_id,
+                    "message": "Unknown upload",
+                }
+            )
+            return
+
+        try:
+            media_file = upload.finish()
+            if media_jobs.enabled():
+                message = await self.send_queued_media(
+                    upload.media_type, media_file, content.get("caption", upload.caption)
+                )
+                if message:
+                    await self.send_json(
+                        {
+                            "type": "upload_complete",
+                            "upload_id": upload_id,
+                            "message_id": message["id"],
+                        }
+                    )
+                return
+
+            if upload.media_type == "image":
+                image_upload = await self.upload_image(media_file)
+                message = image_upload and await self.save_message(
+                    content=content.get("caption", upload.caption),
+                    message_type="image",
+                    image=image_upload["url"],
+                    variants=image_upload,
+                )
+            elif upload.media_type == "video":
+                video_upload = await self.upload_video(media_file)
+                message = video_upload and await self.save_message(
+                    content=video_upload.get("thumbnail_url", ""),
+                    message_type="video",
+                    video=video_upload.get("video_url"),
+                )
+            else:
+                audio_url = await self.upload_audio(media_file)
+                message = audio_url and await self.save_message(
+                    content="Audio Message", message_type="audio", audio=audio_url
+                )
+
+            if not message:
+                await self.send_json(
+                    {
+                        "type": "upload_error",
+                        "upload_id": upload_id,
+                        "message": f"Failed to upload {upload.media_type}",
+                    }
+                )
+                return
+
+            await self.channel_layer.group_send(
+                self.room_group_name, chat_message_event(message)
+            )
+            await self.send_json(
+                {
+                    "type": "upload_complete",
+                    "upload_id": upload_id,
+                    "message_id": message["id"],
+                }
+            )
+        except UploadError as e:
+            await self.send_json(
+                {"type": "upload_error", "upload_id": upload_id, "message": str(e)}
+            )
+        finally:
+            upload.discard()
+
+    @database_sync_to_async
+    def queue_media_message(self, media_type, media_file, caption):
+        """Stage the file and create the "processing" message and its job"""
+        try:
+            message = media_jobs.queue_media_message(
+                self.room_id, self.user, media_type, media_file, caption
+            )
+            return media_jobs.message_payload(message)
+        except Exception as e:
+            logger.error(f"Error queueing {media_type} message: {str(e)}")
+            return None
+
+    async def send_queued_media(self, media_type, media_file, caption=""):
         """
-        Handle typing status updates
+        Post a media message immediately in the "processing" state; the
+        media worker uploads the file and broadcasts a message_update
         """
-        is_typing = content.get("is_typing", False)
+        message = await self.queue_media_message(media_type, media_file, caption)
+        if not message:
+            await self.send_json(
+                {"type": "error", "message": f"Failed to queue {media_type}"}
+            )
+            return None
 
-        # Broadcast typing status to room
         await self.channel_layer.group_send(
+            self.room_group_name, chat_message_event(message)
+        )
+        return message
+
+    async def handle_upload_abort(self, content):
+        """Cancel an upload and delete its temp file"""
+        upload = self.pop_upload(content.get("upload_id"))
+        if upload:
+            upload.discard()
+
+    async def handle_typing_status(self, content):
+        """
+        Handle typing status updates. Keystroke-level events are folded into
+        the room's typing aggregator, which broadcasts consolidated
+        typing_users frames instead of one event per update.
+        """
+        self.set_typing(bool(content.get("is_typing", False)))
+
+    def set_typing(self, is_typing):
+        typing_aggregators.update(
+            self.channel_layer,
             self.room_group_name,
-            {
-                "type": "typing_status",
-                "user_id": str(self.user.id),
-                "username": self.user.username,
-                "is_typing": is_typing,
-            },
+            str(self.user.id),
+            self.user.username,
+            is_typing,
         )
 
+    def defer_mark_read(self, content, delay):
+        """Apply the newest throttled mark_read after delay seconds"""
+        self.deferred_mark_read = content
+        task = self.deferred_mark_read_task
+        if task is None or task.done():
+            self.deferred_mark_read_task = asyncio.get_running_loop().create_task(
+                self.apply_deferred_mark_read(delay)
+            )
+
+    async def apply_deferred_mark_read(self, delay=0):
+        await asyncio.sleep(delay)
+        content, self.deferred_mark_read = self.deferred_mark_read, None
+        if content is not None:
+            try:
+                await self.handle_mark_read(content)
+            except Exception as e:
+                logger.error(f"Error applying deferred mark_read: {str(e)}")
+
+    async def handle_mark_read(self, content):
+        """
+        Advance the user's read watermark to message_id (default: newest)
+        and tell the room
+        """
+        message_id = content.get("message_id")
+        if write_behind.enabled() and write_behind.has_pending(
+            self.room_id, message_id
+        ):
+            # The message being acknowledged is not written yet
+            await write_behind.flush()
+
+        receipt = await self.mark_room_read(message_id)
+        if receipt:
+            await self.channel_layer.group_send(
+                self.room_group_name, {"type": "read_receipt", "receipt": receipt}
+            )
+
+    async def handle_heartbeat(self, content):
+        """
+        Keep this device's presence key alive (clients send one well inside
+        PRESENCE["TTL"])
+        """
+        await self.update_user_presence(True)
+        await self.send_json({"type": "heartbeat_ack"})
+
     async def handle_start_call(self, content):
         """Handle call initiation"""
         call_type = content.get("call_type", "video")
@@ -842,6 +1317,11 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     # WebSocket Event Handlers
     async def chat_message(self, event):
         """Send chat message to WebSocket"""
+        if "frame" in event:
+            # Encoded once by the sender for the whole room
+            await self.send(text_data=event["frame"])
+            return
+
         message = event["message"]
 
         # Add sender information if not already included
@@ -859,7 +1339,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
     async def typing_status(self, event):
         """Send typing status to WebSocket"""
-        await self.send_json(
+        await self.send_low_priority(
             {
                 "type": "typing_status",
                 "user_id": event["user_id"],
@@ -868,6 +1348,45 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             }
         )
 
+    async def message_update(self, event):
+        """Send an updated message (e.g. media finished processing) to WebSocket"""
+        if "frame" in event:
+            await self.send(text_data=event["frame"])
+            return
+        await self.send_json({"type": "message_update", "message": event["message"]})
+
+    async def typing_users(self, event):
+        """
+        Send the room's current typers (other than this user) to WebSocket,
+        merged across the workers reporting them and skipping frames that
+        would not change what this client shows
+        """
+        user_id = str(self.user.id)
+        users = [
+            user
+            for user in self.typing_view.apply(event)
+            if user["user_id"] != user_id
+        ]
+        if users == getattr(self, "typing_users_sent", []):
+            return
+        if await self.send_low_priority({"type": "typing_users", "users": users}):
+            self.typing_users_sent = users
+
+    async def read_receipt(self, event):
+        """Send read watermark update to WebSocket"""
+        await self.send_json({"type": "read_receipt", "receipt": event["receipt"]})
+
+    async def presence_update(self, event):
+        """Send online/offline transition to WebSocket"""
+        await self.send_low_priority(
+            {
+                "type": "presence_update",
+                "user_id": event["user_id"],
+                "username": event["username"],
+                "status": event["status"],
+            }
+        )
+
     async def call_notification(self, event):
         """Send call notification to WebSocket"""
         await self.send_json({"type": "call_notification", "call": event["call"]})
@@ -947,23 +1466,4 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     @database_sync_to_async
     def get_cached_user_info(self, user_id):
         """Get cached user information to reduce database queries"""
-        cache_key = f"user_info_{user_id}"
-        user_info = cache.get(cache_key)
-        if not user_info:
-            from django.contrib.auth import get_user_model
-
-            User = get_user_model()
-            try:
-                user = User.objects.get(id=user_id)
-                user_info = {
-                    "id": str(user.id),
-                    "username": user.username,
-                }
-                cache.set(cache_key, user_info, 300)  # Cache for 5 minutes
-            except User.DoesNotExist:
-                logger.error(f"User {user_id} not found")
-                return None
-            except Exception as e:
-                logger.error(f"Error getting user info: {str(e)}")
-                return None
-        return user_info
+        return get_user_info(user_id)
@@ -11,7 +11,9 @@ from django.core.cache import cache
 
 # Add these imports at the top of the file
 from django.contrib.auth import get_user_model
-from .models import Room, Participant, Message
+from .models import Room, Participant, Message, DirectRoomKey
+from .membership import is_room_member_async
+from .presence import device_id_for, get_presence
 
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
@@ -21,7 +23,8 @@ import json
 import base64
 from django.core.files.base import ContentFile
 from django.utils import timezone
-from .models import Room, Participant, Message
+from .models import Room, Participant, Message, DirectRoomKey
+from .presence import device_id_for, get_presence
 from .utils import MediaProcessor
 from django.core.cache import cache
 from django.db.models import Q
@@ -82,15 +85,7 @@ class CommunicationConsumer(AsyncJsonWebsocketConsumer):
         # Find or create direct message room
         other_user = get_user_model().objects.get(username=username)
 
-        # Ensure consistent room naming
-        room_name = sorted([self.user.username, username])
-        room_name = f"Chat between {room_name[0]} and {room_name[1]}"
-
-        room, created = Room.objects.get_or_create(name=room_name, room_type="direct")
-
-        # Ensure participants exist
-        Participant.objects.get_or_create(user=self.user, room=room)
-        Participant.objects.get_or_create(user=other_user, room=room)
+        room, created = DirectRoomKey.get_or_create_room(self.user, other_user)
 
         self.room_id = str(room.id)
         self.room_group_name = f"room_{self.room_id}"
@@ -124,15 +119,8 @@ class CommunicationConsumer(AsyncJsonWebsocketConsumer):
     @database_sync_to_async
     def setup_room(self, username):
         # Find or create direct message room
-        room, created = Room.objects.get_or_create(
-            name=f"Chat between {self.user.username} and {username}", room_type="direct"
-        )
-
-        # Ensure participants exist
         other_user = get_user_model().objects.get(username=username)
-
-        Participant.objects.get_or_create(user=self.user, room=room)
-        Participant.objects.get_or_create(user=other_user, room=room)
+        room, created = DirectRoomKey.get_or_create_room(self.user, other_user)
 
         self.room_id = str(room.id)
         self.room_group_name = f"room_{self.room_id}"
@@ -393,16 +381,8 @@ class CommunicationConsumer(AsyncJsonWebsocketConsumer):
     #     from .models import Participant
 
     #     return Participant.objects.filter(room_id=self.room_id, user=self.user).exists()
-    @database_sync_to_async
-    def is_room_participant(self):
-        from .models import Participant, Room
-
-        try:
-            # Check if room exists and user is a participant
-            room = Room.objects.get(id=self.room_id)
-            return Participant.objects.filter(room=room, user=self.user).exists()
-        except Room.DoesNotExist:
-            return False
+    async def is_room_participant(self):
+        return await is_room_member_async(self.user, self.room_id)
 
     @database_sync_to_async
     def save_message(self, content, message_type, image=None, video=None, audio=None):
@@ -447,18 +427,14 @@ class CommunicationConsumer(AsyncJsonWebsocketConsumer):
             logger.error(f"Error saving message: {str(e)}")
             return None
 
-    @database_sync_to_async
-    def update_user_presence(self, is_online):
-        from .models import Participant
-
+    async def update_user_presence(self, is_online):
         try:
-            participant = Participant.objects.get(room_id=self.room_id, user=self.user)
-            participant.last_active = timezone.now() if is_online else None
-            participant.save(update_fields=["last_active"])
-        except Participant.DoesNotExist:
-            logger.warning(
-                f"Participant not found for user {self.user.id} in room {self.room_id}"
-            )
+            presence = get_presence()
+            device_id = device_id_for(self.scope, self.channel_name)
+            if is_online:
+                await presence.touch(self.user.id, device_id)
+            else:
+                await presence.leave(self.user.id, device_id)
         except Exception as e:
             logger.error(f"Error updating presence: {str(e)}")
 
@@ -830,17 +806,11 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 logger.error(f"Failed to send error message: {str(inner_e)}")
 
     # Database access methods
-    @database_sync_to_async
-    def is_room_participant(self, room_id):
+    async def is_room_participant(self, room_id):
         """
         Check if the current user is a participant in the specified room
         """
-        try:
-            # Verify room exists and user is a participant
-            return Participant.objects.filter(room_id=room_id, user=self.user).exists()
-        except Exception as e:
-            logger.error(f"Error checking room participation: {str(e)}")
-            return False
+        return await is_room_member_async(self.user, room_id)
 
     @database_sync_to_async
     def setup_direct_room(self, username):
@@ -851,18 +821,8 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             # Find target user
             target_user = User.objects.get(username=username)
 
-            # Ensure consistent room naming
-            sorted_usernames = sorted([self.user.username, username])
-            room_name = f"Chat between {sorted_usernames[0]} and {sorted_usernames[1]}"
-
-            # Find or create the room
-            room, created = Room.objects.get_or_create(
-                name=room_name, room_type="direct"
-            )
-
-            # Ensure both users are participants
-            Participant.objects.get_or_create(user=self.user, room=room)
-            Participant.objects.get_or_create(user=target_user, room=room)
+            # Find or create the room through the canonical user pair
+            room, created = DirectRoomKey.get_or_create_room(self.user, target_user)
 
             return {
                 "room_id": str(room.id),
@@ -876,23 +836,18 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             logger.error(f"Error setting up direct room: {str(e)}")
             return None
 
-    @database_sync_to_async
-    def update_user_presence(self, is_online):
+    async def update_user_presence(self, is_online):
         """
-        Update user's presence status in the room
+        Update user's presence status
         """
         try:
-            participant = Participant.objects.get(room_id=self.room_id, user=self.user)
-
-            participant.last_active = timezone.now() if is_online else None
-            participant.save(update_fields=["last_active"])
-
+            presence = get_presence()
+            device_id = device_id_for(self.scope, self.channel_name)
+            if is_online:
+                await presence.touch(self.user.id, device_id)
+            else:
+                await presence.leave(self.user.id, device_id)
             return True
-        except Participant.DoesNotExist:
-            logger.warning(
-                f"Participant not found for user {self.user.id} in room {self.room_id}"
-            )
-            return False
         except Exception as e:
             logger.error(f"Error updating presence: {str(e)}")
             return False
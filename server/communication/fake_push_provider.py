@@ -0,0 +1,100 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePushProvider:
+    """
+    Local stand-in for a push provider's batch endpoint (see
+    push.HTTPPushProvider), for tests and load runs. Runs an HTTP/1.1 server
+    with keep-alive on a free port in a background thread and records every
+    batch it receives and every connection opened to it.
+
+    Tokens in fail_tokens are rejected permanently and tokens in
+    retry_tokens with a retryable error. Statuses queued in fail_statuses
+    are returned, one per batch, instead of a 200 (e.g. [503] fails the
+    next batch as a whole).
+    """
+
+    def __init__(self, fail_tokens=(), retry_tokens=(), fail_statuses=()):
+        self.fail_tokens = set(fail_tokens)
+        self.retry_tokens = set(retry_tokens)
+        self.fail_statuses = list(fail_statuses)
+        self.batches = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/send"
+
+    @property
+    def delivered(self):
+        """Tokens accepted so far, in order"""
+        with self._lock:
+            return [
+                message["token"]
+                for batch in self.batches
+                for message in batch
+                if message["token"] not in self.fail_tokens | self.retry_tokens
+            ]
+
+    def _handle(self, messages):
+        with self._lock:
+            if self.fail_statuses:
+                return self.fail_statuses.pop(0), {"error": "unavailable"}
+            self.batches.append(messages)
+        results = []
+        for message in messages:
+            if message["token"] in self.fail_tokens:
+                results.append({"error": "UNREGISTERED", "retryable": False})
+            elif message["token"] in self.retry_tokens:
+                results.append({"error": "UNAVAILABLE", "retryable": True})
+            else:
+                results.append({"error": None})
+        return 200, {"results": results}
+
+    def start(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with provider._lock:
+                    provider.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                status, content = provider._handle(body["messages"])
+                data = json.dumps(content).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+USER_INFO_TIMEOUT = 300
+
+
+def get_user_info(user_id):
+    """Cached {"id", "username"} of a user, or None if there is no such user"""
+    cache_key = f"user_info_{user_id}"
+    user_info = cache.get(cache_key)
+    if not user_info:
+        User = get_user_model()
+        try:
+            user = User.objects.get(id=user_id)
+            user_info = {
+                "id": str(user.id),
+                "username": user.username,
+            }
+            cache.set(cache_key, user_info, USER_INFO_TIMEOUT)
+        except User.DoesNotExist:
+            logger.error(f"User {user_id} not found")
+            return None
+        except Exception as e:
+            logger.error(f"Error getting user info: {str(e)}")
+            return None
+    return user_info
+
+
+def encode_frame(content):
+    """A WebSocket text frame for content (serializer data may hold UUIDs, dates)"""
+    return json.dumps(content, cls=DjangoJSONEncoder)
+
+
+def frame_event(event_type, content):
+    """
+    A channel-layer event whose WebSocket frame is encoded once, here, for
+    every consumer in the group; handlers forward event["frame"] unchanged
+    """
+    metrics.counter("fanout.frames_encoded").inc()
+    return {"type": event_type, "frame": encode_frame(content)}
+
+
+def chat_message_event(message):
+    """
+    The group event for a new message. Sender info is filled in here, once,
+    if the payload lacks it (a cache or database read, so call it from sync
+    code or with "sender" already set).
+    """
+    if "sender" not in message and "sender_id" in message:
+        user_info = get_user_info(message["sender_id"])
+        if user_info:
+            message = dict(message, sender=user_info)
+    return frame_event("chat_message", {"type": "chat_message", "message": message})
+
+
+def message_update_event(message):
+    """The group event for a changed message (e.g. media finished processing)"""
+    return frame_event("message_update", {"type": "message_update", "message": message})
+
+
+def send_to_groups(sends):
+    """
+    group_send every (group, event) pair of sends concurrently, in one trip
+    from sync code to the event loop rather than one per group; a failed
+    send is logged and does not stop the others
+    """
+    sends = list(sends)
+    if not sends:
+        return
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, event) for group, event in sends),
+            return_exceptions=True,
+        )
+        for (group, _), result in zip(sends, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error sending to group {group}: {str(result)}")
+
+    async_to_sync(send_all)()
+    metrics.counter("fanout.group_sends").inc(len(sends))
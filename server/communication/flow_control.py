@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import math
+import time
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, "CHAT_FLOW_CONTROL", {})
+
+
+def outbound_queue_size():
+    return _config().get("OUTBOUND_QUEUE_SIZE", 256)
+
+
+# Client frame type -> rate limit class
+FRAME_CLASSES = {
+    "text_message": "messages",
+    "image_message": "messages",
+    "video_message": "messages",
+    "audio_message": "messages",
+    "upload_begin": "messages",
+    "start_call": "signaling",
+    "end_call": "signaling",
+    "call_response": "signaling",
+    "incoming_call_status": "signaling",
+    "webrtc_offer": "signaling",
+    "webrtc_answer": "signaling",
+    "ice_candidate": "signaling",
+    "typing": "typing",
+    "mark_read": "receipts",
+}
+
+
+class TokenBucket:
+    """
+    Allows rate events per second on average, and bursts of up to burst.
+    With a rate of 0 the bucket never refills: only the first burst events
+    pass (none with a burst of 0).
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def retry_after(self):
+        """Seconds until the next event would be allowed; inf if never"""
+        if self.rate <= 0:
+            return 0.0 if self.tokens >= 1 else math.inf
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+# (user_id, class) -> bucket shared by the user's connections in this process;
+# an entry goes away with the last connection holding it
+_user_buckets = weakref.WeakValueDictionary()
+
+
+class RateLimiter:
+    """
+    Token-bucket limits for the frames one connection receives, per limit
+    class: one bucket for the connection and one shared by every connection
+    of the same user on this worker. A frame passes only if both buckets
+    have a token. Classes without a configured limit are not limited.
+    """
+
+    def __init__(self, user_id, limits):
+        self._buckets = {}
+        for frame_class, limit in limits.items():
+            user_key = (user_id, frame_class)
+            user_bucket = _user_buckets.get(user_key)
+            if user_bucket is None:
+                user_bucket = TokenBucket(limit["USER_RATE"], limit["USER_BURST"])
+                _user_buckets[user_key] = user_bucket
+            self._buckets[frame_class] = (
+                TokenBucket(limit["RATE"], limit["BURST"]),
+                user_bucket,
+            )
+
+    @classmethod
+    def from_settings(cls, user_id):
+        return cls(user_id, _config().get("RATE_LIMITS", {}))
+
+    def check(self, frame_type):
+        """
+        None if a frame of frame_type may be handled now (and count it),
+        else the number of seconds after which it would be allowed
+        """
+        frame_class = FRAME_CLASSES.get(frame_type)
+        buckets = self._buckets.get(frame_class)
+        if buckets is None:
+            return None
+        now = time.monotonic()
+        blocked = [bucket for bucket in buckets if not bucket.available(now)]
+        if blocked:
+            metrics.counter(f"chat.throttled.{frame_class}").inc()
+            return max(bucket.retry_after() for bucket in blocked)
+        for bucket in buckets:
+            bucket.take()
+        return None
+
+
+class OutboundQueue:
+    """
+    Bounded queue between a consumer and its client. Frames are written in
+    order by one writer task, so a client that reads slowly holds up only
+    its own queue. When the queue is full a low-priority frame (typing,
+    presence) is dropped, and any other frame takes the place of a queued
+    low-priority one or else waits for room.
+    """
+
+    def __init__(self, send, max_size):
+        self._send = send
+        self.max_size = max_size
+        self._frames = deque()  # (low_priority, message)
+        self._queued = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._writer = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _evict_low_priority(self):
+        for index, (low_priority, _) in enumerate(self._frames):
+            if low_priority:
+                del self._frames[index]
+                metrics.counter("chat.outbound.dropped").inc()
+                return True
+        return False
+
+    async def put(self, message, low_priority=False):
+        """Queue an ASGI send message; False if it was dropped"""
+        if self._closed:
+            return False
+        if self._writer is None:
+            self._writer = asyncio.get_running_loop().create_task(self._write())
+        while len(self._frames) >= self.max_size:
+            if low_priority:
+                metrics.counter("chat.outbound.dropped").inc()
+                return False
+            if self._evict_low_priority():
+                break
+            metrics.counter("chat.outbound.waits").inc()
+            self._drained.clear()
+            await self._drained.wait()
+            if self._closed:
+                return False
+        self._frames.append((low_priority, message))
+        self._queued.set()
+        return True
+
+    async def _write(self):
+        while True:
+            while not self._frames:
+                self._queued.clear()
+                await self._queued.wait()
+            _, message = self._frames.popleft()
+            self._drained.set()
+            try:
+                await self._send(message)
+            except Exception as e:
+                # The client is gone; disconnect will close the queue
+                logger.error(f"Error writing to WebSocket: {str(e)}")
+                self._frames.clear()
+                self._drained.set()
+
+    async def close(self):
+        """Stop writing; frames still queued are discarded with the client"""
+        self._closed = True
+        self._frames.clear()
+        self._drained.set()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
@@ -0,0 +1,161 @@
+import base64
+import io
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from PIL import Image, ImageFilter, ImageOps
+
+# (name, longest side in px), largest first: each variant is scaled down
+# from the one before it instead of from the original
+VARIANTS = (("full", 1600), ("medium", 640), ("thumb", 160))
+
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_BLUR_RADIUS = 1
+JPEG_QUALITY = 82
+
+
+def render_variants(data):
+    """
+    Decode an image once and encode each variant plus a tiny blurred
+    placeholder (a data: URI). Orientation is applied and EXIF and other
+    metadata are dropped. Runs in the worker processes, so it takes and
+    returns plain bytes and dicts only.
+    """
+    image = Image.open(io.BytesIO(data))
+    scale = VARIANTS[0][1] / max(image.size)
+    if scale < 1:
+        # JPEGs can be decoded straight at 1/2..1/8 scale when that still
+        # covers the largest variant
+        image.draft(
+            "RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale))
+        )
+    image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    if has_alpha:
+        extension, save_options = "png", {"format": "PNG"}
+    else:
+        extension, save_options = "jpg", {
+            "format": "JPEG",
+            "quality": JPEG_QUALITY,
+            "optimize": True,
+            "progressive": True,
+        }
+
+    variants = {}
+    for name, size in VARIANTS:
+        # thumbnail() resizes in place and never upscales
+        image.thumbnail((size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, **save_options)
+        variants[name] = {
+            "data": output.getvalue(),
+            "extension": extension,
+            "width": image.width,
+            "height": image.height,
+        }
+
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    placeholder = image.convert("RGB").filter(
+        ImageFilter.GaussianBlur(PLACEHOLDER_BLUR_RADIUS)
+    )
+    output = io.BytesIO()
+    placeholder.save(output, format="JPEG", quality=50)
+    encoded = base64.b64encode(output.getvalue()).decode()
+
+    return {"variants": variants, "placeholder": f"data:image/jpeg;base64,{encoded}"}
+
+
+def _config():
+    return getattr(settings, "IMAGE_VARIANTS", {})
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Spawned, not forked: the server process runs threads and an event loop
+        _executor = ProcessPoolExecutor(
+            max_workers=_config().get("WORKERS", 2),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def generate_variants(data):
+    """render_variants() in the shared process pool (inline if WORKERS is 0)"""
+    if not _config().get("WORKERS", 2):
+        return render_variants(data)
+    return _get_executor().submit(render_variants, data).result()
+
+
+def store_image(file, **options):
+    """
+    Validate an image, render its variants off the request thread and save
+    each through the media storage backend. Returns the full variant's
+    "url" and "public_id", plus "variants" (name -> url, stored name, width,
+    height) and the "placeholder" data URI.
+    """
+    from .media_storage import get_media_storage, validate_media_file
+
+    validate_media_file(file, "image")
+    if hasattr(file, "seek"):
+        file.seek(0)
+    rendered = generate_variants(file.read())
+
+    storage = get_media_storage()
+    variants = {}
+    for name, variant in rendered["variants"].items():
+        stored = storage.save(
+            ContentFile(variant["data"], name=f"{name}.{variant['extension']}"),
+            "image",
+            **options,
+        )
+        if name == "full":
+            full = stored
+        variants[name] = {
+            "url": stored["url"],
+            "name": stored["name"],
+            "width": variant["width"],
+            "height": variant["height"],
+        }
+
+    return {
+        "url": full["url"],
+        "public_id": full["name"],
+        "variants": variants,
+        "placeholder": rendered["placeholder"],
+    }
+
+
+def pick_variant(variants, width=None, height=None):
+    """
+    The smallest stored variant covering width x height (either may be
+    None); the largest if no size is asked for or none covers it. None if
+    the image has no variants.
+    """
+    if not variants:
+        return None
+    by_size = sorted(variants.values(), key=lambda v: v["width"] * v["height"])
+    if not width and not height:
+        return by_size[-1]
+    for variant in by_size:
+        if variant["width"] >= (width or 0) and variant["height"] >= (height or 0):
+            return variant
+    return by_size[-1]
+
+
+@receiver(setting_changed)
+def reset_image_variants(setting, **kwargs):
+    global _executor
+    if setting == "IMAGE_VARIANTS" and _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,97 @@
+import asyncio
+import time
+import uuid
+
+from channels.layers import InMemoryChannelLayer
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from communication.chat_consumer import ChatConsumer
+from communication.fanout import chat_message_event
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark delivering one chat message to every member of a room over "
+        "the in-memory channel layer: the old per-recipient sender lookup and "
+        "JSON encode vs one pre-encoded frame forwarded by each consumer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[2, 10, 50, 200],
+            help="Room sizes (recipients per message) to benchmark",
+        )
+        parser.add_argument(
+            "--messages", type=int, default=200, help="Messages per measurement"
+        )
+
+    def handle(self, *args, **options):
+        sender_id = "1"
+        sender = {"id": sender_id, "username": "bench"}
+        # The old path's lookups hit the cache, never the database
+        cache.set(f"user_info_{sender_id}", sender, 3600)
+        message = {
+            "id": str(uuid.uuid4()),
+            "content": "Shipping the fan-out change today, reviews welcome " * 2,
+            "sender_id": sender_id,
+            "message_type": "text",
+            "image": None,
+            "video": None,
+            "audio": None,
+            "sent_at": timezone.now().isoformat(),
+            "room_id": str(uuid.uuid4()),
+        }
+        events = {
+            "lookup+encode": lambda: {"type": "chat_message", "message": message},
+            "encode": lambda: {
+                "type": "chat_message",
+                "message": dict(message, sender=sender),
+            },
+            "frame": lambda: chat_message_event(dict(message, sender=sender)),
+        }
+
+        self.stdout.write(
+            f"{'members':>8} "
+            + " ".join(f"{name + ' ms':>18}" for name in events)
+            + f" {'speedup':>8}"
+        )
+        for size in options["sizes"]:
+            timings = {
+                name: asyncio.run(self._measure(size, options["messages"], event))
+                for name, event in events.items()
+            }
+            speedup = timings["lookup+encode"] / timings["frame"]
+            self.stdout.write(
+                f"{size:>8} "
+                + " ".join(f"{ms:>18.3f}" for ms in timings.values())
+                + f" {speedup:>7.1f}x"
+            )
+
+    async def _measure(self, size, messages, make_event):
+        """Milliseconds per message to reach all size consumers"""
+        layer = InMemoryChannelLayer(capacity=messages + 1)
+        consumers = []
+        for _ in range(size):
+            consumer = ChatConsumer()
+            consumer.channel_name = await layer.new_channel()
+            consumer.base_send = _discard
+            await layer.group_add("bench", consumer.channel_name)
+            consumers.append(consumer)
+
+        started = time.perf_counter()
+        for _ in range(messages):
+            # Building the event is part of the cost: it is where the new
+            # path encodes the frame
+            await layer.group_send("bench", make_event())
+            for consumer in consumers:
+                await consumer.chat_message(await layer.receive(consumer.channel_name))
+        return (time.perf_counter() - started) * 1000 / messages
+
+
+async def _discard(message):
+    pass
@@ -0,0 +1,163 @@
+import statistics
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from communication.models import IncomingCallNotification, Participant, Room
+from communication.serializers import IncomingCallNotificationSerializer
+from communication.views import IncomingCallNotificationViewSet, RoomViewSet
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ringing a group call: create_room_call and start_call for "
+        "rooms of each size, next to the former one-row-and-one-send-per-"
+        "participant loop. Every participant listens on its user_<id> group "
+        "of the in-memory channel layer. Runs inside a transaction that is "
+        "rolled back, so no benchmark data is left behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10, 100, 1000],
+            help="Participants per room to benchmark",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed calls per measurement"
+        )
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.repeat = options["repeat"]
+        paths = {
+            "per-participant": self._legacy_room_call,
+            "create_room_call": self._create_room_call,
+            "start_call": self._start_call,
+        }
+
+        self.stdout.write(
+            f"{'members':>8} "
+            + " ".join(f"{name + ' ms':>22} {'queries':>7}" for name in paths)
+        )
+        layers = {
+            "default": {
+                "BACKEND": "channels.layers.InMemoryChannelLayer",
+                # Each member gets one event per timed call
+                "CONFIG": {"capacity": len(paths) * self.repeat + 1},
+            }
+        }
+        for size in options["sizes"]:
+            results = []
+            try:
+                with override_settings(CHANNEL_LAYERS=layers), transaction.atomic():
+                    caller, room = self._populate(size)
+                    for path in paths.values():
+                        results.append(self._measure(path, caller, room))
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            self.stdout.write(
+                f"{size:>8} "
+                + " ".join(f"{ms:>22.2f} {queries:>7}" for ms, queries in results)
+            )
+
+    def _populate(self, size):
+        User = get_user_model()
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"bench_call_{i}",
+                    email=f"bench_call_{i}@example.com",
+                    password=password,
+                )
+                for i in range(size + 1)
+            ]
+        )
+        room = Room.objects.create(name="bench group call", room_type="group")
+        Participant.objects.bulk_create(
+            [Participant(user=user, room=room) for user in users]
+        )
+
+        layer = get_channel_layer()
+        for user in users:
+            channel = async_to_sync(layer.new_channel)()
+            async_to_sync(layer.group_add)(f"user_{user.id}", channel)
+        return users[0], room
+
+    def _measure(self, path, caller, room):
+        """Median milliseconds per call, and the queries of one call"""
+        timings = []
+        for _ in range(self.repeat):
+            queries = []
+
+            def count(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            # Not CaptureQueriesContext: its log is capped at 9000 queries
+            with connection.execute_wrapper(count):
+                started = time.perf_counter()
+                path(caller, room)
+                timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), len(queries)
+
+    def _create_room_call(self, caller, room):
+        request = self.factory.post(
+            "/", {"room_id": str(room.id), "call_type": "audio"}, format="json"
+        )
+        force_authenticate(request, user=caller)
+        view = IncomingCallNotificationViewSet.as_view({"post": "create_room_call"})
+        response = view(request)
+        assert response.status_code == 201, response.data
+
+    def _start_call(self, caller, room):
+        request = self.factory.post("/", {"call_type": "video"}, format="json")
+        force_authenticate(request, user=caller)
+        response = RoomViewSet.as_view({"post": "start_call"})(request, pk=room.id)
+        assert response.status_code == 201, response.data
+
+    def _legacy_room_call(self, caller, room):
+        # create_room_call before batching: two queries and a send per member
+        channel_layer = get_channel_layer()
+        expires_at = timezone.now() + timedelta(seconds=60)
+        participants = Participant.objects.filter(room=room).exclude(user=caller)
+        for participant in participants:
+            IncomingCallNotification.objects.filter(
+                caller=caller,
+                recipient=participant.user,
+                room=room,
+                status="pending",
+            ).update(status="expired")
+            notification = IncomingCallNotification.objects.create(
+                caller=caller,
+                recipient=participant.user,
+                room=room,
+                call_type="audio",
+                expires_at=expires_at,
+            )
+            async_to_sync(channel_layer.group_send)(
+                f"user_{notification.recipient.id}",
+                {
+                    "type": "incoming_call",
+                    "notification": IncomingCallNotificationSerializer(
+                        notification
+                    ).data,
+                },
+            )
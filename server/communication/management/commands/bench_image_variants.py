@@ -0,0 +1,78 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from communication.image_variants import render_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark image variant rendering (thumb, medium, full and the blur "
+        "placeholder): images/sec inline and with process pools of each size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=48)
+        parser.add_argument(
+            "--size",
+            nargs=2,
+            type=int,
+            default=[4000, 3000],
+            metavar=("WIDTH", "HEIGHT"),
+            help="Dimensions of the synthetic source photo",
+        )
+        parser.add_argument(
+            "--workers",
+            nargs="+",
+            type=int,
+            default=[0, 1, 2, 4],
+            help="Pool sizes to benchmark; 0 renders inline on this thread",
+        )
+
+    def handle(self, *args, **options):
+        data = self._source_image(*options["size"])
+        count = options["images"]
+        self.stdout.write(
+            f"{count} images of {options['size'][0]}x{options['size'][1]} "
+            f"({len(data) // 1024} KB JPEG), {os.cpu_count()} CPUs"
+        )
+        self.stdout.write(f"{'workers':>8} {'images/s':>10} {'speedup':>8}")
+
+        baseline = None
+        for workers in options["workers"]:
+            rate = self._measure(data, count, workers)
+            baseline = baseline or rate
+            label = workers or "inline"
+            self.stdout.write(f"{label:>8} {rate:>10.2f} {rate / baseline:>7.2f}x")
+
+    def _source_image(self, width, height):
+        # Fractal detail plus sensor-like noise, so JPEG work is realistic
+        image = Image.effect_mandelbrot((width, height), (-2.2, -1.2, 1.0, 1.2), 64)
+        noise = Image.effect_noise((width, height), 24)
+        image = Image.merge("RGB", (image, noise, Image.blend(image, noise, 0.5)))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=90, exif=exif.tobytes())
+        return output.getvalue()
+
+    def _measure(self, data, count, workers):
+        if not workers:
+            start = time.perf_counter()
+            for _ in range(count):
+                render_variants(data)
+            return count / (time.perf_counter() - start)
+
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            # Start every worker before timing
+            list(pool.map(render_variants, [data] * workers))
+            start = time.perf_counter()
+            list(pool.map(render_variants, [data] * count))
+            return count / (time.perf_counter() - start)
@@ -0,0 +1,119 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from communication.models import Message, Participant, Room
+from communication.pagination import MessageCursorPagination
+from communication.views import MessagePagination
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark room history pagination: page-number (OFFSET + COUNT) vs "
+        "keyset cursors on (sent_at, id). Runs inside a transaction that is "
+        "rolled back, so no benchmark data is left behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+            help="Messages per room to benchmark",
+        )
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Timed runs per measurement"
+        )
+        parser.add_argument("--batch-size", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.page_size = options["page_size"]
+        self.repeat = options["repeat"]
+
+        self.stdout.write(
+            f"{'messages':>10} {'depth':>6} {'offset ms':>10} {'cursor ms':>10}"
+        )
+        for size in options["sizes"]:
+            try:
+                with transaction.atomic():
+                    room = self._populate(size, options["batch_size"])
+                    for depth in (0.0, 0.5, 0.99):
+                        offset_ms, cursor_ms = self._measure(room, size, depth)
+                        self.stdout.write(
+                            f"{size:>10} {int(depth * 100):>5}% "
+                            f"{offset_ms:>10.2f} {cursor_ms:>10.2f}"
+                        )
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def _populate(self, size, batch_size):
+        User = get_user_model()
+        user = User.objects.create_user(
+            username="bench_history_user", email="bench_history@example.com"
+        )
+        room = Room.objects.create(name="bench history", room_type="group")
+        Participant.objects.create(user=user, room=room)
+
+        for start in range(0, size, batch_size):
+            count = min(batch_size, size - start)
+            Message.objects.bulk_create(
+                [
+                    Message(room=room, sender=user, content=f"message {start + i}")
+                    for i in range(count)
+                ],
+                batch_size=batch_size,
+            )
+        return room
+
+    def _request(self, params):
+        return Request(self.factory.get("/", params))
+
+    def _queryset(self, room):
+        return (
+            Message.objects.filter(room=room)
+            .select_related("sender", "room")
+            .order_by("-sent_at")
+        )
+
+    def _time(self, fn):
+        samples = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def _measure(self, room, size, depth):
+        offset = int((size - self.page_size) * depth)
+        page_number = offset // self.page_size + 1
+
+        # Locate the cursor row at the same depth (untimed)
+        edge = self._queryset(room).order_by("-sent_at", "-id")[offset : offset + 1]
+        cursor_params = {"page_size": self.page_size, "pagination": "cursor"}
+        if offset:
+            cursor_params["before"] = MessageCursorPagination().encode_cursor(edge[0])
+
+        def offset_page():
+            paginator = MessagePagination()
+            request = self._request({"page": page_number, "page_size": self.page_size})
+            list(paginator.paginate_queryset(self._queryset(room), request))
+
+        def cursor_page():
+            paginator = MessageCursorPagination()
+            request = self._request(cursor_params)
+            paginator.paginate_queryset(self._queryset(room), request)
+
+        return self._time(offset_page), self._time(cursor_page)
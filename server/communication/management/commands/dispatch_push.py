@@ -0,0 +1,49 @@
+import asyncio
+import os
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from communication.push import PushDispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the push notification dispatcher: send queued PushDelivery rows "
+        "to their providers in batches over pooled keep-alive connections, "
+        "retrying failures with backoff and dead-lettering after MAX_ATTEMPTS."
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, "PUSH_NOTIFICATIONS", {})
+        parser.add_argument(
+            "--claim-size",
+            type=int,
+            default=config.get("CLAIM_SIZE", 1000),
+            help="Most deliveries claimed per round",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=config.get("POLL_INTERVAL", 0.25),
+            help="Seconds between polls for new deliveries when idle",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no due deliveries are left instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        dispatcher = PushDispatcher(
+            worker_id,
+            claim_size=options["claim_size"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(f"Push dispatcher {worker_id} running")
+        try:
+            asyncio.run(dispatcher.run(once=options["once"]))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping")
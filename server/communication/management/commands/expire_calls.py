@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from communication.call_expiry import sweep
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the call expiry worker: mark unanswered call notifications and "
+        "invitations past their expires_at as expired, tell both parties over "
+        "their user_<id> groups, and purge long-expired ones."
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, "CALL_EXPIRY", {})
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=config.get("INTERVAL", 2.0),
+            help="Seconds between sweeps",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=config.get("BATCH_SIZE", 500),
+            help="Most rows expired or deleted per transaction",
+        )
+        parser.add_argument("--once", action="store_true", help="Sweep once and exit")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    totals = sweep(batch_size=options["batch_size"])
+                except Exception as e:
+                    self.stderr.write(f"Sweep failed: {str(e)}")
+                else:
+                    if totals["expired"] or totals["purged"]:
+                        self.stdout.write(
+                            f"Expired {totals['expired']}, "
+                            f"purged {totals['purged']} calls"
+                        )
+                if options["once"]:
+                    break
+                elapsed = time.monotonic() - started
+                time.sleep(max(0.0, options["interval"] - elapsed))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping")
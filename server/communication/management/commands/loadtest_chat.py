@@ -0,0 +1,492 @@
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from collections import Counter
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from communication import routing
+from communication.metrics import metrics
+from communication.models import Participant, Room
+
+# Text messages carry their send time after this marker
+MARKER = "loadtest:"
+KINDS = ("text", "typing", "signaling")
+
+
+class Stats:
+    """Frames sent and delivered per kind, and delivery latencies"""
+
+    def __init__(self):
+        self.sent = Counter()
+        self.delivered = Counter()
+        self.latencies = {"text": [], "signaling": []}
+        self.throttled = 0
+        self.errors = 0
+
+    def observe(self, kind, sent_at):
+        self.delivered[kind] += 1
+        self.latencies[kind].append((time.perf_counter() - sent_at) * 1000)
+
+
+class QueryCounter:
+    """execute_wrapper counting the queries of every connection it is on"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+
+class InProcessClient:
+    """A connection to ChatConsumer through channels' test communicator"""
+
+    def __init__(self, application, user, room_id, token=None):
+        self.communicator = WebsocketCommunicator(application, f"/ws/room/{room_id}/")
+        self.communicator.scope["user"] = user
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=60)
+        return connected
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def receive(self):
+        """The next text frame, or None once the server closed the socket"""
+        # Read the queue directly: receive_output() kills the app on timeout
+        message = await self.communicator.output_queue.get()
+        return message.get("text") if message["type"] == "websocket.send" else None
+
+    async def close(self):
+        await self.communicator.disconnect(timeout=10)
+
+
+class DaphneClient:
+    """A real WebSocket connection to a running server, authenticated by token"""
+
+    def __init__(self, base_url, user, room_id, token):
+        self.url = f"{base_url.rstrip('/')}/ws/room/{room_id}/?token={token}"
+        self.socket = None
+
+    async def connect(self):
+        try:
+            from websockets.asyncio.client import connect
+        except ImportError:
+            raise CommandError("--target daphne needs the websockets package")
+        try:
+            self.socket = await connect(self.url, max_queue=None)
+        except OSError:
+            return False
+        return True
+
+    async def send(self, text):
+        await self.socket.send(text)
+
+    async def receive(self):
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            return await self.socket.recv()
+        except ConnectionClosed:
+            return None
+
+    async def close(self):
+        await self.socket.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the chat WebSocket: thousands of simulated users in direct "
+        "and group rooms sending text, typing and WebRTC signaling frames. "
+        "Runs in-process over the in-memory channel layer, or against a "
+        "running Daphne (with Redis) via --target daphne. Reports delivery "
+        "latency percentiles, throughput and DB queries per message, and "
+        "writes them to a JSON report for comparison across commits. Users "
+        "and rooms are created for the run and deleted afterwards. The "
+        "in-memory layer scans every channel on each send, so in-process "
+        "latencies grow with --users much faster than Redis-backed ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target", choices=["inprocess", "daphne"], default="inprocess"
+        )
+        parser.add_argument(
+            "--url", default="ws://localhost:8000", help="Server for --target daphne"
+        )
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--group-size", type=int, default=20)
+        parser.add_argument(
+            "--direct-share",
+            type=float,
+            default=0.5,
+            help="Share of users paired into direct rooms; the rest join groups",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds of traffic"
+        )
+        parser.add_argument(
+            "--rate", type=float, default=0.5, help="Frames per user per second"
+        )
+        parser.add_argument(
+            "--mix",
+            default="text=0.6,typing=0.3,signaling=0.1",
+            help="Relative weights of the frame kinds",
+        )
+        parser.add_argument(
+            "--drain",
+            type=float,
+            default=60,
+            help="Longest wait for deliveries after the last send, in seconds",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="loadtest_report.json")
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the generated users and rooms"
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        try:
+            mix = {
+                kind: float(weight)
+                for kind, weight in (
+                    part.split("=") for part in options["mix"].split(",")
+                )
+            }
+        except ValueError:
+            raise CommandError("--mix takes kind=weight pairs separated by commas")
+        if set(mix) - set(KINDS):
+            raise CommandError(f"--mix kinds must be among {', '.join(KINDS)}")
+        self.mix = mix
+
+        prefix = f"lt{uuid.uuid4().hex[:8]}_"
+        connections = self._create_fixtures(prefix)
+        try:
+            if options["target"] == "inprocess":
+                layers = {
+                    "default": {
+                        "BACKEND": "channels.layers.InMemoryChannelLayer",
+                        "CONFIG": {"capacity": 10_000},
+                    }
+                }
+                with override_settings(CHANNEL_LAYERS=layers):
+                    report = asyncio.run(self._run(connections))
+            else:
+                report = asyncio.run(self._run(connections))
+        finally:
+            if not options["keep"]:
+                Room.objects.filter(name__startswith=prefix).delete()
+                get_user_model().objects.filter(username__startswith=prefix).delete()
+
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+        self._print(report)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def _create_fixtures(self, prefix):
+        """(user, room_id, token key) per connection, one per simulated user"""
+        User = get_user_model()
+        count = self.options["users"]
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f"{prefix}{i}",
+                    email=f"{prefix}{i}@loadtest.invalid",
+                    password=password,
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+        users = list(User.objects.filter(username__startswith=prefix).order_by("id"))
+        tokens = {}
+        if self.options["target"] == "daphne":
+            created = [Token(user=user, key=Token.generate_key()) for user in users]
+            Token.objects.bulk_create(created, batch_size=1000)
+            tokens = {token.user_id: token.key for token in created}
+
+        direct = int(count * self.options["direct_share"]) // 2 * 2
+        group_size = max(2, self.options["group_size"])
+        memberships = [users[i : i + 2] for i in range(0, direct, 2)]
+        memberships += [
+            users[i : i + group_size] for i in range(direct, count, group_size)
+        ]
+
+        rooms = [
+            Room(
+                name=f"{prefix}{index}",
+                room_type="direct" if index < direct // 2 else "group",
+                max_participants=max(len(members), 10),
+            )
+            for index, members in enumerate(memberships)
+        ]
+        Room.objects.bulk_create(rooms, batch_size=1000)
+        Participant.objects.bulk_create(
+            [
+                Participant(room=room, user=user)
+                for room, members in zip(rooms, memberships)
+                for user in members
+            ],
+            batch_size=1000,
+        )
+        self.rooms = Counter(room.room_type for room in rooms)
+        return [
+            (user, str(room.id), tokens.get(user.pk))
+            for room, members in zip(rooms, memberships)
+            for user in members
+        ]
+
+    async def _run(self, connections):
+        options = self.options
+        stats = Stats()
+        queries = QueryCounter()
+        metrics.reset()
+        self.started_at = timezone.now()
+        if options["target"] == "inprocess":
+            application = URLRouter(routing.websocket_urlpatterns)
+            clients = [
+                InProcessClient(application, *connection) for connection in connections
+            ]
+            # Consumers query from the sync thread, whose connection opens later
+            connection_created.connect(queries.install)
+        else:
+            clients = [
+                DaphneClient(options["url"], *connection) for connection in connections
+            ]
+
+        try:
+            started = time.perf_counter()
+            connected = await asyncio.gather(*(client.connect() for client in clients))
+            connect_seconds = time.perf_counter() - started
+            live = [client for client, ok in zip(clients, connected) if ok]
+            readers = [
+                asyncio.create_task(self._read(client, stats)) for client in live
+            ]
+
+            rng = random.Random(options["seed"])
+            kinds = list(self.mix)
+            weights = [self.mix[kind] for kind in kinds]
+            queries_before = queries.count
+            started = time.perf_counter()
+            deadline = started + options["duration"]
+            await asyncio.gather(
+                *(
+                    self._drive(client, stats, deadline, rng.random(), kinds, weights)
+                    for client in live
+                )
+            )
+            send_seconds = time.perf_counter() - started
+            await self._drain(stats)
+            elapsed = time.perf_counter() - started
+            traffic_queries = queries.count - queries_before
+
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            await asyncio.gather(
+                *(client.close() for client in live), return_exceptions=True
+            )
+        finally:
+            connection_created.disconnect(queries.install)
+
+        return self._report(
+            stats,
+            len(clients),
+            len(live),
+            connect_seconds,
+            send_seconds,
+            elapsed,
+            traffic_queries if options["target"] == "inprocess" else None,
+        )
+
+    async def _drain(self, stats):
+        """Wait until deliveries stall for 3 seconds, at most --drain seconds"""
+        give_up = time.perf_counter() + self.options["drain"]
+        delivered = -1
+        while time.perf_counter() < give_up:
+            if sum(stats.delivered.values()) == delivered:
+                return
+            delivered = sum(stats.delivered.values())
+            await asyncio.sleep(3)
+
+    async def _drive(self, client, stats, deadline, seed, kinds, weights):
+        """Send frames at random intervals averaging --rate per second"""
+        rng = random.Random(seed)
+        while True:
+            delay = rng.expovariate(self.options["rate"])
+            if time.perf_counter() + delay >= deadline:
+                return
+            await asyncio.sleep(delay)
+            kind = rng.choices(kinds, weights)[0]
+            sent_at = time.perf_counter()
+            if kind == "text":
+                frame = {"type": "text_message", "content": f"{MARKER}{sent_at!r}"}
+            elif kind == "typing":
+                frame = {"type": "typing", "is_typing": True}
+            else:
+                frame = {
+                    "type": "ice_candidate",
+                    "candidate": {
+                        "candidate": (
+                            "candidate:1 1 UDP 2122252543 192.0.2.1 54400 typ host"
+                        ),
+                        "sdpMid": "0",
+                        "sdpMLineIndex": 0,
+                        "sent_at": sent_at,
+                    },
+                }
+            await client.send(json.dumps(frame))
+            stats.sent[kind] += 1
+
+    async def _read(self, client, stats):
+        while True:
+            text = await client.receive()
+            if text is None:
+                return
+            frame = json.loads(text)
+            frame_type = frame.get("type")
+            if frame_type == "chat_message":
+                content = frame["message"].get("content") or ""
+                if content.startswith(MARKER):
+                    stats.observe("text", float(content[len(MARKER) :]))
+            elif frame_type == "ice_candidate":
+                sent_at = frame.get("candidate", {}).get("sent_at")
+                if sent_at is not None:
+                    stats.observe("signaling", sent_at)
+            elif frame_type == "typing_users":
+                stats.delivered["typing"] += 1
+            elif frame_type == "error":
+                if frame.get("code") == "rate_limited":
+                    stats.throttled += 1
+                else:
+                    stats.errors += 1
+
+    def _report(
+        self, stats, clients, live, connect_seconds, send_seconds, elapsed, queries
+    ):
+        options = self.options
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except OSError:
+            commit = ""
+        text_sent = stats.sent["text"]
+        return {
+            "run": {
+                "commit": commit or None,
+                "started_at": self.started_at.isoformat(),
+                "target": options["target"],
+                "users": options["users"],
+                "rooms": dict(self.rooms),
+                "group_size": options["group_size"],
+                "duration_seconds": options["duration"],
+                "rate_per_user": options["rate"],
+                "mix": self.mix,
+            },
+            "connections": {
+                "opened": live,
+                "failed": clients - live,
+                "seconds": round(connect_seconds, 3),
+            },
+            "sent": dict(stats.sent),
+            "delivered": dict(stats.delivered),
+            "throttled": stats.throttled,
+            "errors": stats.errors,
+            "latency_ms": {
+                kind: _percentiles(latencies)
+                for kind, latencies in stats.latencies.items()
+            },
+            "throughput": {
+                "messages_per_sec": round(text_sent / send_seconds, 2),
+                "frames_sent_per_sec": round(
+                    sum(stats.sent.values()) / send_seconds, 2
+                ),
+                "frames_delivered_per_sec": round(
+                    sum(stats.delivered.values()) / elapsed, 2
+                ),
+            },
+            "db": {
+                "queries": queries,
+                "queries_per_message": (
+                    round(queries / text_sent, 2)
+                    if queries is not None and text_sent
+                    else None
+                ),
+            },
+            "metrics": metrics.snapshot(),
+        }
+
+    def _print(self, report):
+        self.stdout.write(
+            f"{report['connections']['opened']} connections "
+            f"({report['connections']['failed']} failed) "
+            f"in {report['connections']['seconds']}s"
+        )
+        self.stdout.write(
+            f"{'kind':>10} {'sent':>8} {'delivered':>10} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for kind in KINDS:
+            latency = report["latency_ms"].get(kind) or {}
+            self.stdout.write(
+                f"{kind:>10} {report['sent'].get(kind, 0):>8} "
+                f"{report['delivered'].get(kind, 0):>10} "
+                + " ".join(
+                    f"{latency[p]:>8.2f}" if latency.get(p) is not None else f"{'-':>8}"
+                    for p in ("p50", "p95", "p99")
+                )
+            )
+        throughput = report["throughput"]
+        self.stdout.write(
+            f"{throughput['messages_per_sec']} messages/s, "
+            f"{throughput['frames_delivered_per_sec']} frames delivered/s, "
+            f"{report['throttled']} throttled, {report['errors']} errors"
+        )
+        if report["db"]["queries_per_message"] is not None:
+            self.stdout.write(
+                f"{report['db']['queries_per_message']} DB queries per message"
+            )
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    if len(samples) == 1:
+        cuts = samples * 99
+    else:
+        cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "count": len(samples),
+        "p50": round(cuts[49], 3),
+        "p95": round(cuts[94], 3),
+        "p99": round(cuts[98], 3),
+        "max": round(max(samples), 3),
+    }
@@ -0,0 +1,111 @@
+import os
+import socket
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from communication.media_jobs import claim_jobs, process_job, purge_finished
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the media job worker: upload staged media for messages in the "
+        "'processing' state and broadcast the finished messages. While "
+        "idle, delete finished jobs older than PURGE_AFTER_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, "MEDIA_JOBS", {})
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=config.get("WORKERS", 4),
+            help="Uploads to run concurrently",
+        )
+        parser.add_argument(
+            "--pool",
+            choices=["thread", "process"],
+            default=config.get("POOL", "thread"),
+            help="Run uploads in a thread pool (I/O bound) or a process pool",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=config.get("POLL_INTERVAL", 1.0),
+            help="Seconds between polls for new jobs when idle",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no due jobs are left instead of polling forever",
+        )
+
+    def purge(self):
+        """
+        Delete one batch of old finished jobs, at most once per
+        PURGE_INTERVAL unless the last batch was full; the number deleted
+        """
+        config = getattr(settings, "MEDIA_JOBS", {})
+        batch_size = config.get("PURGE_BATCH_SIZE", 1000)
+        now = time.monotonic()
+        if now < self.next_purge:
+            return 0
+        older_than = timezone.now() - timedelta(
+            days=config.get("PURGE_AFTER_DAYS", 7)
+        )
+        purged = purge_finished(older_than, batch_size)
+        if purged < batch_size:
+            self.next_purge = now + config.get("PURGE_INTERVAL", 60)
+        return purged
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        use_processes = options["pool"] == "process"
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+        self.stdout.write(
+            f"Media worker {worker_id} running {workers} {options['pool']} workers"
+        )
+        inflight = set()
+        self.next_purge = 0.0
+        with executor_class(max_workers=workers) as executor:
+            try:
+                while True:
+                    job_ids = claim_jobs(worker_id, workers - len(inflight))
+                    if use_processes:
+                        # Forked workers must not inherit open DB connections
+                        connections.close_all()
+                    for job_id in job_ids:
+                        inflight.add(executor.submit(process_job, job_id))
+
+                    if not inflight:
+                        if self.purge():
+                            continue
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll_interval"])
+                        continue
+
+                    done, inflight = wait(
+                        inflight,
+                        timeout=options["poll_interval"],
+                        return_when=FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        try:
+                            self.stdout.write(f"Job finished: {future.result()}")
+                        except Exception as e:
+                            self.stderr.write(f"Job crashed: {str(e)}")
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping; waiting for running uploads")
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from communication.models import SyncEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sync events older than SYNC['RETENTION_DAYS']. Clients whose "
+        "token predates the oldest remaining event get 410 and refetch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "SYNC", {}).get("RETENTION_DAYS", 30),
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        deleted = 0
+        while True:
+            # Bounded batches keep each delete transaction short
+            ids = list(
+                SyncEvent.objects.filter(created_at__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            deleted += SyncEvent.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} sync events older than {cutoff}")
@@ -0,0 +1,232 @@
+import logging
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .fanout import message_update_event
+from .media_storage import media_url
+from .models import MediaJob, Message
+
+logger = logging.getLogger(__name__)
+
+
+class MediaJobError(Exception):
+    pass
+
+
+def _config():
+    return getattr(settings, "MEDIA_JOBS", {})
+
+
+def enabled():
+    return _config().get("ENABLED", False)
+
+
+def staging_dir():
+    """Directory for files waiting to be uploaded (shared with the workers)"""
+    path = _config().get("STAGING_DIR") or os.path.join(
+        tempfile.gettempdir(), "media_jobs"
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Message.content while processing, matching what the inline handlers store
+PLACEHOLDER_CONTENT = {"video": "", "audio": "Audio Message"}
+
+
+def queue_media_message(room_id, sender, media_type, media_file, caption=""):
+    """
+    Stage media_file on disk and create its "processing" Message and
+    MediaJob together. Returns the message; the upload happens later.
+    """
+    ext = os.path.splitext(media_file.name or "")[1].lower()
+    staged_path = os.path.join(staging_dir(), f"{uuid.uuid4().hex}{ext}")
+    with open(staged_path, "wb") as staged:
+        for chunk in media_file.chunks():
+            staged.write(chunk)
+
+    try:
+        with transaction.atomic():
+            message = Message.objects.create(
+                room_id=room_id,
+                sender=sender,
+                content=PLACEHOLDER_CONTENT.get(media_type, caption),
+                message_type=media_type,
+                status="processing",
+            )
+            MediaJob.objects.create(
+                message=message, media_type=media_type, staged_path=staged_path
+            )
+    except Exception:
+        os.remove(staged_path)
+        raise
+    return message
+
+
+def message_payload(message):
+    """The chat_message/message_update payload for a message"""
+    return {
+        "id": str(message.id),
+        "content": message.content,
+        "sender_id": str(message.sender_id),
+        "sender": {
+            "id": str(message.sender_id),
+            "username": message.sender.username,
+        },
+        "message_type": message.message_type,
+        "image": media_url(message.image),
+        "video": media_url(message.video),
+        "audio": media_url(message.audio),
+        "image_variants": message.image_variants,
+        "image_placeholder": message.image_placeholder,
+        "sent_at": message.sent_at.isoformat(),
+        "room_id": str(message.room_id),
+        "status": message.status,
+    }
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Claim up to limit due jobs for this worker. Jobs left "running" past
+    the lease (a worker died mid-upload) are claimed again. Each claim is a
+    conditional UPDATE, so concurrent workers never share a job.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    lease = timedelta(seconds=_config().get("LEASE_SECONDS", 300))
+    due = Q(status="pending", available_at__lte=now) | Q(
+        status="running", locked_at__lt=now - lease
+    )
+
+    candidates = (
+        MediaJob.objects.filter(due)
+        .order_by("available_at")
+        .values_list("id", flat=True)[: limit * 2]
+    )
+
+    claimed = []
+    for job_id in candidates:
+        updated = MediaJob.objects.filter(due, pk=job_id).update(
+            status="running",
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if updated:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def purge_finished(older_than, batch_size):
+    """
+    Delete up to batch_size done or failed jobs last due before older_than;
+    the number deleted. Their messages are kept.
+    """
+    ids = list(
+        MediaJob.objects.filter(
+            status__in=("done", "failed"), available_at__lt=older_than
+        )
+        .order_by("available_at")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    MediaJob.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def _upload(media_type, media_file):
+    """Run the media uploader and map its result onto Message fields"""
+    from .utils import MediaProcessor
+
+    if media_type == "image":
+        result = MediaProcessor.upload_image(media_file)
+        return result and {
+            "image": result["url"],
+            "image_variants": result["variants"],
+            "image_placeholder": result["placeholder"],
+        }
+    if media_type == "video":
+        result = MediaProcessor.upload_video(media_file)
+        return result and {
+            "video": result["video_url"],
+            "content": result.get("thumbnail_url") or "",
+        }
+    if media_type == "audio":
+        result = MediaProcessor.upload_audio(media_file)
+        return result and {"audio": result}
+    raise MediaJobError(f"Unsupported media type: {media_type}")
+
+
+def _discard_staged(job):
+    try:
+        os.remove(job.staged_path)
+    except FileNotFoundError:
+        pass
+
+
+def process_job(job_id):
+    """
+    Upload one claimed job's file and patch its message. Failures are
+    retried with exponential backoff up to MAX_ATTEMPTS, after which the
+    message is marked "failed". Either outcome is broadcast to the room.
+    """
+    try:
+        job = MediaJob.objects.select_related("message__sender").get(pk=job_id)
+        message = job.message
+        try:
+            with open(job.staged_path, "rb") as staged:
+                fields = _upload(
+                    job.media_type,
+                    File(staged, name=os.path.basename(job.staged_path)),
+                )
+            if not fields:
+                raise MediaJobError(f"Failed to upload {job.media_type}")
+        except Exception as e:
+            logger.error(f"Media job {job.id} attempt {job.attempts} failed: {str(e)}")
+            job.last_error = str(e)
+            if job.attempts < _config().get("MAX_ATTEMPTS", 3):
+                job.status = "pending"
+                job.available_at = timezone.now() + timedelta(
+                    seconds=_config().get("RETRY_DELAY_SECONDS", 5)
+                    * 2 ** (job.attempts - 1)
+                )
+                job.save(update_fields=["status", "available_at", "last_error"])
+                return job.status
+
+            job.status = "failed"
+            fields = {}
+            message.status = "failed"
+        else:
+            job.status = "done"
+            message.status = "sent"
+
+        for name, value in fields.items():
+            setattr(message, name, value)
+        with transaction.atomic():
+            message.save(update_fields=["status", *fields])
+            job.save(update_fields=["status", "last_error"])
+        _discard_staged(job)
+
+        async_to_sync(get_channel_layer().group_send)(
+            f"room_{message.room_id}",
+            message_update_event(message_payload(message)),
+        )
+        return job.status
+    finally:
+        close_old_connections()
+
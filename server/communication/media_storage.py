@@ -0,0 +1,309 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Read size used while hashing and copying an upload to the local store
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def validate_media_file(file, media_type):
+    """
+    Validate file size and type; returns the extension
+    """
+    # Check file size
+    if hasattr(file, "size") and file.size > settings.MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE/1024/1024}MB"
+        )
+
+    # Check file extension
+    if hasattr(file, "name"):
+        ext = os.path.splitext(file.name)[1].lower().replace(".", "")
+        allowed_extensions = settings.ALLOWED_UPLOAD_EXTENSIONS.get(media_type, [])
+
+        if ext not in allowed_extensions:
+            raise ValidationError(
+                f"File extension '{ext}' not allowed. Allowed extensions: {', '.join(allowed_extensions)}"
+            )
+
+        return ext
+    return None
+
+
+class MediaStorage:
+    """
+    Where uploaded media lives. save() returns a dict with the stored
+    "name" (what delete() takes), the public "url" and, for videos, a
+    "thumbnail_url" when the backend can make one.
+    """
+
+    def save(self, file, media_type, **options):
+        raise NotImplementedError
+
+    def url(self, name, **transformation):
+        raise NotImplementedError
+
+    def delete(self, name, resource_type="image"):
+        raise NotImplementedError
+
+    def owns(self, name):
+        """True if name (a stored name or URL) belongs to this backend"""
+        raise NotImplementedError
+
+
+class CloudinaryMediaStorage(MediaStorage):
+    """Media on Cloudinary, uploaded through CloudinaryHelper"""
+
+    def save(self, file, media_type, **options):
+        from .utils import CloudinaryHelper
+
+        if media_type == "image":
+            result = CloudinaryHelper.upload_image(file, **options)
+            return {"name": result["public_id"], "url": result["url"]}
+        if media_type == "video":
+            result = CloudinaryHelper.upload_video(file, **options)
+            return result and {
+                "name": result["public_id"],
+                "url": result["video_url"],
+                "thumbnail_url": result["thumbnail_url"],
+            }
+        if media_type == "audio":
+            url = CloudinaryHelper.upload_audio(file, **options)
+        else:
+            url = CloudinaryHelper.upload_document(file, **options)
+        return url and {"name": url, "url": url}
+
+    def url(self, name, **transformation):
+        from .utils import CloudinaryHelper
+
+        if _is_absolute_url(name):
+            return name
+        return CloudinaryHelper.generate_transformation_url(name, **transformation)
+
+    def delete(self, name, resource_type="image"):
+        from .utils import CloudinaryHelper
+
+        # Only public ids can be destroyed; plain delivery URLs are left alone
+        if _is_absolute_url(name):
+            return False
+        return CloudinaryHelper.delete_resource(name, resource_type=resource_type)
+
+    def owns(self, name):
+        return True
+
+
+class LocalMediaStorage(MediaStorage):
+    """
+    Content-addressed media on the local filesystem. Files are stored once
+    per SHA-256 under LOCATION/blobs/ and reference counted in MediaBlob, so
+    re-sending a file only bumps a counter, and the blob is removed when the
+    last reference is deleted. Works offline, for development and benchmarks.
+    """
+
+    prefix = "blobs/"
+
+    def __init__(self, location, base_url):
+        self.location = str(location)
+        self.base_url = base_url
+
+    def _name(self, value):
+        """The stored name for one of our names or URLs, else None"""
+        value = str(value)
+        if value.startswith(self.base_url):
+            value = value[len(self.base_url) :]
+        return value if value.startswith(self.prefix) else None
+
+    def _path(self, name):
+        return os.path.join(self.location, *name.split("/"))
+
+    def owns(self, name):
+        return self._name(name) is not None
+
+    def url(self, name, **transformation):
+        return f"{self.base_url}{self._name(name)}"
+
+    def save(self, file, media_type, **options):
+        validate_media_file(file, media_type)
+        extension = os.path.splitext(getattr(file, "name", None) or "")[1].lower()
+        os.makedirs(self.location, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.location, prefix=".upload-")
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as temp:
+                for chunk in _read_chunks(file):
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+
+            sha256 = digest.hexdigest()
+            extension = self._add_reference(sha256, extension[:10], size)
+            name = f"{self.prefix}{sha256[:2]}/{sha256}{extension}"
+
+            # Put the file in place after the reference is committed, so a
+            # concurrent delete of the last old reference cannot lose it
+            path = self._path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return {"name": name, "url": self.url(name)}
+
+    def _add_reference(self, sha256, extension, size):
+        """Count a reference to a blob; returns the extension it is stored under"""
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            if MediaBlob.objects.filter(pk=sha256).update(
+                ref_count=F("ref_count") + 1
+            ):
+                metrics.counter("media_storage.dedup_hits").inc()
+                metrics.counter("media_storage.dedup_bytes").inc(size)
+                return MediaBlob.objects.values_list("extension", flat=True).get(
+                    pk=sha256
+                )
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(
+                        sha256=sha256, extension=extension, size=size
+                    )
+            except IntegrityError:
+                # Another upload of the same content created it first
+                return self._add_reference(sha256, extension, size)
+        return extension
+
+    def delete(self, name, resource_type="image"):
+        from .models import MediaBlob
+
+        name = self._name(name)
+        if name is None:
+            return False
+        sha256 = os.path.splitext(os.path.basename(name))[0]
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(pk=sha256).first()
+            if blob is None:
+                return False
+            if blob.ref_count > 1:
+                MediaBlob.objects.filter(pk=sha256).update(
+                    ref_count=F("ref_count") - 1
+                )
+                return True
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                logger.error(f"Media blob {name} was already missing")
+            blob.delete()
+        return True
+
+
+def _stored_name(value):
+    """The string a media value was saved as (CloudinaryField splits off the format)"""
+    if hasattr(value, "public_id"):
+        return f"{value.public_id}.{value.format}" if value.format else value.public_id
+    return str(value)
+
+
+def _is_absolute_url(name):
+    return str(name).startswith(("http://", "https://"))
+
+
+def _read_chunks(file):
+    if hasattr(file, "chunks"):
+        yield from file.chunks(COPY_CHUNK_SIZE)
+        return
+    if hasattr(file, "seek"):
+        file.seek(0)
+    while chunk := file.read(COPY_CHUNK_SIZE):
+        yield chunk
+
+
+_storages = None
+
+
+def _get_storages():
+    global _storages
+    if _storages is None:
+        config = getattr(settings, "MEDIA_STORAGE", {})
+        _storages = {
+            "local": LocalMediaStorage(
+                config.get("LOCATION") or settings.MEDIA_ROOT,
+                config.get("BASE_URL", settings.MEDIA_URL),
+            ),
+            "cloudinary": CloudinaryMediaStorage(),
+        }
+    return _storages
+
+
+def get_media_storage():
+    """The backend new uploads go to: MEDIA_STORAGE["BACKEND"]"""
+    backend = getattr(settings, "MEDIA_STORAGE", {}).get("BACKEND", "cloudinary")
+    return _get_storages()[backend]
+
+
+def storage_for(value):
+    """The backend holding a stored name or URL, whichever is configured now"""
+    storages = _get_storages()
+    if storages["local"].owns(_stored_name(value)):
+        return storages["local"]
+    return storages["cloudinary"]
+
+
+def media_url(value, **transformation):
+    """
+    Public URL for a stored media value: a local blob name, a Cloudinary
+    public id or resource, or an already absolute URL.
+    """
+    if not value:
+        return None
+    name = _stored_name(value)
+    if _is_absolute_url(name):
+        return name
+    transformation = {k: v for k, v in transformation.items() if v is not None}
+    storage = storage_for(value)
+    if storage is _get_storages()["cloudinary"] and hasattr(value, "build_url"):
+        # CloudinaryField values know their version and format
+        return value.build_url(**transformation) if transformation else value.url
+    return storage.url(name, **transformation)
+
+
+def release_media(value, resource_type="image"):
+    """Drop one reference to a stored media value"""
+    if not value:
+        return False
+    try:
+        return storage_for(value).delete(
+            _stored_name(value), resource_type=resource_type
+        )
+    except Exception as e:
+        logger.error(f"Failed to release media {value}: {str(e)}")
+        return False
+
+
+def release_image_variants(variants):
+    """Release the generated sizes other than "full" (stored as the image itself)"""
+    for name, variant in (variants or {}).items():
+        if name != "full":
+            release_media(variant.get("name") or variant["url"])
+
+
+@receiver(setting_changed)
+def reset_media_storage(setting, **kwargs):
+    global _storages
+    if setting in ("MEDIA_STORAGE", "MEDIA_ROOT", "MEDIA_URL"):
+        _storages = None
@@ -0,0 +1,140 @@
+import uuid
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from authen.token_cache import LocalLRU
+
+from .metrics import metrics
+from .models import Participant
+
+
+class MembershipCache:
+    """
+    Room id -> frozenset of the user ids participating in it, looked up in
+    a small in-process LRU, then the shared Django cache, then the database.
+    Works for any participant model with room_id and user_id columns (the
+    chat rooms' Participant by default, or webcall's).
+
+    Entries are dropped from this process's LRU and the shared cache when a
+    participant is saved or deleted (see communication.signals). Other
+    processes may keep their LRU copy for up to LOCAL_TIMEOUT seconds, so
+    keep it short; CACHE should name a cache shared by all workers.
+    """
+
+    key_prefix = "communication:members:"
+
+    def __init__(
+        self, cache_alias="default", timeout=300, local_size=10000, local_timeout=5
+    ):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.local = LocalLRU(local_size, local_timeout)
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _cache_key(self, room_id, model):
+        return f"{self.key_prefix}{model._meta.label_lower}:{room_id}"
+
+    def _room_id(self, room_id):
+        try:
+            return str(uuid.UUID(str(room_id)))
+        except ValueError:
+            return None
+
+    def peek(self, room_id, model=Participant):
+        """The room's members if they are in this process's LRU; never does I/O"""
+        room_id = self._room_id(room_id)
+        if room_id is None:
+            return frozenset()
+        return self.local.get(self._cache_key(room_id, model))
+
+    def members(self, room_id, model=Participant):
+        """User ids of the room's participants (empty for unknown rooms)"""
+        room_id = self._room_id(room_id)
+        if room_id is None:
+            return frozenset()
+        cache_key = self._cache_key(room_id, model)
+        members = self.local.get(cache_key)
+        if members is not None:
+            return members
+
+        members = self.cache.get(cache_key)
+        if members is None:
+            metrics.counter("membership.misses").inc()
+            members = frozenset(
+                model.objects.filter(room_id=room_id).values_list("user_id", flat=True)
+            )
+            self.cache.set(cache_key, members, self.timeout)
+        self.local.set(cache_key, members)
+        return members
+
+    def invalidate(self, room_id, model=Participant):
+        room_id = self._room_id(room_id)
+        if room_id is None:
+            return
+        cache_key = self._cache_key(room_id, model)
+        self.local.delete(cache_key)
+        self.cache.delete(cache_key)
+
+    def clear(self):
+        """Forget this process's entries (the shared cache expires on its own)"""
+        self.local.clear()
+
+
+_membership_cache = None
+
+
+def get_membership_cache():
+    global _membership_cache
+    if _membership_cache is None:
+        config = getattr(settings, "MEMBERSHIP_CACHE", {})
+        _membership_cache = MembershipCache(
+            cache_alias=config.get("CACHE", "default"),
+            timeout=config.get("TIMEOUT", 300),
+            local_size=config.get("LOCAL_SIZE", 10000),
+            local_timeout=config.get("LOCAL_TIMEOUT", 5),
+        )
+    return _membership_cache
+
+
+@receiver(setting_changed)
+def reset_membership_cache(setting, **kwargs):
+    global _membership_cache
+    if setting in ("MEMBERSHIP_CACHE", "CACHES"):
+        _membership_cache = None
+
+
+def room_members(room_id, model=Participant):
+    """User ids of everyone in a room, usually without a query"""
+    return get_membership_cache().members(room_id, model)
+
+
+def is_room_member(user, room_id, model=Participant):
+    """True if user participates in the room"""
+    return user.pk in room_members(room_id, model)
+
+
+async def is_room_member_async(user, room_id, model=Participant):
+    """is_room_member for consumers; no thread hop when the LRU has the room"""
+    members = get_membership_cache().peek(room_id, model)
+    if members is None:
+        members = await database_sync_to_async(room_members)(room_id, model)
+    return user.pk in members
+
+
+def invalidate_room_members(room_id, model=Participant):
+    """
+    Drop a room's members after a participant was added or removed: now,
+    and again on commit, so a reader that refilled the cache from the old
+    rows in the meantime doesn't keep them
+    """
+    cache = get_membership_cache()
+    cache.invalidate(room_id, model)
+    transaction.on_commit(lambda: cache.invalidate(room_id, model))
@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Summary:
+    """Running count/sum/max/last of an observed value (batch sizes, lag, ...)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.last = value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg": self.total / self.count if self.count else 0.0,
+                "max": self.max,
+                "last": self.last,
+            }
+
+
+class MetricsRegistry:
+    """
+    In-process metrics for the communication app. Each worker process keeps
+    its own numbers; they are exposed to staff through MetricsView.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self.started_at = time.time()
+
+    def _get(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def summary(self, name):
+        return self._get(name, Summary)
+
+    def snapshot(self):
+        with self._lock:
+            items = list(self._metrics.items())
+        return {name: metric.snapshot() for name, metric in sorted(items)}
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+metrics = MetricsRegistry()
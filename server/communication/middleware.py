@@ -3,8 +3,11 @@ import cloudinary
 from django.conf import settings
 import logging
 import hmac
+from urllib.parse import parse_qs
 from django.utils.crypto import constant_time_compare
 
+from .connect_tickets import redeem_ticket
+
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -66,6 +69,32 @@ class WebSocketAuthMiddleware:
         return await self.app(scope, receive, send)
 
 
+class ConnectTicketAuthMiddleware:
+    """
+    Authenticates a WebSocket from a signed, single-use ?ticket= (see
+    connect_tickets), with one cache write and no database lookup. A
+    ticket already used is rejected. The ticket's rooms are put in
+    scope["ticket_rooms"] so consumers can skip their participant check.
+    Connections without a valid ticket keep the user set by the middleware
+    around this one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            query = parse_qs(scope.get("query_string", b"").decode())
+            if "ticket" in query:
+                ticket = await redeem_ticket(query["ticket"][0])
+                if ticket is not None:
+                    scope = dict(
+                        scope, user=ticket.get_user(), ticket_rooms=ticket.room_ids
+                    )
+
+        return await self.app(scope, receive, send)
+
+
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from authen.authentication import BearerTokenAuthentication
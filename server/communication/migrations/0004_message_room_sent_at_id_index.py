@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:29
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0003_mediafile_file_extension_mediafile_size_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncomingCallNotification',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('call_type', models.CharField(choices=[('audio', 'Audio Call'), ('video', 'Video Call')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('seen', 'Seen'), ('accepted', 'Accepted'), ('declined', 'Declined'), ('missed', 'Missed'), ('expired', 'Expired')], default='pending', max_length=20)),
+                ('device_token', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'sent_at', 'id'], name='comm_msg_room_sent_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='incomingcallnotification',
+            name='caller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_call_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='incomingcallnotification',
+            name='recipient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_call_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='incomingcallnotification',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='communication.room'),
+        ),
+    ]
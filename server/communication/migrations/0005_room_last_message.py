@@ -0,0 +1,44 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_last_message(apps, schema_editor):
+    Room = apps.get_model('communication', 'Room')
+    Message = apps.get_model('communication', 'Message')
+
+    for room in Room.objects.all().iterator():
+        latest = (
+            Message.objects.filter(room=room).order_by('-sent_at', '-id').first()
+        )
+        Room.objects.filter(pk=room.pk).update(
+            last_message=latest,
+            last_activity_at=latest.sent_at if latest else room.created_at,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0004_message_room_sent_at_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='communication.message'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='comm_room_activity_idx'),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    Participant = apps.get_model('communication', 'Participant')
+    Message = apps.get_model('communication', 'Message')
+
+    for participant in Participant.objects.all().iterator():
+        latest_read = (
+            Message.objects.filter(
+                room_id=participant.room_id, read_by=participant.user_id
+            )
+            .order_by('-sent_at', '-id')
+            .first()
+        )
+        if latest_read:
+            Participant.objects.filter(pk=participant.pk).update(
+                last_read_message=latest_read, last_read_at=latest_read.sent_at
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0005_room_last_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='communication.message'),
+        ),
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='read_by',
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_direct_room_keys(apps, schema_editor):
+    Room = apps.get_model('communication', 'Room')
+    Participant = apps.get_model('communication', 'Participant')
+    DirectRoomKey = apps.get_model('communication', 'DirectRoomKey')
+
+    # Most recently active first, so that when racy creation left several
+    # rooms for one pair, the key points at the conversation in use
+    rooms = Room.objects.filter(room_type='direct').order_by('-last_activity_at', '-id')
+    keyed_pairs = set()
+    for room in rooms.iterator():
+        user_ids = sorted(
+            set(
+                Participant.objects.filter(room=room).values_list('user_id', flat=True)
+            )
+        )
+        if not user_ids or len(user_ids) > 2:
+            continue
+        pair = (user_ids[0], user_ids[-1])
+        if pair in keyed_pairs:
+            continue
+        keyed_pairs.add(pair)
+        DirectRoomKey.objects.create(
+            user_low_id=pair[0], user_high_id=pair[1], room=room
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0007_message_sent_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectRoomKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='direct_key', to='communication.room')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='comm_direct_pair_uniq'), models.CheckConstraint(condition=models.Q(('user_low__lte', models.F('user_high'))), name='comm_direct_pair_ordered')],
+            },
+        ),
+        migrations.RunPython(backfill_direct_room_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-17 01:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0012_message_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('room_id', models.UUIDField()),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('message', 'Message created, updated or deleted'), ('membership', 'Participant joined or left'), ('read', 'Read watermark moved'), ('call_notification', 'Incoming call notification changed'), ('call_invitation', 'Call invitation changed')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room_id', 'id'], name='comm_syncevent_room_idx'), models.Index(fields=['user_id', 'id'], name='comm_syncevent_user_idx'), models.Index(fields=['created_at'], name='comm_syncevent_created_idx')],
+            },
+        ),
+    ]
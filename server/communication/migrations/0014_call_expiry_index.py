@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-17 01:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0013_sync_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callinvitation',
+            index=models.Index(fields=['status', 'expires_at'], name='comm_callinv_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incomingcallnotification',
+            index=models.Index(fields=['status', 'expires_at'], name='comm_callnotif_status_exp_idx'),
+        ),
+    ]
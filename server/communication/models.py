@@ -1,7 +1,8 @@
 from datetime import timedelta
 from cloudinary.models import CloudinaryField
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.conf import settings
 from django.utils import timezone
 import cloudinary
@@ -25,6 +26,23 @@ class Room(models.Model):
     max_participants = models.IntegerField(default=10)
     profile_image = CloudinaryField("image", null=True, blank=True)
 
+    # Denormalized pointer to the newest message, maintained on message save
+    last_message = models.ForeignKey(
+        "Message",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-last_activity_at", "-id"], name="comm_room_activity_idx"
+            ),
+        ]
+
     def clean(self):
         """
         Validate that the UUID is correctly formatted
@@ -42,6 +60,34 @@ class Room(models.Model):
     def __str__(self):
         return self.name
 
+    def record_message(self, message):
+        """
+        Point last_message/last_activity_at at a newly created message.
+        A single conditional UPDATE, so concurrent writers never move the
+        pointer backwards.
+        """
+        updated = Room.record_message_for(self.pk, message)
+        if updated:
+            self.last_message = message
+            self.last_activity_at = message.sent_at
+        return updated
+
+    @classmethod
+    def record_message_for(cls, room_id, message):
+        """record_message without loading the room (bulk inserts)"""
+        updated = (
+            cls.objects.filter(pk=room_id)
+            .filter(last_activity_at__lte=message.sent_at)
+            .update(last_message=message, last_activity_at=message.sent_at)
+        )
+        return bool(updated)
+
+    def refresh_last_message(self):
+        """Recompute the last_message pointer from the message table"""
+        latest = self.messages.order_by("-sent_at", "-id").first()
+        self.last_message = latest
+        Room.objects.filter(pk=self.pk).update(last_message=latest)
+
 
 class Participant(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -53,19 +99,148 @@ class Participant(models.Model):
     is_admin = models.BooleanField(default=False)
     is_muted = models.BooleanField(default=False)
 
+    # Read watermark: every message up to and including this one has been read
+    last_read_message = models.ForeignKey(
+        "Message",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    last_read_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         unique_together = ("user", "room")
 
     def __str__(self):
         return f"{self.user.username} in {self.room.name}"
 
+    @classmethod
+    def mark_room_read(cls, room_id, user, message=None):
+        """
+        Advance a user's read watermark in a room to ``message``, or to the
+        room's newest message when omitted. A single conditional UPDATE, so
+        the watermark only ever moves forward.
+
+        Returns the watermark message if it moved, otherwise None.
+        """
+        if message is None:
+            message = (
+                Message.objects.filter(room_id=room_id)
+                .order_by("-sent_at", "-id")
+                .only("id", "sent_at")
+                .first()
+            )
+            if message is None:
+                return None
+
+        updated = (
+            cls.objects.filter(room_id=room_id, user=user)
+            .filter(Q(last_read_at__isnull=True) | Q(last_read_at__lt=message.sent_at))
+            .update(last_read_message=message, last_read_at=message.sent_at)
+        )
+        if not updated:
+            return None
+        SyncEvent.record(SyncEvent.READ, room_id, user.pk)
+        return message
+
+    def unread_messages(self):
+        """Messages from other participants newer than the read watermark"""
+        messages = Message.objects.filter(room_id=self.room_id).exclude(
+            sender_id=self.user_id
+        )
+        if self.last_read_at:
+            messages = messages.filter(sent_at__gt=self.last_read_at)
+        return messages
+
+    def unread_count(self):
+        return self.unread_messages().count()
+
     def is_online(self):
         """
-        Check if participant is currently online (active in the last 5 minutes)
+        Check if participant currently has a live device in the presence
+        store. For many participants use get_presence().online_users_sync().
         """
-        if not self.last_active:
-            return False
-        return timezone.now() - self.last_active < timezone.timedelta(minutes=5)
+        from .presence import get_presence
+
+        return bool(get_presence().online_users_sync([self.user_id]))
+
+
+class DirectRoomKey(models.Model):
+    """
+    Canonical key of a direct conversation: the two users ordered by id.
+    The unique (user_low, user_high) index makes finding a pair's room a
+    single indexed lookup and stops concurrent requests creating duplicates.
+    """
+
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    room = models.OneToOneField(
+        Room, on_delete=models.CASCADE, related_name="direct_key"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_low", "user_high"], name="comm_direct_pair_uniq"
+            ),
+            models.CheckConstraint(
+                condition=Q(user_low__lte=F("user_high")),
+                name="comm_direct_pair_ordered",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Direct room {self.room_id} ({self.user_low_id}, {self.user_high_id})"
+
+    @staticmethod
+    def ordered(user_a, user_b):
+        return (user_a, user_b) if user_a.pk <= user_b.pk else (user_b, user_a)
+
+    @classmethod
+    def find_room(cls, user_a, user_b):
+        """Return the direct room between two users, or None"""
+        low, high = cls.ordered(user_a, user_b)
+        key = (
+            cls.objects.select_related("room")
+            .filter(user_low=low, user_high=high)
+            .first()
+        )
+        return key.room if key else None
+
+    @classmethod
+    def get_or_create_room(cls, user_a, user_b):
+        """
+        Return (room, created) for the direct room between two users,
+        creating the room, its participants and its key atomically
+        """
+        room = cls.find_room(user_a, user_b)
+        if room:
+            return room, False
+
+        low, high = cls.ordered(user_a, user_b)
+        sorted_names = sorted([low.username, high.username])
+        try:
+            with transaction.atomic():
+                room = Room.objects.create(
+                    name=f"Chat between {sorted_names[0]} and {sorted_names[1]}",
+                    room_type="direct",
+                )
+                participants = Participant.objects.bulk_create(
+                    [Participant(user=user, room=room) for user in {low, high}]
+                )
+                # bulk_create skips post_save, which logs joins for sync
+                SyncEvent.record_members(participants)
+                cls.objects.create(user_low=low, user_high=high, room=room)
+            return room, True
+        except IntegrityError:
+            # Another request created the pair first; use its room
+            return cls.find_room(low, high), False
 
 
 class Message(models.Model):
@@ -91,16 +266,25 @@ class Message(models.Model):
     video = CloudinaryField("video", null=True, blank=True)
     audio = CloudinaryField("audio", null=True, blank=True)
     document = CloudinaryField("raw", null=True, blank=True)
+    # name -> {"url", "width", "height"} for the generated image sizes
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_placeholder = models.TextField(blank=True, default="")
 
     # Location fields
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
 
-    sent_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
-    read_by = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, related_name="read_messages", blank=True
+    # Defaulted rather than auto_now_add so write-behind persistence can keep
+    # the timestamp that was assigned (and broadcast) when the message arrived
+    sent_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    # Media messages stay "processing" until a media job has uploaded the file
+    STATUS_CHOICES = (
+        ("sent", "Sent"),
+        ("processing", "Processing"),
+        ("failed", "Failed"),
     )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="sent")
 
     # Call-related fields
     call_duration = models.IntegerField(null=True, blank=True)
@@ -122,17 +306,73 @@ class Message(models.Model):
         blank=True,
     )
 
+    class Meta:
+        indexes = [
+            # Serves keyset pagination of a room's history on (sent_at, id)
+            models.Index(
+                fields=["room", "sent_at", "id"], name="comm_msg_room_sent_id_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Message in {self.room.name} by {self.sender.username}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            # Keep the room's denormalized inbox pointer current
+            self.room.record_message(self)
+
+    def delete(self, *args, **kwargs):
+        room = self.room
+        result = super().delete(*args, **kwargs)
+        # Deleting the last message nulls the pointer (SET_NULL); move it back
+        if not Room.objects.filter(pk=room.pk, last_message__isnull=False).exists():
+            room.refresh_last_message()
+        return result
+
+    # Read state is derived from the participants' read watermarks
+
+    def _readers(self):
+        return Participant.objects.filter(
+            room_id=self.room_id, last_read_at__gte=self.sent_at
+        ).exclude(user_id=self.sender_id)
+
+    @property
+    def read_by(self):
+        """Users whose read watermark is at or past this message"""
+        from django.contrib.auth import get_user_model
+
+        return get_user_model().objects.filter(
+            id__in=self._readers().values("user_id")
+        )
+
+    @property
+    def is_read(self):
+        """True once everyone except the sender has read this message"""
+        return (
+            not Participant.objects.filter(room_id=self.room_id)
+            .exclude(user_id=self.sender_id)
+            .filter(Q(last_read_at__isnull=True) | Q(last_read_at__lt=self.sent_at))
+            .exists()
+        )
+
+    def is_read_with(self, watermarks):
+        """
+        is_read computed from a preloaded ``{user_id: last_read_at}`` mapping
+        of the room's participants, without touching the database
+        """
+        return all(
+            read_at is not None and read_at >= self.sent_at
+            for user_id, read_at in watermarks.items()
+            if user_id != self.sender_id
+        )
+
     def mark_as_read(self, user):
-        """Mark message as read by a specific user"""
-        if user != self.sender and user not in self.read_by.all():
-            self.read_by.add(user)
-            if self.read_by.count() == self.room.communication_participants.count() - 1:
-                # Everyone except sender has read the message
-                self.is_read = True
-                self.save(update_fields=["is_read"])
+        """Mark message (and everything before it) as read by a specific user"""
+        if user.pk != self.sender_id:
+            Participant.mark_room_read(self.room_id, user, self)
 
 
 class CallLog(models.Model):
@@ -195,21 +435,22 @@ class MediaFile(models.Model):
         null=True, blank=True, validators=[MaxValueValidator(settings.MAX_UPLOAD_SIZE)]
     )
     file_extension = models.CharField(max_length=10, blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_placeholder = models.TextField(blank=True, default="")
 
     def save(self, *args, **kwargs):
         # Extract public_id when saving
-        if self.file:
-            self.public_id = self.file.public_id
+        if self.file and not self.public_id:
+            self.public_id = getattr(self.file, "public_id", None)
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Delete from Cloudinary when model instance is deleted
-        from .utils import CloudinaryHelper
+        # Release the stored file when model instance is deleted
+        from .media_storage import release_image_variants, release_media
 
         if self.public_id:
-            CloudinaryHelper.delete_resource(
-                self.public_id, resource_type=self.media_type
-            )
+            release_media(self.public_id, resource_type=self.media_type)
+        release_image_variants(self.image_variants)
 
         super().delete(*args, **kwargs)
 
@@ -227,6 +468,221 @@ class MediaFile(models.Model):
                 )
 
 
+class MediaBlob(models.Model):
+    """
+    A file kept by the local media storage backend, addressed by the SHA-256
+    of its content. Identical uploads share one blob and bump ref_count.
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    extension = models.CharField(max_length=10, blank=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256}{self.extension} ({self.ref_count} refs)"
+
+
+class MediaJob(models.Model):
+    """
+    Deferred upload of a media message's file. The file is staged on disk
+    and the worker (manage.py process_media_jobs) uploads it, fills in the
+    message's media field and broadcasts the update.
+    """
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    message = models.OneToOneField(
+        Message, on_delete=models.CASCADE, related_name="media_job"
+    )
+    media_type = models.CharField(max_length=20)
+    staged_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Serves the worker's "next due jobs" poll
+            models.Index(
+                fields=["status", "available_at"], name="comm_mediajob_due_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.media_type} job for message {self.message_id} ({self.status})"
+
+
+class PushDelivery(models.Model):
+    """
+    Outbox entry for one push notification to one device. Requests only
+    queue these; the dispatcher (manage.py dispatch_push) sends them to the
+    provider in batches and retries failures until MAX_ATTEMPTS, after which
+    the entry is left "dead" with its last error.
+    """
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("dead", "Dead"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    provider = models.CharField(max_length=50)
+    device_token = models.CharField(max_length=255)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves the dispatcher's "next due deliveries" poll
+            models.Index(fields=["status", "available_at"], name="comm_push_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} push to {self.device_token[:12]} ({self.status})"
+
+
+class SyncEvent(models.Model):
+    """
+    Append-only log of changes that reconnecting clients catch up on through
+    the sync endpoint. The id is the sync token: a client that has seen
+    every event up to id N asks for the events after N.
+
+    Room events (user_id null) are visible to the room's participants; user
+    events only to that user. room_id and user_id are plain columns rather
+    than foreign keys so events written while a room or user is being
+    deleted (the cascaded participant and message deletes) are kept.
+    """
+
+    MESSAGE = "message"
+    MEMBERSHIP = "membership"
+    READ = "read"
+    CALL_NOTIFICATION = "call_notification"
+    CALL_INVITATION = "call_invitation"
+    KIND_CHOICES = (
+        (MESSAGE, "Message created, updated or deleted"),
+        (MEMBERSHIP, "Participant joined or left"),
+        (READ, "Read watermark moved"),
+        (CALL_NOTIFICATION, "Incoming call notification changed"),
+        (CALL_INVITATION, "Call invitation changed"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    room_id = models.UUIDField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Message or call id; the member's user id for membership and read events
+    object_id = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Serve "events after N" for the user's rooms and for the user
+            models.Index(fields=["room_id", "id"], name="comm_syncevent_room_idx"),
+            models.Index(fields=["user_id", "id"], name="comm_syncevent_user_idx"),
+            models.Index(fields=["created_at"], name="comm_syncevent_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.kind} {self.object_id} in {self.room_id}"
+
+    @classmethod
+    def record(cls, kind, room_id, object_id, user_ids=(None,)):
+        """Log one change, for the whole room or for each of user_ids"""
+        cls.objects.bulk_create(
+            [
+                cls(kind=kind, room_id=room_id, object_id=str(object_id), user_id=u)
+                for u in user_ids
+            ]
+        )
+
+    @classmethod
+    def record_calls(cls, calls):
+        """Log new call notifications or invitations saved with bulk_create"""
+        cls.objects.bulk_create(
+            [
+                cls(
+                    kind=call.sync_kind,
+                    room_id=call.room_id,
+                    object_id=str(call.pk),
+                    user_id=getattr(call, field),
+                )
+                for call in calls
+                for field in call.sync_user_fields
+            ]
+        )
+
+    @classmethod
+    def record_members(cls, participants):
+        """Log new participants saved with bulk_create"""
+        cls.objects.bulk_create(
+            [
+                cls(kind=cls.MEMBERSHIP, room_id=p.room_id, object_id=str(p.user_id))
+                for p in participants
+            ]
+        )
+
+    @classmethod
+    def record_messages(cls, messages):
+        """Log new messages saved without Message.save (bulk inserts)"""
+        cls.objects.bulk_create(
+            [
+                cls(kind=cls.MESSAGE, room_id=m.room_id, object_id=str(m.id))
+                for m in messages
+            ]
+        )
+
+
+class CallStateQuerySet(models.QuerySet):
+    """
+    Logs a sync event for each call whose status is changed with a queryset
+    update() (bulk expiry), as post_save does for single saves
+    """
+
+    def update(self, **kwargs):
+        if "status" not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            changed = list(
+                self.values_list("id", "room_id", *self.model.sync_user_fields)
+            )
+            updated = super().update(**kwargs)
+            SyncEvent.objects.bulk_create(
+                [
+                    SyncEvent(
+                        kind=self.model.sync_kind,
+                        room_id=room_id,
+                        object_id=str(call_id),
+                        user_id=user_id,
+                    )
+                    for call_id, room_id, *user_ids in changed
+                    for user_id in user_ids
+                ]
+            )
+        return updated
+
+
 class CallInvitation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     inviter = models.ForeignKey(
@@ -256,6 +712,18 @@ class CallInvitation(models.Model):
         default="pending",
     )
 
+    objects = CallStateQuerySet.as_manager()
+
+    # Who is told about changes through the sync endpoint
+    sync_kind = SyncEvent.CALL_INVITATION
+    sync_user_fields = ("inviter_id", "invitee_id")
+
+    class Meta:
+        indexes = [
+            # Serves the expiry sweeper's "unanswered and past expires_at" scan
+            models.Index(fields=["status", "expires_at"], name="comm_callinv_status_exp_idx"),
+        ]
+
     def __str__(self):
         return f"Call invite from {self.inviter.username} to {self.invitee.username}"
 
@@ -312,6 +780,18 @@ class IncomingCallNotification(models.Model):
     )
     device_token = models.CharField(max_length=255, null=True, blank=True)
 
+    objects = CallStateQuerySet.as_manager()
+
+    # Who is told about changes through the sync endpoint
+    sync_kind = SyncEvent.CALL_NOTIFICATION
+    sync_user_fields = ("caller_id", "recipient_id")
+
+    class Meta:
+        indexes = [
+            # Serves the expiry sweeper's "unanswered and past expires_at" scan
+            models.Index(fields=["status", "expires_at"], name="comm_callnotif_status_exp_idx"),
+        ]
+
     def __str__(self):
         return f"Call from {self.caller.username} to {self.recipient.username}"
 
@@ -341,11 +821,10 @@ class IncomingCallNotification(models.Model):
 
     @classmethod
     def get_active_for_user(cls, user):
-        """Get active notifications for a user"""
-        # First expire any outdated notifications
-        cls.expire_outdated()
-
-        # Then get active ones
+        """
+        Get active notifications for a user; overdue ones are left out here
+        and marked expired by the expire_calls worker
+        """
         return cls.objects.filter(
             recipient=user,
             status__in=["pending", "seen"],
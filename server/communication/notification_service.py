@@ -1,9 +1,6 @@
-# Create new file notification_service.py
-
 import logging
-import json
-import requests
-from django.conf import settings
+
+from . import push
 
 logger = logging.getLogger(__name__)
 
@@ -15,72 +12,20 @@ class NotificationService:
     def send_incoming_call_notification(
         device_token, caller, recipient, call_type, room_name, notification_id
     ):
-        """Send push notification for incoming call"""
+        """
+        Queue a push notification for an incoming call. The dispatcher
+        (manage.py dispatch_push) sends it, so the caller's request never
+        waits on the push provider. Returns True if it was queued.
+        """
         if not device_token:
             logger.warning("No device token provided for push notification")
             return False
 
         try:
-            # This is a placeholder implementation
-            # In a real application, you would integrate with FCM, APNS, or another push service
-
-            notification_data = {
-                "title": "Incoming Call",
-                "body": f"{caller.username} is calling you",
-                "data": {
-                    "type": "incoming_call",
-                    "caller_id": str(caller.id),
-                    "caller_username": caller.username,
-                    "recipient_id": str(recipient.id),
-                    "call_type": call_type,
-                    "room_name": room_name,
-                    "notification_id": str(notification_id),
-                },
-            }
-
-            # Example implementation using FCM (Firebase Cloud Messaging)
-            # Uncomment and configure if using FCM
-            """
-            fcm_api_key = settings.FCM_API_KEY
-            fcm_url = "https://fcm.googleapis.com/fcm/send"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"key={fcm_api_key}"
-            }
-            
-            payload = {
-                "to": device_token,
-                "notification": {
-                    "title": notification_data["title"],
-                    "body": notification_data["body"],
-                    "sound": "default"
-                },
-                "data": notification_data["data"],
-                "priority": "high"
-            }
-            
-            response = requests.post(fcm_url, headers=headers, data=json.dumps(payload))
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                if response_data.get("success") == 1:
-                    logger.info(f"Push notification sent successfully to {device_token}")
-                    return True
-                else:
-                    logger.error(f"Failed to send push notification: {response_data}")
-                    return False
-            else:
-                logger.error(f"FCM responded with status code {response.status_code}: {response.text}")
-                return False
-            """
-
-            # For now, just log that we would send a notification
-            logger.info(
-                f"Would send push notification to {device_token}: {notification_data}"
+            payload = push.incoming_call_payload(
+                caller, recipient, call_type, room_name, notification_id
             )
-            return True
-
+            return bool(push.enqueue([(device_token, payload)]))
         except Exception as e:
-            logger.error(f"Error sending push notification: {str(e)}")
+            logger.error(f"Error queueing push notification: {str(e)}")
             return False
@@ -0,0 +1,202 @@
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite, strictly ordered key.
+
+    Pages are addressed with opaque ``before``/``after`` cursors built from the
+    key of the edge row instead of a page number, so fetching a page deep in
+    the history is an index seek rather than an OFFSET scan, and no COUNT(*)
+    is ever issued. Results are always returned newest-first.
+    """
+
+    cursor_fields = ("sent_at", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    before_query_param = "before"
+    after_query_param = "after"
+    mode_query_param = "pagination"
+    invalid_cursor_message = "Invalid cursor"
+
+    @classmethod
+    def is_requested(cls, request):
+        """Return True if the client asked for cursor pagination"""
+        params = request.query_params
+        return (
+            cls.before_query_param in params
+            or cls.after_query_param in params
+            or params.get(cls.mode_query_param) == "cursor"
+        )
+
+    def is_first_page(self, request):
+        """True unless the client passed a before/after cursor"""
+        params = request.query_params
+        return not (
+            params.get(self.before_query_param) or params.get(self.after_query_param)
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, ""))
+        except ValueError:
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, instance):
+        values = []
+        for name in self.cursor_fields:
+            if isinstance(instance, dict):
+                value = instance[name]
+            else:
+                value = getattr(instance, name)
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            values.append(str(value))
+        raw = "|".join(values).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    def decode_cursor(self, model, encoded):
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8")
+            parts = raw.split("|")
+            if len(parts) != len(self.cursor_fields):
+                raise ValueError(raw)
+            return [
+                model._meta.get_field(name).to_python(part)
+                for name, part in zip(self.cursor_fields, parts)
+            ]
+        except (TypeError, ValueError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _seek(self, values, lookup):
+        """
+        Build the row-value comparison ``(f1, f2, ...) <lookup> (v1, v2, ...)``
+        as nested OR/AND. The redundant inclusive bound on the leading field
+        lets the planner turn the seek into an index range scan.
+        """
+        condition = Q()
+        for position, name in enumerate(self.cursor_fields):
+            clause = Q(**{f"{name}__{lookup}": values[position]})
+            for prior, prior_name in enumerate(self.cursor_fields[:position]):
+                clause &= Q(**{prior_name: values[prior]})
+            condition |= clause
+        bound = Q(**{f"{self.cursor_fields[0]}__{lookup}e": values[0]})
+        return bound & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+        model = queryset.model
+
+        descending = [f"-{name}" for name in self.cursor_fields]
+        ascending = list(self.cursor_fields)
+
+        if after:
+            values = self.decode_cursor(model, after)
+            rows = list(
+                queryset.filter(self._seek(values, "gt")).order_by(*ascending)[
+                    : self.page_size_value + 1
+                ]
+            )
+            self.has_newer = len(rows) > self.page_size_value
+            rows = rows[: self.page_size_value]
+            rows.reverse()
+            self.has_older = True
+        else:
+            if before:
+                values = self.decode_cursor(model, before)
+                queryset = queryset.filter(self._seek(values, "lt"))
+            rows = list(queryset.order_by(*descending)[: self.page_size_value + 1])
+            self.has_older = len(rows) > self.page_size_value
+            rows = rows[: self.page_size_value]
+            self.has_newer = bool(before)
+
+        self.page = rows
+        return rows
+
+    def paginate_first_page(self, entries, count, request):
+        """
+        Paginate an already serialized first page (dicts holding the cursor
+        fields, newest first) out of count rows in total, without a query
+        """
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.page = entries[: self.page_size_value]
+        self.has_older = count > self.page_size_value
+        self.has_newer = False
+        return self.page
+
+    def get_before_cursor(self):
+        if not self.page or not self.has_older:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_after_cursor(self):
+        if not self.page or not self.has_newer:
+            return None
+        return self.encode_cursor(self.page[0])
+
+    def _link(self, param, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, cursor)
+
+    def get_paginated_response(self, data):
+        before = self.get_before_cursor()
+        after = self.get_after_cursor()
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self._link(self.before_query_param, before)),
+                    ("previous", self._link(self.after_query_param, after)),
+                    ("before", before),
+                    ("after", after),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "before": {"type": "string", "nullable": True},
+                "after": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+
+class MessageCursorPagination(KeysetCursorPagination):
+    """Cursor pagination for room message history, keyed on (sent_at, id)"""
+
+    cursor_fields = ("sent_at", "id")
+    page_size = 100
+
+
+class InboxCursorPagination(KeysetCursorPagination):
+    """Cursor pagination for a user's rooms, most recently active first"""
+
+    cursor_fields = ("last_activity_at", "id")
+    page_size = 30
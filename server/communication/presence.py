@@ -0,0 +1,212 @@
+import asyncio
+import time
+import weakref
+from urllib.parse import parse_qs
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+GLOBAL_SCOPE = "global"
+
+
+def device_id_for(scope, fallback):
+    """Device id sent by the client (?device_id=...), else the channel name"""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    device_id = query.get("device_id", [None])[0]
+    return device_id[:64] if device_id else fallback
+
+
+class InMemoryPresence:
+    """
+    Process-local presence store with the same semantics as RedisPresence.
+    Used by tests and single-process development setups.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._devices = {}  # (scope, user_id) -> {device_id: expires_at}
+        self._connections = {}  # (scope, user_id, device_id) -> {connection}
+
+    def _live_devices(self, key, now):
+        devices = self._devices.get(key, {})
+        for device_id, expires_at in list(devices.items()):
+            if expires_at <= now:
+                del devices[device_id]
+                self._connections.pop((*key, device_id), None)
+        return devices
+
+    async def touch(self, user_id, device_id, scope=GLOBAL_SCOPE, connection=None):
+        now = time.time()
+        key = (scope, str(user_id))
+        devices = self._live_devices(key, now)
+        came_online = not devices
+        devices[device_id] = now + self.ttl
+        self._devices[key] = devices
+        if connection is not None:
+            self._connections.setdefault((*key, device_id), set()).add(connection)
+        return came_online
+
+    async def leave(self, user_id, device_id, scope=GLOBAL_SCOPE, connection=None):
+        now = time.time()
+        key = (scope, str(user_id))
+        devices = self._live_devices(key, now)
+        if connection is not None:
+            connections = self._connections.get((*key, device_id), set())
+            connections.discard(connection)
+            if connections and device_id in devices:
+                return False
+            self._connections.pop((*key, device_id), None)
+        removed = devices.pop(device_id, None) is not None
+        if not devices:
+            self._devices.pop(key, None)
+        return removed and not devices
+
+    async def online_users(self, user_ids, scope=GLOBAL_SCOPE):
+        return self.online_users_sync(user_ids, scope)
+
+    def online_users_sync(self, user_ids, scope=GLOBAL_SCOPE):
+        now = time.time()
+        return {
+            user_id
+            for user_id in user_ids
+            if self._live_devices((scope, str(user_id)), now)
+        }
+
+
+class RedisPresence:
+    """
+    Presence on Redis. Each (scope, user) is a sorted set of device ids
+    scored by their expiry time; heartbeats push the score forward and the
+    key itself expires once every device has gone quiet. Every operation,
+    including a bulk lookup for a whole room, is a single pipelined round
+    trip (two for a leave while the device has other connections) and none
+    of them touch the SQL database.
+
+    A device may hold several connections (one socket per room): touch and
+    leave then pass connection, each device keeps a set of its open ones,
+    and the device only goes away when the last of them leaves.
+    """
+
+    def __init__(self, url, ttl, prefix="presence"):
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> client
+        self._sync_client = None
+
+    def _key(self, user_id, scope):
+        return f"{self.prefix}:{scope}:{user_id}"
+
+    def _connections_key(self, user_id, scope, device_id):
+        return f"{self._key(user_id, scope)}:{device_id}"
+
+    def _client(self):
+        # redis.asyncio connections are bound to the loop that opened them
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = redis.asyncio.Redis.from_url(self.url)
+        return client
+
+    async def touch(self, user_id, device_id, scope=GLOBAL_SCOPE, connection=None):
+        """Register or refresh a device; True if the user just came online"""
+        now = time.time()
+        key = self._key(user_id, scope)
+        pipe = self._client().pipeline(transaction=True)
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zcard(key)
+        pipe.zadd(key, {device_id: now + self.ttl})
+        pipe.pexpire(key, int(self.ttl * 1000))
+        if connection is not None:
+            connections_key = self._connections_key(user_id, scope, device_id)
+            pipe.sadd(connections_key, connection)
+            pipe.pexpire(connections_key, int(self.ttl * 1000))
+        live_before = (await pipe.execute())[1]
+        return live_before == 0
+
+    async def leave(self, user_id, device_id, scope=GLOBAL_SCOPE, connection=None):
+        """
+        Drop a connection of a device, and the device with its last one;
+        True if that was the user's last live device
+        """
+        now = time.time()
+        key = self._key(user_id, scope)
+        if connection is not None:
+            connections_key = self._connections_key(user_id, scope, device_id)
+            pipe = self._client().pipeline(transaction=True)
+            pipe.srem(connections_key, connection)
+            pipe.scard(connections_key)
+            pipe.zscore(key, device_id)
+            _, open_connections, expires_at = await pipe.execute()
+            if open_connections and expires_at is not None and expires_at > now:
+                return False
+
+        pipe = self._client().pipeline(transaction=True)
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zrem(key, device_id)
+        pipe.zcard(key)
+        if connection is not None:
+            pipe.delete(connections_key)
+        _, removed, remaining = (await pipe.execute())[:3]
+        return bool(removed) and remaining == 0
+
+    def _count_live(self, pipe, user_ids, scope):
+        now = time.time()
+        for user_id in user_ids:
+            pipe.zcount(self._key(user_id, scope), f"({now}", "+inf")
+
+    async def online_users(self, user_ids, scope=GLOBAL_SCOPE):
+        """The subset of user_ids with at least one live device"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        pipe = self._client().pipeline(transaction=False)
+        self._count_live(pipe, user_ids, scope)
+        counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+    def online_users_sync(self, user_ids, scope=GLOBAL_SCOPE):
+        """online_users for synchronous views"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        if self._sync_client is None:
+            self._sync_client = redis.Redis.from_url(self.url)
+        pipe = self._sync_client.pipeline(transaction=False)
+        self._count_live(pipe, user_ids, scope)
+        counts = pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+
+_presence = None
+
+
+def get_presence():
+    """
+    The configured presence backend. PRESENCE["BACKEND"] may be "redis",
+    "memory" or "auto" (Redis whenever the channel layer runs on Redis).
+    """
+    global _presence
+    if _presence is None:
+        config = getattr(settings, "PRESENCE", {})
+        backend = config.get("BACKEND", "auto")
+        ttl = config.get("TTL", 60)
+        if backend == "auto":
+            layer = settings.CHANNEL_LAYERS.get("default", {}).get("BACKEND", "")
+            backend = "redis" if "channels_redis" in layer else "memory"
+
+        if backend == "redis":
+            _presence = RedisPresence(config["REDIS_URL"], ttl)
+        else:
+            _presence = InMemoryPresence(ttl)
+    return _presence
+
+
+@receiver(setting_changed)
+def reset_presence(setting, **kwargs):
+    global _presence
+    if setting in ("PRESENCE", "CHANNEL_LAYERS"):
+        _presence = None
@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+
+import httpx
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .metrics import metrics
+from .models import PushDelivery
+
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, "PUSH_NOTIFICATIONS", {})
+
+
+def _provider_config(name):
+    return _config().get("PROVIDERS", {}).get(name)
+
+
+def enqueue(deliveries, provider=None):
+    """
+    Queue pushes for the dispatcher: deliveries is an iterable of
+    (device_token, payload) pairs, stored with one INSERT. Nothing is sent
+    here, so callers never wait on the provider. Returns the queued rows;
+    none if the provider is not configured.
+    """
+    provider = provider or _config().get("DEFAULT_PROVIDER", "fcm")
+    provider_config = _provider_config(provider)
+    if not provider_config or not provider_config.get("URL"):
+        logger.warning(f"Push provider {provider} is not configured; not queued")
+        return []
+    rows = PushDelivery.objects.bulk_create(
+        [
+            PushDelivery(provider=provider, device_token=token, payload=payload)
+            for token, payload in deliveries
+            if token
+        ]
+    )
+    metrics.counter("push.queued").inc(len(rows))
+    return rows
+
+
+def incoming_call_payload(caller, recipient, call_type, room_name, notification_id):
+    """The push payload announcing an incoming call"""
+    return {
+        "title": "Incoming Call",
+        "body": f"{caller.username} is calling you",
+        "data": {
+            "type": "incoming_call",
+            "caller_id": str(caller.id),
+            "caller_username": caller.username,
+            "recipient_id": str(recipient.id),
+            "call_type": call_type,
+            "room_name": room_name,
+            "notification_id": str(notification_id),
+        },
+    }
+
+
+def claim_deliveries(worker_id, limit):
+    """
+    Claim up to limit due deliveries, oldest first. Deliveries left
+    "sending" past the lease (a dispatcher died mid-batch) are claimed
+    again. The claim is one conditional UPDATE tagged with a fresh claim
+    id, so concurrent dispatchers never share a delivery.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    lease = timedelta(seconds=_config().get("LEASE_SECONDS", 60))
+    due = Q(status="pending", available_at__lte=now) | Q(
+        status="sending", locked_at__lt=now - lease
+    )
+    candidates = list(
+        PushDelivery.objects.filter(due)
+        .order_by("available_at")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+
+    claim_id = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+    PushDelivery.objects.filter(due, id__in=candidates).update(
+        status="sending",
+        locked_by=claim_id,
+        locked_at=now,
+        attempts=F("attempts") + 1,
+    )
+    return list(
+        PushDelivery.objects.filter(locked_by=claim_id, status="sending").order_by(
+            "available_at"
+        )
+    )
+
+
+class PushResult:
+    """Outcome of one delivery: sent, or an error that may be retried"""
+
+    def __init__(self, delivery, error=None, retryable=False):
+        self.delivery = delivery
+        self.error = error
+        self.retryable = retryable
+
+    @property
+    def sent(self):
+        return self.error is None
+
+
+class HTTPPushProvider:
+    """
+    A provider's batch send endpoint. One POST carries up to BATCH_SIZE
+    messages as {"messages": [{"token", "notification", "data"}, ...]} and
+    is answered with {"results": [{"error": ..., "retryable": ...}, ...]} in
+    the same order ("error" is null for a delivered message). Timeouts,
+    connection errors, 429 and 5xx responses fail the whole batch as
+    retryable; any other 4xx fails it permanently.
+    """
+
+    def __init__(self, name, url, api_key="", batch_size=500):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_settings(cls, name):
+        config = _provider_config(name)
+        if not config or not config.get("URL"):
+            return None
+        return cls(
+            name,
+            config["URL"],
+            api_key=config.get("API_KEY", ""),
+            batch_size=config.get("BATCH_SIZE", 500),
+        )
+
+    def _message(self, delivery):
+        payload = delivery.payload
+        return {
+            "token": delivery.device_token,
+            "notification": {
+                "title": payload.get("title"),
+                "body": payload.get("body"),
+            },
+            "data": payload.get("data", {}),
+        }
+
+    async def send(self, client, deliveries):
+        """Send one batch over client; one PushResult per delivery"""
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        try:
+            response = await client.post(
+                self.url,
+                json={"messages": [self._message(d) for d in deliveries]},
+                headers=headers,
+            )
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            return [PushResult(d, error, retryable=True) for d in deliveries]
+
+        metrics.counter(f"push.batches.{self.name}").inc()
+        if response.status_code != 200:
+            retryable = response.status_code == 429 or response.status_code >= 500
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            return [PushResult(d, error, retryable=retryable) for d in deliveries]
+
+        try:
+            results = response.json()["results"]
+            if len(results) != len(deliveries):
+                raise ValueError(f"{len(results)} results for {len(deliveries)}")
+        except (ValueError, KeyError, TypeError) as e:
+            error = f"Bad provider response: {str(e)}"
+            return [PushResult(d, error, retryable=True) for d in deliveries]
+        return [
+            PushResult(d, r.get("error"), retryable=bool(r.get("retryable")))
+            for d, r in zip(deliveries, results)
+        ]
+
+
+def record_results(results):
+    """
+    Store a dispatch round's outcomes with a few bulk queries: sent
+    deliveries are marked sent; retryable failures go back to pending with
+    exponential backoff until MAX_ATTEMPTS, the rest are dead-lettered
+    """
+    now = timezone.now()
+    max_attempts = _config().get("MAX_ATTEMPTS", 5)
+    retry_delay = _config().get("RETRY_DELAY_SECONDS", 2)
+
+    sent = [r.delivery.id for r in results if r.sent]
+    if sent:
+        PushDelivery.objects.filter(id__in=sent).update(
+            status="sent", sent_at=now, last_error="", locked_by=""
+        )
+        metrics.counter("push.sent").inc(len(sent))
+
+    failed = []
+    for result in results:
+        if result.sent:
+            continue
+        delivery = result.delivery
+        delivery.last_error = result.error
+        delivery.locked_by = ""
+        if result.retryable and delivery.attempts < max_attempts:
+            delivery.status = "pending"
+            delivery.available_at = now + timedelta(
+                seconds=retry_delay * 2 ** (delivery.attempts - 1)
+            )
+            metrics.counter("push.retried").inc()
+        else:
+            delivery.status = "dead"
+            logger.error(
+                f"Push {delivery.id} to {delivery.provider} dead after "
+                f"{delivery.attempts} attempts: {result.error}"
+            )
+            metrics.counter("push.dead").inc()
+        failed.append(delivery)
+    if failed:
+        PushDelivery.objects.bulk_update(
+            failed, ["status", "available_at", "last_error", "locked_by"]
+        )
+
+
+def purge_deliveries(older_than, batch_size):
+    """
+    Delete up to batch_size sent or dead deliveries last due before
+    older_than; the number deleted
+    """
+    ids = list(
+        PushDelivery.objects.filter(
+            status__in=("sent", "dead"), available_at__lt=older_than
+        )
+        .order_by("available_at")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    PushDelivery.objects.filter(id__in=ids).delete()
+    metrics.counter("push.purged").inc(len(ids))
+    return len(ids)
+
+
+class PushDispatcher:
+    """
+    Drains the outbox: claims due deliveries, splits them into batches per
+    provider and posts the batches concurrently through one pooled HTTP
+    client, so connections to each provider are kept alive between rounds.
+    While idle it deletes finished deliveries older than PURGE_AFTER_DAYS.
+    """
+
+    def __init__(self, worker_id, claim_size=None, poll_interval=None):
+        config = _config()
+        self.worker_id = worker_id
+        self.claim_size = claim_size or config.get("CLAIM_SIZE", 1000)
+        self.poll_interval = poll_interval or config.get("POLL_INTERVAL", 0.25)
+        self.purge_after_days = config.get("PURGE_AFTER_DAYS", 7)
+        self.purge_batch_size = config.get("PURGE_BATCH_SIZE", 1000)
+        self.purge_interval = config.get("PURGE_INTERVAL", 60)
+        self.next_purge = 0.0
+        self.providers = {}
+
+    def _provider(self, name):
+        if name not in self.providers:
+            self.providers[name] = HTTPPushProvider.from_settings(name)
+        return self.providers[name]
+
+    def client(self):
+        config = _config()
+        return httpx.AsyncClient(
+            timeout=config.get("TIMEOUT", 10),
+            limits=httpx.Limits(
+                max_connections=config.get("MAX_CONNECTIONS", 10),
+                max_keepalive_connections=config.get("MAX_CONNECTIONS", 10),
+            ),
+        )
+
+    async def dispatch(self, client, deliveries):
+        """Send claimed deliveries; PushResults in no particular order"""
+        by_provider = {}
+        for delivery in deliveries:
+            by_provider.setdefault(delivery.provider, []).append(delivery)
+
+        results = []
+        sends = []
+        for name, pending in by_provider.items():
+            provider = self._provider(name)
+            if provider is None:
+                error = f"Push provider {name} is not configured"
+                results.extend(PushResult(d, error) for d in pending)
+                continue
+            for start in range(0, len(pending), provider.batch_size):
+                batch = pending[start : start + provider.batch_size]
+                sends.append(provider.send(client, batch))
+        for batch_results in await asyncio.gather(*sends):
+            results.extend(batch_results)
+        return results
+
+    async def run_once(self, client):
+        """One claim/send/record round; the number of deliveries handled"""
+        deliveries = await database_sync_to_async(claim_deliveries)(
+            self.worker_id, self.claim_size
+        )
+        if not deliveries:
+            return 0
+        started = asyncio.get_running_loop().time()
+        results = await self.dispatch(client, deliveries)
+        metrics.summary("push.dispatch_ms").observe(
+            (asyncio.get_running_loop().time() - started) * 1000
+        )
+        await database_sync_to_async(record_results)(results)
+        return len(deliveries)
+
+    async def purge(self):
+        """
+        Delete one batch of old finished deliveries, at most once per
+        purge_interval unless the last batch was full; the number deleted
+        """
+        now = asyncio.get_running_loop().time()
+        if now < self.next_purge:
+            return 0
+        older_than = timezone.now() - timedelta(days=self.purge_after_days)
+        purged = await database_sync_to_async(purge_deliveries)(
+            older_than, self.purge_batch_size
+        )
+        if purged < self.purge_batch_size:
+            self.next_purge = now + self.purge_interval
+        return purged
+
+    async def run(self, once=False):
+        """Dispatch until cancelled, or with once until nothing is due"""
+        async with self.client() as client:
+            while True:
+                handled = await self.run_once(client)
+                if handled or await self.purge():
+                    continue
+                if once:
+                    return
+                await asyncio.sleep(self.poll_interval)
@@ -4,8 +4,14 @@ from rest_framework.response import Response
 from rest_framework import permissions
 from django.contrib.auth import get_user_model
 
-from .models import Room
-from .serializers import RoomSerializer
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Room, Message, DirectRoomKey
+from .pagination import InboxCursorPagination
+from .serializers import RoomSerializer, InboxRoomSerializer
 import logging
 
 import uuid
@@ -47,13 +53,7 @@ class FindDirectRoomView(APIView):
             other_user = User.objects.get(username=other_username)
 
             # Find direct room between current user and other user
-            room = (
-                Room.objects.filter(
-                    room_type="direct", communication_participants__user=request.user
-                )
-                .filter(communication_participants__user=other_user)
-                .first()
-            )
+            room = DirectRoomKey.find_room(request.user, other_user)
 
             if not room:
                 return Response(
@@ -87,31 +87,10 @@ class FindDirectRoomView(APIView):
             user1 = User.objects.get(username=username1)
             user2 = User.objects.get(username=username2)
 
-            # Find rooms where both users are participants
-            # and the room type is "direct"
-            room = (
-                Room.objects.filter(
-                    room_type="direct", communication_participants__user=user1
-                )
-                .filter(communication_participants__user=user2)
-                .first()
-            )
-
-            # If room doesn't exist, create it
-            if not room:
-                # Create room name using alphabetically sorted usernames
-                sorted_names = sorted([username1, username2])
-                room_name = f"Chat between {sorted_names[0]} and {sorted_names[1]}"
-
-                # Create the room
-                room = Room.objects.create(name=room_name, room_type="direct")
-
-                # Add participants
-                from .models import Participant
-
-                Participant.objects.create(user=user1, room=room)
-                Participant.objects.create(user=user2, room=room)
+            # Find or create the pair's room through its canonical key
+            room, created = DirectRoomKey.get_or_create_room(user1, user2)
 
+            if created:
                 logger.info(
                     f"Created new direct room between {username1} and {username2}"
                 )
@@ -197,9 +176,12 @@ class UserRoomsView(APIView):
     def get(self, request):
         """Get all rooms the user is a participant in, organized by type"""
         # Get all rooms the user is part of
-        user_rooms = Room.objects.filter(
-            communication_participants__user=request.user
-        ).prefetch_related("communication_participants__user")
+        user_rooms = (
+            Room.objects.filter(communication_participants__user=request.user)
+            .select_related("last_message__sender", "last_message__room")
+            .prefetch_related("communication_participants__user")
+            .order_by("-last_activity_at", "-id")
+        )
 
         # Split into direct and group rooms
         direct_rooms = []
@@ -221,3 +203,55 @@ class UserRoomsView(APIView):
                 "group_rooms": group_serializer.data,
             }
         )
+
+
+class InboxView(APIView):
+    """
+    The current user's rooms ordered by most recent activity, cursor paginated.
+
+    Reads the denormalized Room.last_message pointer, so a page costs the same
+    fixed number of queries however many conversations the user has.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InboxCursorPagination
+
+    def get(self, request):
+        """Get a page of the user's rooms, newest activity first"""
+        # Unread counts come from the user's read watermark on the same
+        # participant row the filter joins, via one correlated subquery
+        unread = (
+            Message.objects.filter(
+                room=OuterRef("pk"), sent_at__gt=OuterRef("my_last_read_at")
+            )
+            .exclude(sender=request.user)
+            .order_by()
+            .values("room")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        rooms = (
+            Room.objects.filter(communication_participants__user=request.user)
+            .annotate(
+                my_last_read_at=Coalesce(
+                    F("communication_participants__last_read_at"),
+                    Value(datetime.min.replace(tzinfo=dt_timezone.utc)),
+                )
+            )
+            .annotate(
+                unread_count=Coalesce(
+                    Subquery(unread, output_field=IntegerField()), Value(0)
+                )
+            )
+            .select_related("last_message__sender", "last_message__room")
+            .prefetch_related("communication_participants__user")
+        )
+
+        room_type = request.query_params.get("room_type")
+        if room_type:
+            rooms = rooms.filter(room_type=room_type)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rooms, request)
+        serializer = InboxRoomSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
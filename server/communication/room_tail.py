@@ -0,0 +1,367 @@
+import json
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+
+from .fanout import encode_frame
+from .metrics import metrics
+from .models import Message, Room
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class RoomTail:
+    """
+    A cached page: the newest entries of a room (newest first) and the
+    number of messages in the whole room
+    """
+
+    def __init__(self, entries, count):
+        self.entries = entries
+        self.count = count
+
+
+class InMemoryRoomTail:
+    """
+    Process-local tail cache with the same semantics as RedisRoomTail.
+    Used by tests and single-process development setups.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tails = {}  # room_id -> (expires_at, [entry, ...], count)
+        self._generations = {}  # room_id -> generation
+
+    def _live(self, room_id):
+        tail = self._tails.get(room_id)
+        if tail is not None and tail[0] <= time.time():
+            del self._tails[room_id]
+            return None
+        return tail
+
+    def generation(self, room_id):
+        with self._lock:
+            return self._generations.get(str(room_id), 0)
+
+    def get(self, room_id, limit):
+        with self._lock:
+            tail = self._live(str(room_id))
+        if tail is None:
+            return None
+        _, entries, count = tail
+        if not entries or min(limit, count) > len(entries):
+            return None
+        return RoomTail([json.loads(entry) for entry in entries[:limit]], count)
+
+    def fill(self, room_id, entries, count, generation):
+        room_id = str(room_id)
+        with self._lock:
+            if self._generations.get(room_id, 0) != generation:
+                return False
+            self._tails[room_id] = (
+                time.time() + self.ttl,
+                list(entries[: self.size]),
+                count,
+            )
+            return True
+
+    def append(self, room_id, entries):
+        room_id = str(room_id)
+        with self._lock:
+            self._generations[room_id] = self._generations.get(room_id, 0) + 1
+            tail = self._live(room_id)
+            if tail is not None:
+                _, cached, count = tail
+                cached = (list(reversed(entries)) + cached)[: self.size]
+                self._tails[room_id] = (tail[0], cached, count + len(entries))
+
+    def invalidate(self, room_id):
+        room_id = str(room_id)
+        with self._lock:
+            self._generations[room_id] = self._generations.get(room_id, 0) + 1
+            self._tails.pop(room_id, None)
+
+
+class RedisRoomTail:
+    """
+    Tail cache on Redis: a list of encoded messages per room, newest first
+    and trimmed to SIZE, next to a hash holding the room's message count and
+    a generation bumped by every append and invalidation. A fill computed
+    from the database is only stored if the generation did not move while
+    it was being read, so a message saved meanwhile cannot go missing.
+    """
+
+    def __init__(self, url, size, ttl, prefix="room_tail"):
+        self.url = url
+        self.size = size
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = None
+
+    def _keys(self, room_id):
+        key = f"{self.prefix}:{room_id}"
+        return key, f"{key}:meta"
+
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def generation(self, room_id):
+        _, meta = self._keys(room_id)
+        return int(self.client().hget(meta, "generation") or 0)
+
+    def get(self, room_id, limit):
+        key, meta = self._keys(room_id)
+        pipe = self.client().pipeline(transaction=False)
+        pipe.lrange(key, 0, limit - 1)
+        pipe.llen(key)
+        pipe.hget(meta, "count")
+        entries, length, count = pipe.execute()
+        if not length or count is None or min(limit, int(count)) > length:
+            return None
+        return RoomTail([json.loads(entry) for entry in entries], int(count))
+
+    def fill(self, room_id, entries, count, generation):
+        key, meta = self._keys(room_id)
+        with self.client().pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(meta)
+                if int(pipe.hget(meta, "generation") or 0) != generation:
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                if entries:
+                    pipe.rpush(key, *entries[: self.size])
+                pipe.hset(meta, "count", count)
+                pipe.expire(key, self.ttl)
+                pipe.expire(meta, self.ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def append(self, room_id, entries):
+        key, meta = self._keys(room_id)
+        pipe = self.client().pipeline(transaction=True)
+        pipe.hincrby(meta, "generation", 1)
+        # The count only matters while the list exists; a fill resets it
+        pipe.hincrby(meta, "count", len(entries))
+        pipe.lpushx(key, *entries)
+        pipe.ltrim(key, 0, self.size - 1)
+        pipe.expire(meta, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, room_id):
+        key, meta = self._keys(room_id)
+        pipe = self.client().pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hincrby(meta, "generation", 1)
+        pipe.expire(meta, self.ttl)
+        pipe.execute()
+
+
+_room_tail = None
+
+
+def get_room_tail():
+    """
+    The configured tail cache. ROOM_TAIL["BACKEND"] may be "redis", "memory"
+    or "auto" (Redis whenever the channel layer runs on Redis).
+    """
+    global _room_tail
+    if _room_tail is None:
+        config = getattr(settings, "ROOM_TAIL", {})
+        backend = config.get("BACKEND", "auto")
+        size = config.get("SIZE", 100)
+        ttl = config.get("TTL", 3600)
+        if backend == "auto":
+            layer = settings.CHANNEL_LAYERS.get("default", {}).get("BACKEND", "")
+            backend = "redis" if "channels_redis" in layer else "memory"
+
+        if backend == "redis":
+            _room_tail = RedisRoomTail(config["REDIS_URL"], size, ttl)
+        else:
+            _room_tail = InMemoryRoomTail(size, ttl)
+    return _room_tail
+
+
+@receiver(setting_changed)
+def reset_room_tail(setting, **kwargs):
+    global _room_tail
+    if setting in ("ROOM_TAIL", "CHANNEL_LAYERS"):
+        _room_tail = None
+
+
+# Rooms whose tail could not be updated or dropped because the cache was
+# unreachable; dropped as soon as it answers again, before it serves anything
+_stale_rooms = set()
+_stale_lock = threading.Lock()
+
+
+def _cache_error(action, error, room_id=None):
+    """Log and count a cache outage; an update lost for room_id marks it stale"""
+    metrics.counter("room_tail.errors").inc()
+    logger.warning(f"Room tail cache unavailable ({action}): {str(error)}")
+    if room_id is not None:
+        with _stale_lock:
+            _stale_rooms.add(str(room_id))
+
+
+def _drop_stale(tail):
+    """Invalidate the rooms whose updates were lost; raises while still down"""
+    with _stale_lock:
+        rooms = list(_stale_rooms)
+    for room_id in rooms:
+        tail.invalidate(room_id)
+        with _stale_lock:
+            _stale_rooms.discard(room_id)
+
+
+def encode_entry(message):
+    """A message as stored in the tail: MessageSerializer data, as JSON"""
+    # is_read depends on the readers, so it is recomputed on every read
+    data = MessageSerializer(message, context={"read_watermarks": {}}).data
+    return encode_frame(data)
+
+
+def append_messages(messages):
+    """
+    Push newly saved messages (oldest first) onto their rooms' tails once
+    the transaction saving them commits
+    """
+    messages = list(messages)
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.room_id, []).append(message)
+
+    def push():
+        # MessageSerializer reads room.id; load rooms the messages lack at once
+        missing = {
+            message.room_id
+            for message in messages
+            if not Message.room.is_cached(message)
+        }
+        rooms = Room.objects.in_bulk(missing) if missing else {}
+        for message in messages:
+            if message.room_id in rooms:
+                message.room = rooms[message.room_id]
+
+        tail = get_room_tail()
+        for room_id, room_messages in by_room.items():
+            room_messages.sort(key=lambda message: (message.sent_at, str(message.pk)))
+            entries = [encode_entry(message) for message in room_messages]
+            try:
+                _drop_stale(tail)
+                tail.append(room_id, entries)
+            except redis.RedisError as e:
+                # The messages are saved; only the cache missed them
+                _cache_error("append", e, room_id)
+                continue
+            metrics.counter("room_tail.appends").inc(len(room_messages))
+
+    if by_room:
+        transaction.on_commit(push)
+
+
+def invalidate_room(room_id):
+    """
+    Drop a room's tail once the transaction editing or deleting one of its
+    messages commits (earlier, a concurrent fill could store the old rows)
+    """
+
+    def drop():
+        tail = get_room_tail()
+        try:
+            _drop_stale(tail)
+            tail.invalidate(room_id)
+        except redis.RedisError as e:
+            _cache_error("invalidate", e, room_id)
+            return
+        metrics.counter("room_tail.invalidations").inc()
+
+    transaction.on_commit(drop)
+
+
+def _with_read_state(entries, watermarks):
+    # Same rule as Message.is_read_with, on serialized messages
+    for entry in entries:
+        sent_at = parse_datetime(entry["sent_at"])
+        sender_id = (entry.get("sender") or {}).get("id")
+        entry["is_read"] = all(
+            read_at is not None and read_at >= sent_at
+            for user_id, read_at in watermarks.items()
+            if user_id != sender_id
+        )
+    return entries
+
+
+def first_page(room_id, limit, watermarks):
+    """
+    The newest limit messages of a room, serialized, and the room's message
+    count, from the tail cache; None on a miss or when the cache is down
+    """
+    tail = get_room_tail()
+    if limit > tail.size:
+        return None
+    try:
+        _drop_stale(tail)
+        cached = tail.get(room_id, limit)
+    except redis.RedisError as e:
+        _cache_error("get", e)
+        return None
+    if cached is None:
+        metrics.counter("room_tail.misses").inc()
+        return None
+    metrics.counter("room_tail.hits").inc()
+    seen = set()
+    entries = []
+    for entry in cached.entries:
+        # A save racing a fill may have been pushed twice
+        if entry["id"] not in seen:
+            seen.add(entry["id"])
+            entries.append(entry)
+    cached.entries = _with_read_state(entries, watermarks)
+    return cached
+
+
+def load(room_id):
+    """
+    Fill a room's tail from the database after a miss. Nothing is stored if
+    a message of the room was saved or changed meanwhile, or if the cache
+    is down.
+    """
+    tail = get_room_tail()
+    try:
+        _drop_stale(tail)
+        generation = tail.generation(room_id)
+    except redis.RedisError as e:
+        _cache_error("generation", e)
+        return False
+    messages = Message.objects.filter(room_id=room_id)
+    newest = list(
+        messages.select_related("sender", "room").order_by("-sent_at", "-id")[
+            : tail.size
+        ]
+    )
+    count = len(newest) if len(newest) < tail.size else messages.count()
+    try:
+        stored = tail.fill(
+            room_id, [encode_entry(message) for message in newest], count, generation
+        )
+    except redis.RedisError as e:
+        _cache_error("fill", e)
+        return False
+    if stored:
+        metrics.counter("room_tail.fills").inc()
+    return stored
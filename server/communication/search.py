@@ -0,0 +1,314 @@
+import base64
+import binascii
+import html
+import json
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+from .models import Message, Participant
+
+# Snippet highlight markers; replaced with <mark> after the text is escaped
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+SNIPPET_WORDS = 16
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Only text and image captions are searchable; other types hold URLs or labels
+SEARCHABLE_TYPES = "('text', 'image')"
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS communication_message_fts USING fts5(
+        content,
+        message_id UNINDEXED,
+        room_id UNINDEXED,
+        sent_at UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS communication_message_fts_insert
+    AFTER INSERT ON communication_message
+    WHEN NEW.message_type IN {SEARCHABLE_TYPES} AND NEW.content != ''
+    BEGIN
+        INSERT INTO communication_message_fts (content, message_id, room_id, sent_at)
+        VALUES (NEW.content, NEW.id, NEW.room_id, NEW.sent_at);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS communication_message_fts_update
+    AFTER UPDATE OF content, message_type, room_id, sent_at ON communication_message
+    BEGIN
+        DELETE FROM communication_message_fts WHERE message_id = OLD.id;
+        INSERT INTO communication_message_fts (content, message_id, room_id, sent_at)
+        SELECT NEW.content, NEW.id, NEW.room_id, NEW.sent_at
+        WHERE NEW.message_type IN {SEARCHABLE_TYPES} AND NEW.content != '';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS communication_message_fts_delete
+    AFTER DELETE ON communication_message
+    BEGIN
+        DELETE FROM communication_message_fts WHERE message_id = OLD.id;
+    END
+    """,
+]
+
+SQLITE_BACKFILL = f"""
+    INSERT INTO communication_message_fts (content, message_id, room_id, sent_at)
+    SELECT content, id, room_id, sent_at FROM communication_message
+    WHERE message_type IN {SEARCHABLE_TYPES} AND content != ''
+    """
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS communication_message_fts_insert",
+    "DROP TRIGGER IF EXISTS communication_message_fts_update",
+    "DROP TRIGGER IF EXISTS communication_message_fts_delete",
+    "DROP TABLE IF EXISTS communication_message_fts",
+]
+
+POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE communication_message ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        CASE WHEN message_type IN {SEARCHABLE_TYPES}
+        THEN to_tsvector('simple', coalesce(content, '')) END
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS communication_message_search_idx
+    ON communication_message USING GIN (search_vector)
+    """,
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS communication_message_search_idx",
+    "ALTER TABLE communication_message DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def install_search_index(connection):
+    """
+    Create the message search index for this database if it is missing:
+    an FTS5 table kept current by triggers on SQLite, a generated tsvector
+    column with a GIN index on Postgres. Safe to run repeatedly.
+    """
+    with connection.cursor() as db:
+        if connection.vendor == "sqlite":
+            existing = connection.introspection.table_names(db)
+            for statement in SQLITE_INSTALL:
+                db.execute(statement)
+            if "communication_message_fts" not in existing:
+                db.execute(SQLITE_BACKFILL)
+        elif connection.vendor == "postgresql":
+            for statement in POSTGRES_INSTALL:
+                db.execute(statement)
+
+
+def uninstall_search_index(connection):
+    statements = {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}
+    with connection.cursor() as db:
+        for statement in statements.get(connection.vendor, []):
+            db.execute(statement)
+
+
+class SearchError(Exception):
+    pass
+
+
+class SearchResults:
+    """
+    One page of hits: messages best match first, each with search_rank and
+    search_snippet set, plus the cursor of the next page (None on the last)
+    """
+
+    def __init__(self, messages, next_cursor):
+        self.messages = messages
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode("ascii")
+
+
+def decode_cursor(encoded):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+        rank, sent_at, message_id = key
+        return [float(rank), str(sent_at), str(message_id)]
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise SearchError("Invalid cursor")
+
+
+def highlight(snippet):
+    """Escape a raw snippet and turn the highlight markers into <mark> tags"""
+    escaped = html.escape(snippet or "")
+    escaped = escaped.replace(HIGHLIGHT_START, "<mark>")
+    return escaped.replace(HIGHLIGHT_END, "</mark>")
+
+
+class MessageSearchBackend:
+    """
+    Ranked full-text search over messages. Results are limited to rooms the
+    user participates in by joining against their participant rows in the
+    same query, so no per-message permission check is needed. Pages are
+    keyset-paginated on (rank, sent_at, id), best match first.
+    """
+
+    def search(self, user, query, room_id=None, cursor=None, limit=20):
+        terms = WORD_RE.findall(query or "")
+        if not terms:
+            raise SearchError("Search query must contain a word")
+
+        rooms_sql, rooms_params = (
+            Participant.objects.filter(user=user)
+            .values("room_id")
+            .query.sql_with_params()
+        )
+        if room_id is not None:
+            try:
+                room_id = Message._meta.get_field("room").get_db_prep_value(
+                    room_id, connection
+                )
+            except ValidationError:
+                raise SearchError("Invalid room_id")
+        after = decode_cursor(cursor) if cursor else None
+
+        with connection.cursor() as db:
+            sql, params = self.build_query(
+                terms, rooms_sql, list(rooms_params), room_id, after, limit + 1
+            )
+            db.execute(sql, params)
+            rows = db.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        messages = Message.objects.select_related("sender", "room").in_bulk(
+            [Message._meta.pk.to_python(row[0]) for row in rows]
+        )
+        page = []
+        for message_id, rank, snippet, sent_at in rows:
+            message = messages.get(Message._meta.pk.to_python(message_id))
+            if message is None:
+                continue  # deleted since the index row was read
+            message.search_rank = rank
+            message.search_snippet = highlight(snippet)
+            page.append(message)
+
+        next_cursor = None
+        if has_more and rows:
+            message_id, rank, _, sent_at = rows[-1]
+            next_cursor = encode_cursor([rank, str(sent_at), str(message_id)])
+        return SearchResults(page, next_cursor)
+
+    def build_query(self, terms, rooms_sql, rooms_params, room_id, after, limit):
+        """SQL returning (message id, rank, raw snippet, sent_at) rows"""
+        raise NotImplementedError
+
+
+class SQLiteMessageSearch(MessageSearchBackend):
+    """FTS5 index kept in sync with communication_message by triggers"""
+
+    def match_expression(self, terms):
+        # Quote every term so user input is never parsed as FTS5 syntax;
+        # the last one matches as a prefix for search-as-you-type
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def build_query(self, terms, rooms_sql, rooms_params, room_id, after, limit):
+        sql = f"""
+            SELECT message_id, score, snippet, sent_at FROM (
+                SELECT
+                    f.message_id AS message_id,
+                    -bm25(communication_message_fts) AS score,
+                    snippet(communication_message_fts, 0, %s, %s, '…', %s) AS snippet,
+                    f.sent_at AS sent_at
+                FROM communication_message_fts f
+                WHERE communication_message_fts MATCH %s
+                AND f.room_id IN ({rooms_sql})
+                {"AND f.room_id = %s" if room_id is not None else ""}
+            )
+        """
+        params = [
+            HIGHLIGHT_START,
+            HIGHLIGHT_END,
+            SNIPPET_WORDS,
+            self.match_expression(terms),
+            *rooms_params,
+        ]
+        if room_id is not None:
+            params.append(room_id)
+        if after:
+            sql += """
+                WHERE score < %s OR (score = %s AND (
+                    sent_at < %s OR (sent_at = %s AND message_id < %s)
+                ))
+            """
+            rank, sent_at, message_id = after
+            params += [rank, rank, sent_at, sent_at, message_id]
+        sql += " ORDER BY score DESC, sent_at DESC, message_id DESC LIMIT %s"
+        params.append(limit)
+        return sql, params
+
+
+class PostgresMessageSearch(MessageSearchBackend):
+    """Generated search_vector column on communication_message with a GIN index"""
+
+    def build_query(self, terms, rooms_sql, rooms_params, room_id, after, limit):
+        sql = f"""
+            SELECT id, score, snippet, sent_at FROM (
+                SELECT
+                    m.id,
+                    ts_rank_cd(m.search_vector, q) AS score,
+                    ts_headline(
+                        'simple', m.content, q, %s
+                    ) AS snippet,
+                    m.sent_at
+                FROM communication_message m,
+                    to_tsquery('simple', %s) q
+                WHERE m.search_vector @@ q
+                AND m.room_id IN ({rooms_sql})
+                {"AND m.room_id = %s" if room_id is not None else ""}
+            ) hits
+        """
+        params = [
+            f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_END}", '
+            f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}",
+            # Terms are plain words, so this is a safe AND of lexemes with
+            # prefix matching on the last one
+            " & ".join(terms) + ":*",
+            *rooms_params,
+        ]
+        if room_id is not None:
+            params.append(room_id)
+        if after:
+            sql += """
+                WHERE score < %s OR (score = %s AND (
+                    sent_at < %s::timestamptz
+                    OR (sent_at = %s::timestamptz AND id < %s::uuid)
+                ))
+            """
+            rank, sent_at, message_id = after
+            params += [rank, rank, sent_at, sent_at, message_id]
+        sql += " ORDER BY score DESC, sent_at DESC, id DESC LIMIT %s"
+        params.append(limit)
+        return sql, params
+
+
+def get_search_backend():
+    """The search backend for the default database"""
+    if connection.vendor == "postgresql":
+        return PostgresMessageSearch()
+    if connection.vendor == "sqlite":
+        return SQLiteMessageSearch()
+    raise SearchError(f"Message search is not supported on {connection.vendor}")
+
+
+def search_messages(user, query, room_id=None, cursor=None, limit=20):
+    """Search the messages of every room user participates in"""
+    return get_search_backend().search(user, query, room_id, cursor, limit)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.files import File
 from .models import (
     IncomingCallNotification,
     Room,
@@ -10,7 +11,8 @@ from .models import (
     MediaFile,
 )
 from rest_framework import serializers
-from .utils import CloudinaryHelper
+from .image_variants import pick_variant, store_image
+from .media_storage import get_media_storage, media_url
 
 
 User = get_user_model()
@@ -27,12 +29,52 @@ class ParticipantSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Participant
-        fields = ["user", "joined_at", "is_admin", "is_muted"]
+        fields = [
+            "user",
+            "joined_at",
+            "is_admin",
+            "is_muted",
+            "last_read_message",
+            "last_read_at",
+        ]
+        read_only_fields = ["last_read_message", "last_read_at"]
+
+
+def read_watermarks_for(participants):
+    """Map user_id -> last_read_at for MessageSerializer's read_watermarks context"""
+    return {p.user_id: p.last_read_at for p in participants}
+
+
+class MediaUrlField(serializers.CharField):
+    """
+    A stored media value, rendered as its URL on the storage backend. On
+    write it takes either a stored value or an uploaded file, which the
+    serializer saves through the media storage (see MessageSerializer).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("required", False)
+        kwargs.setdefault("allow_null", True)
+        kwargs.setdefault("allow_blank", True)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, File):
+            return data
+        return super().to_internal_value(data)
+
+    def to_representation(self, value):
+        return media_url(value)
 
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
+    image = MediaUrlField()
+    video = MediaUrlField()
+    audio = MediaUrlField()
+    document = MediaUrlField()
     room_id = serializers.UUIDField(source="room.id", read_only=True)
+    is_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -47,15 +89,83 @@ class MessageSerializer(serializers.ModelSerializer):
             "video",
             "audio",
             "document",
+            "image_variants",
+            "image_placeholder",
             "latitude",
             "longitude",
             "sent_at",
+            "status",
             "is_read",
             "call_duration",
             "call_type",
             "call_status",
         ]
-        read_only_fields = ["room_id", "sender", "sent_at", "is_read"]
+        read_only_fields = [
+            "room_id",
+            "sender",
+            "sent_at",
+            "status",
+            "is_read",
+            "image_variants",
+            "image_placeholder",
+        ]
+
+    def get_is_read(self, obj):
+        # Derived from read watermarks; pass "read_watermarks" in the context
+        # when serializing many messages of one room to avoid a query each
+        watermarks = self.context.get("read_watermarks")
+        if watermarks is not None:
+            return obj.is_read_with(watermarks)
+        return obj.is_read
+
+    def _store_uploads(self, validated_data):
+        """Replace uploaded media files by their URL on the storage backend"""
+        for field in ("image", "video", "audio", "document"):
+            file = validated_data.get(field)
+            if not isinstance(file, File):
+                continue
+            if field == "image":
+                stored = store_image(file)
+                validated_data["image_variants"] = stored["variants"]
+                validated_data["image_placeholder"] = stored["placeholder"]
+            else:
+                stored = get_media_storage().save(file, field)
+            if not stored:
+                raise serializers.ValidationError({field: "Upload failed"})
+            validated_data[field] = stored["url"]
+
+    def create(self, validated_data):
+        self._store_uploads(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._store_uploads(validated_data)
+        return super().update(instance, validated_data)
+
+
+class MessageSearchResultSerializer(serializers.ModelSerializer):
+    """A search hit: the message with its rank and highlighted snippet"""
+
+    sender = UserSerializer(read_only=True)
+    room_id = serializers.UUIDField(source="room.id", read_only=True)
+    room_name = serializers.CharField(source="room.name", read_only=True)
+    rank = serializers.FloatField(source="search_rank", read_only=True)
+    snippet = serializers.CharField(source="search_snippet", read_only=True)
+
+    class Meta:
+        model = Message
+        fields = [
+            "id",
+            "room_id",
+            "room_name",
+            "sender",
+            "content",
+            "message_type",
+            "sent_at",
+            "rank",
+            "snippet",
+        ]
+        read_only_fields = fields
 
 
 class RoomSerializer(serializers.ModelSerializer):
@@ -77,11 +187,27 @@ class RoomSerializer(serializers.ModelSerializer):
             "profile_image",
             "participants",
             "last_message",
+            "last_activity_at",
         ]
+        read_only_fields = ["last_activity_at"]
 
     def get_last_message(self, obj):
-        last_message = obj.messages.order_by("-sent_at").first()
-        return MessageSerializer(last_message).data if last_message else None
+        # Denormalized pointer; select_related("last_message__sender",
+        # "last_message__room") makes this free when listing rooms
+        last_message = obj.last_message
+        if not last_message:
+            return None
+        context = {
+            "read_watermarks": read_watermarks_for(obj.communication_participants.all())
+        }
+        return MessageSerializer(last_message, context=context).data
+
+
+class InboxRoomSerializer(RoomSerializer):
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RoomSerializer.Meta):
+        fields = RoomSerializer.Meta.fields + ["unread_count"]
 
 
 class CallLogSerializer(serializers.ModelSerializer):
@@ -106,8 +232,16 @@ class MediaFileSerializer(serializers.ModelSerializer):
             "uploaded_at",
             "file_url",
             "public_id",
+            "image_variants",
+            "image_placeholder",
+        ]
+        read_only_fields = [
+            "uploaded_at",
+            "file_url",
+            "public_id",
+            "image_variants",
+            "image_placeholder",
         ]
-        read_only_fields = ["uploaded_at", "file_url", "public_id"]
 
     def get_file_url(self, obj):
         """
@@ -116,15 +250,15 @@ class MediaFileSerializer(serializers.ModelSerializer):
         width = self.context.get("width")
         height = self.context.get("height")
 
-        if obj.public_id:
-            return CloudinaryHelper.generate_transformation_url(
-                obj.public_id, width=width, height=height
-            )
-        return None
+        # Pick a stored size instead of asking Cloudinary for a transformation
+        variant = pick_variant(obj.image_variants, width, height)
+        if variant:
+            return variant["url"]
+        return media_url(obj.public_id or obj.file, width=width, height=height)
 
     def create(self, validated_data):
         """
-        Custom create method to handle Cloudinary upload
+        Custom create method to handle the media upload
         """
         file = validated_data.pop("file")
         user = self.context["request"].user
@@ -134,17 +268,19 @@ class MediaFileSerializer(serializers.ModelSerializer):
             "media_type", "image" if file.content_type.startswith("image") else "video"
         )
 
-        # Upload to Cloudinary based on media type
+        # Upload to the media storage backend based on media type
         if media_type == "image":
-            upload_result = CloudinaryHelper.upload_image(file)
-        elif media_type == "video":
-            upload_result = CloudinaryHelper.upload_video(file)
+            upload_result = store_image(file)
+            validated_data["image_variants"] = upload_result["variants"]
+            validated_data["image_placeholder"] = upload_result["placeholder"]
         else:
-            upload_result = CloudinaryHelper.upload_image(file, resource_type="raw")
+            upload_result = get_media_storage().save(file, media_type)
 
         if upload_result:
             validated_data["file"] = upload_result["url"]
-            validated_data["public_id"] = upload_result["public_id"]
+            validated_data["public_id"] = upload_result.get(
+                "public_id", upload_result.get("name")
+            )
             validated_data["user"] = user
 
             return super().create(validated_data)
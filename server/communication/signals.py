@@ -0,0 +1,97 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .media_storage import release_image_variants, release_media
+from .membership import invalidate_room_members
+from .models import (
+    CallInvitation,
+    IncomingCallNotification,
+    Message,
+    Participant,
+    SyncEvent,
+)
+from .room_tail import append_messages, invalidate_room
+from .search import install_search_index
+
+
+@receiver(post_delete, sender=Message)
+def release_message_media(sender, instance, **kwargs):
+    """
+    Drop the deleted message's references to its stored media, so local
+    blobs no longer used by any message are removed.
+    """
+    for resource_type in ("image", "video", "audio", "document"):
+        release_media(getattr(instance, resource_type), resource_type=resource_type)
+    release_image_variants(instance.image_variants)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Make sure the message search index exists after every migrate, including
+    on databases whose tables were created by syncdb (such as test runs)
+    """
+    if sender.name == "communication":
+        install_search_index(connections[using])
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def log_message_change(sender, instance, **kwargs):
+    SyncEvent.record(SyncEvent.MESSAGE, instance.room_id, instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def update_room_tail(sender, instance, created, **kwargs):
+    if created:
+        append_messages([instance])
+    else:
+        invalidate_room(instance.room_id)
+
+
+@receiver(post_delete, sender=Message)
+def drop_room_tail(sender, instance, **kwargs):
+    invalidate_room(instance.room_id)
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_save, sender="webcall.Participant")
+def member_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_room_members(instance.room_id, sender)
+
+
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender="webcall.Participant")
+def member_deleted(sender, instance, **kwargs):
+    invalidate_room_members(instance.room_id, sender)
+
+
+@receiver(post_save, sender=Participant)
+def log_member_joined(sender, instance, created, **kwargs):
+    if created:
+        SyncEvent.record(SyncEvent.MEMBERSHIP, instance.room_id, instance.user_id)
+
+
+@receiver(post_delete, sender=Participant)
+def log_member_left(sender, instance, **kwargs):
+    # The rest of the room hears about it, and so does the member, who can no
+    # longer see the room's events
+    SyncEvent.record(
+        SyncEvent.MEMBERSHIP,
+        instance.room_id,
+        instance.user_id,
+        user_ids=(None, instance.user_id),
+    )
+
+
+@receiver(post_save, sender=IncomingCallNotification)
+@receiver(post_save, sender=CallInvitation)
+def log_call_change(sender, instance, **kwargs):
+    SyncEvent.record(
+        sender.sync_kind,
+        instance.room_id,
+        instance.pk,
+        user_ids=[getattr(instance, field) for field in sender.sync_user_fields],
+    )
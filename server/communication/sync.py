@@ -0,0 +1,201 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import (
+    CallInvitation,
+    IncomingCallNotification,
+    Message,
+    Participant,
+    SyncEvent,
+)
+from .serializers import (
+    CallInvitationSerializer,
+    IncomingCallNotificationSerializer,
+    MessageSerializer,
+    UserSerializer,
+    read_watermarks_for,
+)
+
+
+def _config():
+    return getattr(settings, "SYNC", {})
+
+
+def max_page_size():
+    return _config().get("PAGE_SIZE", 500)
+
+
+class SyncError(Exception):
+    pass
+
+
+class SyncTokenExpired(SyncError):
+    """The token is older than the retained events; the client must refetch"""
+
+
+def settling_from():
+    """
+    The lowest id among events written in the last SETTLE_SECONDS, or None.
+    Ids are allocated when a transaction inserts its event, not when it
+    commits, so a lower id may still become visible after a higher one.
+    Tokens stop short of recent events until that has had time to happen.
+    """
+    cutoff = timezone.now() - timedelta(seconds=_config().get("SETTLE_SECONDS", 2))
+    return SyncEvent.objects.filter(created_at__gt=cutoff).aggregate(
+        first=Min("id")
+    )["first"]
+
+
+def head_token():
+    """The token of the newest event: a starting point that skips history"""
+    settling = settling_from()
+    if settling is not None:
+        return str(settling - 1)
+    return str(SyncEvent.objects.aggregate(head=Max("id"))["head"] or 0)
+
+
+def parse_token(token):
+    try:
+        position = int(token)
+    except (TypeError, ValueError):
+        raise SyncError("Invalid sync token")
+    if position < 0:
+        raise SyncError("Invalid sync token")
+    return position
+
+
+def events_for(user, position):
+    """The user's events after position: their rooms' events and their own"""
+    rooms = Participant.objects.filter(user=user).values("room_id")
+    return SyncEvent.objects.filter(id__gt=position).filter(
+        Q(user_id__isnull=True, room_id__in=rooms) | Q(user_id=user.pk)
+    )
+
+
+def changes_since(user, token, limit=None):
+    """
+    Everything that changed for user after token, at most limit events
+    (PAGE_SIZE by default), collapsed to the current state of each changed
+    object. Returns the response body: the next "sync_token", "has_more"
+    and the changed "messages", "deleted_message_ids", "memberships",
+    "read_watermarks", "call_notifications" and "call_invitations".
+    """
+    position = parse_token(token)
+    limit = min(limit or max_page_size(), max_page_size())
+
+    if position:
+        oldest = SyncEvent.objects.aggregate(oldest=Min("id"))["oldest"]
+        if oldest is not None and position < oldest - 1:
+            raise SyncTokenExpired("Sync token has expired")
+
+    events = events_for(user, position)
+    settling = settling_from()
+    if settling is not None:
+        events = events.filter(id__lt=settling)
+    events = list(
+        events.order_by("id")
+        .values_list("id", "kind", "room_id", "object_id")[: limit + 1]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    # Several events for one object collapse into its current state
+    changed = defaultdict(set)
+    for _, kind, room_id, object_id in events:
+        changed[kind].add((room_id, object_id))
+
+    return {
+        "sync_token": str(events[-1][0]) if events else str(position),
+        "has_more": has_more,
+        **_messages(changed[SyncEvent.MESSAGE]),
+        **_members(changed[SyncEvent.MEMBERSHIP], changed[SyncEvent.READ]),
+        "call_notifications": IncomingCallNotificationSerializer(
+            _calls(IncomingCallNotification, changed[SyncEvent.CALL_NOTIFICATION]),
+            many=True,
+        ).data,
+        "call_invitations": CallInvitationSerializer(
+            _calls(CallInvitation, changed[SyncEvent.CALL_INVITATION]), many=True
+        ).data,
+    }
+
+
+def _messages(changed):
+    ids = [Message._meta.pk.to_python(object_id) for _, object_id in changed]
+    messages = Message.objects.select_related("sender", "room").in_bulk(ids)
+    deleted = [str(message_id) for message_id in ids if message_id not in messages]
+
+    # is_read comes from each room's watermarks, loaded in one query
+    by_room = defaultdict(list)
+    for message in messages.values():
+        by_room[message.room_id].append(message)
+    participants = defaultdict(list)
+    for participant in Participant.objects.filter(room_id__in=by_room).only(
+        "room_id", "user_id", "last_read_at"
+    ):
+        participants[participant.room_id].append(participant)
+
+    data = []
+    for room_id, room_messages in by_room.items():
+        context = {"read_watermarks": read_watermarks_for(participants[room_id])}
+        data += MessageSerializer(room_messages, many=True, context=context).data
+    data.sort(key=lambda message: (message["sent_at"], message["id"]))
+    return {"messages": data, "deleted_message_ids": sorted(deleted)}
+
+
+def _members(membership_changes, read_changes):
+    """Current membership and read watermark of each (room, user) that changed"""
+    keys = membership_changes | read_changes
+    participants = {}
+    if keys:
+        # Rooms x users is a superset of the keys; the extra rows are ignored
+        candidates = Participant.objects.filter(
+            room_id__in={room_id for room_id, _ in keys},
+            user_id__in={int(user_id) for _, user_id in keys},
+        ).select_related("user")
+        participants = {(p.room_id, str(p.user_id)): p for p in candidates}
+
+    memberships = []
+    for room_id, user_id in sorted(membership_changes, key=str):
+        participant = participants.get((room_id, user_id))
+        if participant is None:
+            memberships.append(
+                {"room_id": str(room_id), "user_id": int(user_id), "status": "left"}
+            )
+        else:
+            memberships.append(
+                {
+                    "room_id": str(room_id),
+                    "user_id": participant.user_id,
+                    "status": "joined",
+                    "user": UserSerializer(participant.user).data,
+                    "joined_at": participant.joined_at,
+                    "is_admin": participant.is_admin,
+                }
+            )
+
+    watermarks = []
+    for room_id, user_id in sorted(read_changes, key=str):
+        participant = participants.get((room_id, user_id))
+        if participant is not None:
+            watermarks.append(
+                {
+                    "room_id": str(room_id),
+                    "user_id": participant.user_id,
+                    "last_read_message_id": participant.last_read_message_id,
+                    "last_read_at": participant.last_read_at,
+                }
+            )
+    return {"memberships": memberships, "read_watermarks": watermarks}
+
+
+def _calls(model, changed):
+    users = [field.removesuffix("_id") for field in model.sync_user_fields]
+    return (
+        model.objects.filter(pk__in=[object_id for _, object_id in changed])
+        .select_related("room", *users)
+        .order_by("created_at")
+    )
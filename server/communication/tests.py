@@ -1,3 +1,2595 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import hmac
+import io
+import json
+import math
+import os
+import signal
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import redis
+from PIL import Image
+from channels.layers import InMemoryChannelLayer
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import re_path
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from channels.db import database_sync_to_async
+from .models import (
+    Room,
+    Participant,
+    Message,
+    DirectRoomKey,
+    MediaJob,
+    MediaBlob,
+    MediaFile,
+    IncomingCallNotification,
+    CallInvitation,
+    PushDelivery,
+    SyncEvent,
+)
+from . import media_jobs
+from .media_storage import get_media_storage, media_url, release_media, storage_for
+from .image_variants import generate_variants, pick_variant, render_variants
+from .serializers import MediaFileSerializer, MessageSerializer
+from .utils import MediaProcessor
+from .chat_consumer import ChatConsumer
+from .metrics import metrics
+from .middleware import ConnectTicketAuthMiddleware
+from .connect_tickets import verify_ticket
+from .fanout import chat_message_event
+from .flow_control import OutboundQueue, RateLimiter
+from .write_behind import MessageWriteBehind, _flush_on_sigterm, write_behind
+from .typing import RoomTypingAggregator, TypingView
+from .presence import InMemoryPresence, RedisPresence, get_presence, reset_presence
+from .room_tail import InMemoryRoomTail, get_room_tail
+from .membership import get_membership_cache, is_room_member, room_members
+from .call_expiry import sweep
+from .fake_push_provider import FakePushProvider
+from .notification_service import NotificationService
+from .push import PushDispatcher, enqueue, purge_deliveries
+from .webrtc_config import WebRTCConfig, mint_turn_credentials
+from webcall.models import Participant as WebcallParticipant, Room as WebcallRoom
+
+User = get_user_model()
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+}
+
+
+def jpeg_bytes(size=(64, 48), color=(200, 40, 40), exif=None):
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="JPEG", exif=exif or b"")
+    return output.getvalue()
+
+
+def fake_image_upload(url):
+    """What MediaProcessor.upload_image returns, for tests that patch it"""
+    return {
+        "url": url,
+        "public_id": url,
+        "variants": {"full": {"url": url, "width": 64, "height": 48}},
+        "placeholder": "",
+    }
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class RoomMessagesCursorPaginationTests(APITestCase):
+    """Test cases for keyset pagination of room message history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", email="alice@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.room = Room.objects.create(name="History", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+
+        self.messages = [
+            Message.objects.create(room=self.room, sender=self.user, content=str(i))
+            for i in range(25)
+        ]
+        self.url = reverse("room-messages", args=[f"{self.room.id}/"])
+
+    def test_walk_history_with_before_cursor(self):
+        """Following before cursors returns every message exactly once, newest first"""
+        seen = []
+        params = {"pagination": "cursor", "page_size": 10}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(m["content"] for m in response.data["results"])
+            if not response.data["before"]:
+                break
+            params = {"before": response.data["before"], "page_size": 10}
+
+        self.assertEqual(seen, [str(i) for i in reversed(range(25))])
+
+    def test_after_cursor_returns_newer_messages(self):
+        """An after cursor returns only messages newer than the cursor row"""
+        first = self.client.get(self.url, {"pagination": "cursor", "page_size": 5})
+        older = self.client.get(
+            self.url, {"before": first.data["before"], "page_size": 5}
+        )
+
+        newer = self.client.get(
+            self.url, {"after": older.data["after"], "page_size": 5}
+        )
+        self.assertEqual(
+            [m["content"] for m in newer.data["results"]],
+            [m["content"] for m in first.data["results"]],
+        )
+
+    def test_invalid_cursor(self):
+        """A malformed cursor is rejected"""
+        response = self.client.get(self.url, {"before": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_pagination_still_default(self):
+        """Without cursor parameters the response keeps its page-number shape"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["count"], 25)
+
+
+class InboxViewTests(APITestCase):
+    """Test cases for the activity-ordered inbox"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="bob", email="bob@example.com", password="password123"
+        )
+        self.other = User.objects.create_user(
+            username="carol", email="carol@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("inbox")
+
+    def _make_rooms(self, count):
+        rooms = []
+        for i in range(count):
+            room = Room.objects.create(name=f"Room {i}", room_type="group")
+            Participant.objects.create(user=self.user, room=room)
+            Participant.objects.create(user=self.other, room=room)
+            rooms.append(room)
+        return rooms
+
+    def test_last_message_pointer_maintained(self):
+        """Creating a message moves the room's last_message pointer"""
+        room = self._make_rooms(1)[0]
+        message = Message.objects.create(room=room, sender=self.other, content="hi")
+
+        room.refresh_from_db()
+        self.assertEqual(room.last_message_id, message.id)
+        self.assertEqual(room.last_activity_at, message.sent_at)
+
+        message.delete()
+        room.refresh_from_db()
+        self.assertIsNone(room.last_message)
+
+    def test_ordered_by_activity(self):
+        """Rooms are listed most recently active first"""
+        first, second, third = self._make_rooms(3)
+        Message.objects.create(room=second, sender=self.other, content="old")
+        Message.objects.create(room=first, sender=self.other, content="new")
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [room["name"] for room in response.data["results"]]
+        self.assertEqual(names[:2], ["Room 0", "Room 1"])
+        self.assertEqual(response.data["results"][0]["last_message"]["content"], "new")
+
+    def test_constant_number_of_queries(self):
+        """A page of the inbox costs the same queries for 3 or 30 rooms"""
+        for room in self._make_rooms(3):
+            Message.objects.create(room=room, sender=self.other, content="hello")
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+        for room in self._make_rooms(27):
+            Message.objects.create(room=room, sender=self.other, content="hello")
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data["results"]), 30)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ReadWatermarkTests(APITestCase):
+    """Test cases for per-participant read watermarks"""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(
+            username="dave", email="dave@example.com", password="password123"
+        )
+        self.sender = User.objects.create_user(
+            username="erin", email="erin@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+        self.room = Room.objects.create(name="Backlog", room_type="direct")
+        Participant.objects.create(user=self.reader, room=self.room)
+        Participant.objects.create(user=self.sender, room=self.room)
+        self.messages = [
+            Message.objects.create(room=self.room, sender=self.sender, content=str(i))
+            for i in range(40)
+        ]
+        self.url = reverse("room-mark-read", args=[f"{self.room.id}/"])
+
+    def test_mark_backlog_read_in_constant_queries(self):
+        """Marking the whole backlog read is a lookup, an UPDATE and a sync event"""
+        with self.assertNumQueries(3):
+            response = self.client.post(self.url)
+        self.assertTrue(response.data["updated"])
+
+        participant = Participant.objects.get(room=self.room, user=self.reader)
+        self.assertEqual(participant.last_read_message_id, self.messages[-1].id)
+        self.assertEqual(participant.unread_count(), 0)
+        self.assertTrue(self.messages[-1].is_read)
+
+    def test_watermark_never_moves_backwards(self):
+        """Marking an older message read leaves the watermark in place"""
+        self.client.post(self.url, {"message_id": str(self.messages[30].id)})
+        response = self.client.post(
+            self.url, {"message_id": str(self.messages[10].id)}
+        )
+        self.assertFalse(response.data["updated"])
+        self.assertEqual(
+            response.data["last_read_message_id"], str(self.messages[30].id)
+        )
+
+    def test_derived_read_state_and_unread_count(self):
+        """is_read, read_by and the inbox unread count follow the watermark"""
+        self.messages[19].mark_as_read(self.reader)
+
+        self.assertTrue(self.messages[5].is_read)
+        self.assertIn(self.reader, self.messages[19].read_by)
+        self.assertFalse(self.messages[20].is_read)
+
+        response = self.client.get(reverse("inbox"))
+        self.assertEqual(response.data["results"][0]["unread_count"], 20)
+
+    def test_non_participant_cannot_mark_read(self):
+        """Users outside the room get a 404"""
+        outsider = User.objects.create_user(
+            username="frank", email="frank@example.com", password="password123"
+        )
+        self.client.force_authenticate(user=outsider)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WriteBehindTests(TestCase):
+    """Test cases for write-behind batched message persistence"""
+
+    def setUp(self):
+        metrics.reset()
+        self.user = User.objects.create_user(
+            username="gina", email="gina@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Busy", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+
+    def _message(self, content, **kwargs):
+        fields = {
+            "id": uuid.uuid4(),
+            "room_id": self.room.id,
+            "sender": self.user,
+            "content": content,
+            "message_type": "text",
+            "sent_at": timezone.now(),
+        }
+        fields.update(kwargs)
+        return Message(**fields)
+
+    async def test_batches_are_size_bounded(self):
+        """Buffered rows are inserted in batches of at most max_batch_size"""
+        buffer = MessageWriteBehind(max_batch_size=4, max_delay=10)
+        messages = [self._message(str(i)) for i in range(10)]
+        for message in messages:
+            buffer.enqueue(message)
+        await buffer.flush()
+
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(await Message.objects.filter(room=self.room).acount(), 10)
+        batch_sizes = metrics.snapshot()["write_behind.batch_size"]
+        self.assertEqual(batch_sizes["count"], 3)
+        self.assertEqual(batch_sizes["max"], 4)
+
+        # Timestamps are the ones assigned at enqueue time, and the room's
+        # inbox pointer follows the newest row
+        stored = await Message.objects.aget(id=messages[0].id)
+        self.assertEqual(stored.sent_at, messages[0].sent_at)
+        room = await Room.objects.aget(id=self.room.id)
+        self.assertEqual(room.last_message_id, messages[-1].id)
+
+    async def test_flusher_persists_after_max_delay(self):
+        """The flusher writes a partial batch once the delay bound passes"""
+        buffer = MessageWriteBehind(max_batch_size=100, max_delay=0.01)
+        buffer.enqueue(self._message("late"))
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if not len(buffer):
+                break
+
+        self.assertEqual(len(buffer), 0)
+        self.assertTrue(await Message.objects.filter(content="late").aexists())
+        self.assertIn("write_behind.lag_ms", metrics.snapshot())
+
+    async def test_unpersistable_row_does_not_block_batch(self):
+        """A row that cannot be inserted is dropped without losing its batch"""
+        buffer = MessageWriteBehind(max_batch_size=10, max_delay=10)
+        buffer.enqueue(self._message("ok-1"))
+        buffer.enqueue(self._message("bad", message_type=None))
+        buffer.enqueue(self._message("ok-2"))
+        await buffer.flush()
+
+        contents = [
+            m.content async for m in Message.objects.filter(room=self.room)
+        ]
+        self.assertCountEqual(contents, ["ok-1", "ok-2"])
+        self.assertEqual(metrics.snapshot()["write_behind.dropped"], 1)
+
+    async def test_full_buffer_refuses_new_rows(self):
+        """Past max_buffered, enqueue leaves the row to the caller"""
+        buffer = MessageWriteBehind(max_batch_size=10, max_delay=10, max_buffered=2)
+        self.assertTrue(buffer.enqueue(self._message("1")))
+        self.assertTrue(buffer.enqueue(self._message("2")))
+        self.assertFalse(buffer.enqueue(self._message("3")))
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(metrics.snapshot()["write_behind.overflow"], 1)
+        await buffer.flush()
+
+    @override_settings(
+        CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+        CHAT_WRITE_BEHIND={"ENABLED": True},
+    )
+    async def test_failed_flush_does_not_skip_disconnect_cleanup(self):
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        layer = get_channel_layer()
+        self.assertIn(f"room_{self.room.id}", layer.groups)
+
+        with mock.patch.object(
+            write_behind, "flush", side_effect=RuntimeError("database is down")
+        ):
+            await communicator.disconnect()
+
+        self.assertNotIn(f"room_{self.room.id}", layer.groups)
+        self.assertNotIn(f"user_{self.user.id}", layer.groups)
+
+    async def test_failed_side_effects_roll_back_the_batch(self):
+        """A batch is retried whole when its sync events cannot be written"""
+        buffer = MessageWriteBehind(max_batch_size=10, max_delay=10)
+        message = self._message("retried")
+        buffer.enqueue(message)
+        with mock.patch.object(
+            SyncEvent, "record_messages", side_effect=RuntimeError("locked")
+        ):
+            with self.assertRaises(RuntimeError):
+                await buffer.flush()
+        self.assertEqual(len(buffer), 1)
+        self.assertFalse(await Message.objects.filter(id=message.id).aexists())
+
+        await buffer.flush()
+
+        self.assertTrue(
+            await SyncEvent.objects.filter(
+                kind=SyncEvent.MESSAGE, object_id=str(message.id)
+            ).aexists()
+        )
+        room = await Room.objects.aget(id=self.room.id)
+        self.assertEqual(room.last_message_id, message.id)
+
+    def test_sigterm_flushes_before_exiting(self):
+        with mock.patch.object(write_behind, "flush_sync") as flush_sync, mock.patch(
+            "communication.write_behind.signal.signal"
+        ) as set_handler, mock.patch("communication.write_behind.os.kill") as kill:
+            _flush_on_sigterm(signal.SIGTERM, None)
+
+        flush_sync.assert_called_once_with()
+        set_handler.assert_called_once_with(signal.SIGTERM, signal.SIG_DFL)
+        kill.assert_called_once_with(os.getpid(), signal.SIGTERM)
+
+    async def test_pending_messages_are_found_by_room_and_id(self):
+        buffer = MessageWriteBehind(max_batch_size=10, max_delay=10)
+        message = self._message("pending")
+        buffer.enqueue(message)
+
+        self.assertTrue(buffer.has_pending(self.room.id))
+        self.assertTrue(buffer.has_pending(self.room.id, str(message.id)))
+        self.assertFalse(buffer.has_pending(self.room.id, str(uuid.uuid4())))
+        self.assertFalse(buffer.has_pending(uuid.uuid4()))
+        await buffer.flush()
+        self.assertFalse(buffer.has_pending(self.room.id))
+
+    @override_settings(
+        CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+        CHAT_WRITE_BEHIND={"ENABLED": True},
+    )
+    async def test_mark_read_flushes_only_for_a_buffered_message(self):
+        stored = await Message.objects.acreate(
+            room=self.room, sender=self.user, content="stored"
+        )
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        buffered = self._message("buffered")
+        write_behind._buffer.append((buffered, time.monotonic()))
+        real_flush = write_behind.flush
+        with mock.patch.object(write_behind, "flush", side_effect=real_flush) as flush:
+            for message in (stored, buffered):
+                await communicator.send_json_to(
+                    {"type": "mark_read", "message_id": str(message.id)}
+                )
+                while True:
+                    frame = await communicator.receive_json_from()
+                    if frame["type"] == "read_receipt":
+                        break
+                self.assertEqual(
+                    frame["receipt"]["last_read_message_id"], str(message.id)
+                )
+                if message is stored:
+                    flush.assert_not_called()
+        flush.assert_called_once_with()
+        await communicator.disconnect()
+
+    def test_flush_sync_drains_buffer(self):
+        """Shutdown flushing works without an event loop"""
+        write_behind._buffer.append((self._message("exit"), 0))
+        write_behind.flush_sync()
+        self.assertTrue(Message.objects.filter(content="exit").exists())
+
+    @override_settings(
+        CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+        CHAT_WRITE_BEHIND={"ENABLED": True},
+    )
+    async def test_consumer_fans_out_before_persisting(self):
+        """With write-behind on, the broadcast carries the final id and the
+        row appears once the connection closes"""
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({"type": "text_message", "content": "hi"})
+        while True:
+            frame = await communicator.receive_json_from()
+            if frame["type"] == "chat_message":
+                break
+        await communicator.disconnect()
+
+        message = await Message.objects.aget(id=frame["message"]["id"])
+        self.assertEqual(message.content, "hi")
+        self.assertEqual(message.sent_at.isoformat(), frame["message"]["sent_at"])
+
+
+class DirectRoomKeyTests(APITestCase):
+    """Test cases for the canonical direct-room pair index"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="hank", email="hank@example.com", password="password123"
+        )
+        self.other = User.objects.create_user(
+            username="ivy", email="ivy@example.com", password="password123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_direct_room_created_once_per_pair(self):
+        """Both users asking for the pair's room get the same one"""
+        first = self.client.post(reverse("direct-room"), {"recipient_id": "ivy"})
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        self.client.force_authenticate(user=self.other)
+        second = self.client.post(reverse("direct-room"), {"recipient_id": "hank"})
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["id"], second.data["id"])
+
+        key = DirectRoomKey.objects.get()
+        self.assertLess(key.user_low_id, key.user_high_id)
+        self.assertEqual(Participant.objects.filter(room=key.room).count(), 2)
+
+    def test_lookup_is_single_query(self):
+        """Finding an existing pair's room is one indexed lookup"""
+        room, _ = DirectRoomKey.get_or_create_room(self.user, self.other)
+        with self.assertNumQueries(1):
+            self.assertEqual(DirectRoomKey.find_room(self.other, self.user), room)
+
+        response = self.client.get(reverse("find-direct-room"), {"username": "ivy"})
+        self.assertEqual(response.data["id"], str(room.id))
+
+    def test_lost_creation_race_returns_winner(self):
+        """If a concurrent request created the pair first, its room is used"""
+        winner, _ = DirectRoomKey.get_or_create_room(self.user, self.other)
+        real_find_room = DirectRoomKey.find_room.__func__
+        calls = []
+
+        def stale_then_real(cls, user_a, user_b):
+            calls.append(1)
+            if len(calls) == 1:
+                return None
+            return real_find_room(cls, user_a, user_b)
+
+        with mock.patch.object(
+            DirectRoomKey, "find_room", classmethod(stale_then_real)
+        ):
+            room, created = DirectRoomKey.get_or_create_room(self.other, self.user)
+
+        self.assertFalse(created)
+        self.assertEqual(room, winner)
+        self.assertEqual(Room.objects.filter(room_type="direct").count(), 1)
+
+
+class PresenceStoreContract:
+    """Behaviour shared by every presence backend"""
+
+    def make_store(self, ttl):
+        raise NotImplementedError
+
+    async def test_transitions_are_per_user_not_per_device(self):
+        """Only the first device online and the last device leaving count"""
+        store = self.make_store(ttl=30)
+        self.assertTrue(await store.touch(1, "phone"))
+        self.assertFalse(await store.touch(1, "laptop"))
+        self.assertFalse(await store.touch(1, "phone"))  # heartbeat
+
+        self.assertFalse(await store.leave(1, "phone"))
+        self.assertTrue(await store.leave(1, "laptop"))
+        self.assertFalse(await store.leave(1, "laptop"))
+
+    async def test_device_stays_online_while_it_has_connections(self):
+        """A device with a socket per room leaves with its last socket"""
+        store = self.make_store(ttl=30)
+        self.assertTrue(await store.touch(1, "phone", connection="room-a"))
+        self.assertFalse(await store.touch(1, "phone", connection="room-b"))
+
+        self.assertFalse(await store.leave(1, "phone", connection="room-a"))
+        self.assertEqual(await store.online_users([1]), {1})
+        self.assertTrue(await store.leave(1, "phone", connection="room-b"))
+        self.assertEqual(await store.online_users([1]), set())
+
+    async def test_bulk_lookup_and_expiry(self):
+        """Devices that stop heartbeating drop out after the TTL"""
+        store = self.make_store(ttl=0.2)
+        await store.touch(1, "a")
+        await store.touch(2, "b")
+        self.assertEqual(await store.online_users([1, 2, 3]), {1, 2})
+
+        await asyncio.sleep(0.3)
+        await store.touch(2, "b")
+        self.assertEqual(await store.online_users([1, 2, 3]), {2})
+        self.assertEqual(store.online_users_sync([1, 2, 3]), {2})
+
+    async def test_scopes_are_independent(self):
+        """Being in a call does not count as being online in chat and vice versa"""
+        store = self.make_store(ttl=30)
+        await store.touch(1, "a", scope="call:x")
+        self.assertEqual(await store.online_users([1]), set())
+        self.assertEqual(await store.online_users([1], scope="call:x"), {1})
+
+
+class InMemoryPresenceTests(PresenceStoreContract, TestCase):
+    """Test cases for the in-process presence store"""
+
+    def make_store(self, ttl):
+        return InMemoryPresence(ttl)
+
+
+def _redis_available():
+    try:
+        return redis.Redis(host="localhost", socket_connect_timeout=0.2).ping()
+    except redis.exceptions.RedisError:
+        return False
+
+
+@unittest.skipUnless(_redis_available(), "Redis is not running on localhost")
+class RedisPresenceTests(PresenceStoreContract, TestCase):
+    """Test cases for the Redis presence store"""
+
+    def make_store(self, ttl):
+        prefix = f"test-presence-{uuid.uuid4().hex}"
+        return RedisPresence("redis://localhost:6379/15", ttl, prefix=prefix)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE={"BACKEND": "memory"}
+)
+class PresenceConsumerTests(APITestCase):
+    """Test cases for presence tracking over the chat WebSocket"""
+
+    def setUp(self):
+        reset_presence(setting="PRESENCE")
+        self.user = User.objects.create_user(
+            username="jack", email="jack@example.com", password="password123"
+        )
+        self.watcher = User.objects.create_user(
+            username="kate", email="kate@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Lobby", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+        Participant.objects.create(user=self.watcher, room=self.room)
+        self.application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+
+    async def _connect(self, user, device_id):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/chat/{self.room.id}/?device_id={device_id}"
+        )
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _frames(self, communicator, frame_type):
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.1):
+            frame = await communicator.receive_json_from()
+            if frame["type"] == frame_type:
+                frames.append(frame)
+        return frames
+
+    async def test_transitions_published_once_per_user(self):
+        """A second device neither re-announces nor, on leaving, hides the user"""
+        watcher = await self._connect(self.watcher, "w")
+        phone = await self._connect(self.user, "phone")
+        laptop = await self._connect(self.user, "laptop")
+
+        updates = await self._frames(watcher, "presence_update")
+        self.assertEqual(
+            [u["status"] for u in updates if u["username"] == "jack"], ["online"]
+        )
+
+        await phone.send_json_to({"type": "heartbeat"})
+        self.assertEqual(len(await self._frames(phone, "heartbeat_ack")), 1)
+
+        await phone.disconnect()
+        self.assertEqual(await self._frames(watcher, "presence_update"), [])
+        await laptop.disconnect()
+        updates = await self._frames(watcher, "presence_update")
+        self.assertEqual([u["status"] for u in updates], ["offline"])
+        await watcher.disconnect()
+
+    async def test_device_with_another_socket_stays_online(self):
+        """Closing one of a device's sockets does not take the user offline"""
+        watcher = await self._connect(self.watcher, "w")
+        first = await self._connect(self.user, "phone")
+        second = await self._connect(self.user, "phone")
+        await self._frames(watcher, "presence_update")
+
+        await first.disconnect()
+        self.assertEqual(await self._frames(watcher, "presence_update"), [])
+        online = await get_presence().online_users([self.user.id])
+        self.assertEqual(online, {self.user.id})
+
+        await second.disconnect()
+        updates = await self._frames(watcher, "presence_update")
+        self.assertEqual([u["status"] for u in updates], ["offline"])
+        await watcher.disconnect()
+
+    def test_bulk_presence_for_room(self):
+        """The presence endpoint answers for a whole room"""
+        asyncio.run(get_presence().touch(self.user.id, "phone"))
+        client = APIClient()
+        client.force_authenticate(user=self.watcher)
+
+        response = client.get(reverse("presence"), {"room_id": str(self.room.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["online"], [self.user.id])
+        self.assertEqual(response.data["offline"], [self.watcher.id])
+
+        participant = Participant.objects.get(room=self.room, user=self.user)
+        self.assertTrue(participant.is_online())
+
+    def test_bulk_presence_only_for_users_sharing_a_room(self):
+        stranger = User.objects.create_user(
+            username="lars", email="lars@example.com", password="password123"
+        )
+        for user in (self.user, stranger):
+            asyncio.run(get_presence().touch(user.id, "phone"))
+        client = APIClient()
+        client.force_authenticate(user=self.watcher)
+
+        response = client.get(
+            reverse("presence"),
+            {"user_ids": f"{self.user.id},{stranger.id},{self.watcher.id}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["online"], [self.user.id])
+        self.assertEqual(response.data["offline"], [self.watcher.id])
+
+
+class TypingAggregatorTests(TestCase):
+    """Test cases for per-room coalescing of typing events"""
+
+    async def _setup(self, interval=0.05, ttl=10):
+        self.layer = InMemoryChannelLayer()
+        self.channel = await self.layer.new_channel()
+        await self.layer.group_add("room_typing", self.channel)
+        self.idle = []
+        return RoomTypingAggregator(
+            "room_typing", self.layer, interval, ttl, on_idle=self.idle.append
+        )
+
+    async def _frames(self, wait):
+        await asyncio.sleep(wait)
+        frames = []
+        while True:
+            try:
+                frames.append(
+                    await asyncio.wait_for(self.layer.receive(self.channel), 0.01)
+                )
+            except asyncio.TimeoutError:
+                return frames
+
+    async def test_keystrokes_coalesce_into_one_frame(self):
+        """A burst of updates from several users is a single broadcast"""
+        aggregator = await self._setup()
+        for _ in range(20):
+            aggregator.update("1", "alice", True)
+            aggregator.update("2", "bob", True)
+
+        frames = await self._frames(0.08)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(
+            [user["username"] for user in frames[0]["users"]], ["alice", "bob"]
+        )
+
+        # Unchanged typers on the next ticks are not re-broadcast
+        aggregator.update("1", "alice", True)
+        self.assertEqual(await self._frames(0.12), [])
+
+    async def test_start_stop_within_interval_is_debounced(self):
+        """A user who starts and stops between ticks produces no frame"""
+        aggregator = await self._setup()
+        aggregator.update("1", "alice", True)
+        aggregator.update("1", "alice", False)
+
+        self.assertEqual(await self._frames(0.08), [])
+        self.assertEqual(self.idle, ["room_typing"])
+
+    async def test_stale_typers_expire(self):
+        """Typers who go quiet are dropped and the room hears about it"""
+        aggregator = await self._setup(interval=0.02, ttl=0.05)
+        aggregator.update("1", "alice", True)
+
+        frames = await self._frames(0.15)
+        self.assertEqual([len(frame["users"]) for frame in frames], [1, 0])
+        self.assertEqual(self.idle, ["room_typing"])
+
+
+    async def test_typers_of_each_worker_are_merged(self):
+        """Frames from two workers add up instead of replacing each other"""
+        aggregator = await self._setup()
+        other = RoomTypingAggregator(
+            "room_typing", self.layer, 0.05, 10, on_idle=self.idle.append, origin="b"
+        )
+        aggregator.update("1", "alice", True)
+        other.update("2", "bob", True)
+        frames = await self._frames(0.08)
+        self.assertEqual(
+            {frame["origin"] for frame in frames}, {aggregator.origin, "b"}
+        )
+
+        view = TypingView()
+        for frame in frames:
+            typers = view.apply(frame)
+        self.assertEqual([user["username"] for user in typers], ["alice", "bob"])
+
+        other.update("2", "bob", False)
+        [frame] = await self._frames(0.08)
+        self.assertEqual([user["username"] for user in view.apply(frame)], ["alice"])
+
+    async def test_typer_leaving_during_a_send_gets_the_empty_frame(self):
+        aggregator = await self._setup()
+        group_send = self.layer.group_send
+
+        async def slow_group_send(group, message):
+            if message["users"]:
+                aggregator.update("1", "alice", False)
+            await group_send(group, message)
+
+        with mock.patch.object(self.layer, "group_send", slow_group_send):
+            aggregator.update("1", "alice", True)
+            frames = await self._frames(0.15)
+
+        self.assertEqual([len(frame["users"]) for frame in frames], [1, 0])
+        self.assertEqual(self.idle, ["room_typing"])
+
+    def test_view_drops_origins_that_go_quiet(self):
+        view = TypingView()
+        alice = {"user_id": "1", "username": "alice"}
+        bob = {"user_id": "2", "username": "bob"}
+        view.apply({"origin": "a", "ttl": -1, "users": [alice]})
+        self.assertEqual(view.apply({"origin": "b", "ttl": 10, "users": [bob]}), [bob])
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE={"BACKEND": "memory"}
+)
+class ChunkedUploadTests(TestCase):
+    """Test cases for binary chunked uploads over the chat WebSocket"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="liam", email="liam@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Media", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+        self.application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        self.uploaded = []
+
+    async def _connect(self):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/chat/{self.room.id}/"
+        )
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _next(self, communicator, *types):
+        while True:
+            frame = await communicator.receive_json_from()
+            if frame["type"] in types:
+                return frame
+
+    async def _fake_upload_image(self, media_file):
+        self.uploaded.append((media_file.name, media_file.size, media_file.read()))
+        return fake_image_upload(
+            "https://res.cloudinary.com/demo/image/upload/sample.png"
+        )
+
+    async def _begin(self, communicator, **fields):
+        await communicator.send_json_to({"type": "upload_begin", **fields})
+        return await self._next(communicator, "upload_ready", "upload_error")
+
+    async def test_chunks_are_reassembled_and_posted(self):
+        """Binary chunks are spooled, uploaded as one file and broadcast"""
+        payload = bytes(range(256)) * 1200  # 300 KB, spills to disk
+        communicator = await self._connect()
+        ready = await self._begin(
+            communicator, media_type="image", filename="cat.png", size=len(payload)
+        )
+        upload_id = uuid.UUID(ready["upload_id"]).bytes
+
+        for start in range(0, len(payload), 64 * 1024):
+            chunk = payload[start : start + 64 * 1024]
+            await communicator.send_to(bytes_data=upload_id + chunk)
+
+        with mock.patch.object(ChatConsumer, "upload_image", self._fake_upload_image):
+            await communicator.send_json_to(
+                {"type": "upload_commit", "upload_id": ready["upload_id"]}
+            )
+            complete = await self._next(communicator, "upload_complete", "upload_error")
+            broadcast = await self._next(communicator, "chat_message")
+
+        self.assertEqual(complete["type"], "upload_complete")
+        self.assertEqual(self.uploaded, [("image.png", len(payload), payload)])
+        self.assertEqual(broadcast["message"]["id"], complete["message_id"])
+        self.assertEqual(broadcast["message"]["message_type"], "image")
+        await communicator.disconnect()
+
+    @override_settings(MAX_UPLOAD_SIZE=1000)
+    async def test_size_limit_enforced_while_streaming(self):
+        """An upload is aborted as soon as it crosses MAX_UPLOAD_SIZE"""
+        communicator = await self._connect()
+        ready = await self._begin(communicator, media_type="audio", filename="a.mp3")
+        upload_id = uuid.UUID(ready["upload_id"]).bytes
+
+        await communicator.send_to(bytes_data=upload_id + b"x" * 600)
+        await communicator.send_to(bytes_data=upload_id + b"x" * 600)
+        error = await self._next(communicator, "upload_error")
+        self.assertIn("exceeds maximum", error["message"])
+
+        await communicator.send_json_to(
+            {"type": "upload_commit", "upload_id": ready["upload_id"]}
+        )
+        error = await self._next(communicator, "upload_error")
+        self.assertEqual(error["message"], "Unknown upload")
+        await communicator.disconnect()
+
+    async def test_begin_validates_type_extension_and_size(self):
+        """Uploads are refused up front when they can never succeed"""
+        communicator = await self._connect()
+        for fields in (
+            {"media_type": "image", "filename": "virus.exe"},
+            {"media_type": "binary", "filename": "a.png"},
+            {"media_type": "video", "filename": "a.mp4", "size": 10**12},
+        ):
+            response = await self._begin(communicator, **fields)
+            self.assertEqual(response["type"], "upload_error")
+        await communicator.disconnect()
+
+
+class MediaJobTestMixin:
+    def setUp(self):
+        self.staging = tempfile.TemporaryDirectory()
+        self.addCleanup(self.staging.cleanup)
+        self.settings_override = override_settings(
+            CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+            PRESENCE={"BACKEND": "memory"},
+            MEDIA_JOBS={
+                "ENABLED": True,
+                "STAGING_DIR": self.staging.name,
+                "MAX_ATTEMPTS": 2,
+                "RETRY_DELAY_SECONDS": 60,
+            },
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(
+            username="mona", email="mona@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Album", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+
+    def _queue(self, data=b"png-bytes"):
+        return media_jobs.queue_media_message(
+            self.room.id,
+            self.user,
+            "image",
+            ContentFile(data, name="image.png"),
+            caption="look",
+        )
+
+
+class MediaJobTests(MediaJobTestMixin, TestCase):
+    """Test cases for the background media upload pipeline"""
+
+    async def test_consumer_posts_processing_message_immediately(self):
+        """Sending media creates and broadcasts a placeholder without uploading"""
+        communicator = WebsocketCommunicator(
+            URLRouter(
+                [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+            ),
+            f"/ws/chat/{self.room.id}/",
+        )
+        communicator.scope["user"] = self.user
+        await communicator.connect()
+
+        with mock.patch("communication.utils.MediaProcessor.upload_image") as upload:
+            await communicator.send_json_to(
+                {
+                    "type": "image_message",
+                    "image": "data:image/png;base64,cG5nLWJ5dGVz",
+                    "caption": "look",
+                }
+            )
+            while True:
+                frame = await communicator.receive_json_from()
+                if frame["type"] == "chat_message":
+                    break
+        await communicator.disconnect()
+
+        upload.assert_not_called()
+        self.assertEqual(frame["message"]["status"], "processing")
+        job = await MediaJob.objects.aget(message_id=frame["message"]["id"])
+        self.assertEqual(job.status, "pending")
+        with open(job.staged_path, "rb") as staged:
+            self.assertEqual(staged.read(), b"png-bytes")
+
+    def test_worker_patches_message_and_broadcasts(self):
+        """A finished job fills in the media and sends message_update"""
+        message = self._queue()
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"room_{self.room.id}", channel)
+
+        job_ids = media_jobs.claim_jobs("test-worker", 10)
+        self.assertEqual(media_jobs.claim_jobs("other-worker", 10), [])
+        uploaded = []
+
+        def fake_upload(media_file):
+            uploaded.append(media_file.read())
+            return fake_image_upload("https://cdn.example.com/a.png")
+
+        with mock.patch(
+            "communication.utils.MediaProcessor.upload_image", side_effect=fake_upload
+        ):
+            self.assertEqual(media_jobs.process_job(job_ids[0]), "done")
+        self.assertEqual(uploaded, [b"png-bytes"])
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, "sent")
+        self.assertEqual(message.content, "look")
+        job = MediaJob.objects.get(pk=job_ids[0])
+        self.assertFalse(os.path.exists(job.staged_path))
+
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event["type"], "message_update")
+        frame = json.loads(event["frame"])
+        self.assertEqual(frame["message"]["status"], "sent")
+        self.assertEqual(frame["message"]["image"], "https://cdn.example.com/a.png")
+
+    def test_failed_upload_retries_then_fails(self):
+        """Failures back off and retry; the last attempt marks the message failed"""
+        message = self._queue()
+        failing = mock.patch(
+            "communication.utils.MediaProcessor.upload_image",
+            side_effect=Exception("cloud down"),
+        )
+
+        with failing:
+            job_id = media_jobs.claim_jobs("w", 1)[0]
+            self.assertEqual(media_jobs.process_job(job_id), "pending")
+            # Not due again until the backoff has passed
+            self.assertEqual(media_jobs.claim_jobs("w", 1), [])
+
+            MediaJob.objects.filter(pk=job_id).update(available_at=timezone.now())
+            self.assertEqual(media_jobs.claim_jobs("w", 1), [job_id])
+            self.assertEqual(media_jobs.process_job(job_id), "failed")
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, "failed")
+        self.assertEqual(MediaJob.objects.get(pk=job_id).last_error, "cloud down")
+
+
+class MediaWorkerCommandTests(MediaJobTestMixin, TransactionTestCase):
+    """Test cases for the process_media_jobs worker command"""
+
+    def test_drains_queue_with_thread_pool(self):
+        """--once processes every due job through the pool and exits"""
+        messages = [self._queue(f"img-{i}".encode()) for i in range(5)]
+        with mock.patch(
+            "communication.utils.MediaProcessor.upload_image",
+            return_value=fake_image_upload("https://cdn.example.com/x.png"),
+        ):
+            # One pool worker: the shared-cache SQLite test database takes
+            # table locks that concurrent writers would trip over
+            with open(os.devnull, "w") as devnull:
+                call_command(
+                    "process_media_jobs", "--once", "--workers", "1", stdout=devnull
+                )
+
+        self.assertEqual(
+            set(
+                Message.objects.filter(id__in=[m.id for m in messages]).values_list(
+                    "status", flat=True
+                )
+            ),
+            {"sent"},
+        )
+        self.assertFalse(MediaJob.objects.exclude(status="done").exists())
+
+    def test_idle_worker_purges_old_finished_jobs(self):
+        long_ago = timezone.now() - timedelta(days=8)
+        jobs = {}
+        for job_status in ("done", "failed", "pending"):
+            job = MediaJob.objects.get(message=self._queue())
+            job.status = job_status
+            job.available_at = long_ago
+            job.save()
+            jobs[job_status] = job
+        recent = MediaJob.objects.get(message=self._queue())
+        MediaJob.objects.filter(pk=recent.pk).update(status="done")
+
+        self.assertEqual(
+            media_jobs.purge_finished(timezone.now() - timedelta(days=7), 1), 1
+        )
+        # The pending job is due, so keep the worker from uploading it
+        MediaJob.objects.filter(pk=jobs["pending"].pk).update(
+            available_at=timezone.now() + timedelta(days=1)
+        )
+        with open(os.devnull, "w") as devnull:
+            call_command("process_media_jobs", "--once", stdout=devnull)
+
+        self.assertEqual(
+            set(MediaJob.objects.values_list("id", flat=True)),
+            {jobs["pending"].id, recent.id},
+        )
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 4)
+
+
+class LocalMediaStorageTests(TestCase):
+    """Test cases for the content-addressed local media storage backend"""
+
+    def setUp(self):
+        self.location = tempfile.TemporaryDirectory()
+        self.addCleanup(self.location.cleanup)
+        settings_override = override_settings(
+            MEDIA_STORAGE={
+                "BACKEND": "local",
+                "LOCATION": self.location.name,
+                "BASE_URL": "/media/",
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = get_media_storage()
+
+        self.user = User.objects.create_user(
+            username="nina", email="nina@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Photos", room_type="group")
+
+    @override_settings(
+        CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, IMAGE_VARIANTS={"WORKERS": 0}
+    )
+    def test_rest_message_with_uploaded_image(self):
+        """A multipart image posted to room-messages is stored with its variants"""
+        Participant.objects.create(user=self.user, room=self.room)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        upload = ContentFile(jpeg_bytes(), name="photo.jpg")
+
+        response = client.post(
+            reverse("room-messages", args=[f"{self.room.id}/"]),
+            {"content": "look", "image": upload},
+            format="multipart",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data["message_type"], "image")
+        self.assertTrue(response.data["image"].startswith("/media/blobs/"))
+        message = Message.objects.get(id=response.data["id"])
+        self.assertIn("full", message.image_variants)
+        self.assertTrue(message.image_placeholder)
+        self.assertTrue(self._blob_files())
+
+    def _blob_files(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(os.path.join(self.location.name, "blobs"))
+            for name in names
+        ]
+
+    def test_identical_files_are_stored_once(self):
+        """Re-sending the same bytes adds a reference instead of a copy"""
+        metrics.reset()
+        first = self.storage.save(ContentFile(b"same", name="a.png"), "image")
+        second = self.storage.save(ContentFile(b"same", name="b.png"), "image")
+        other = self.storage.save(ContentFile(b"different", name="c.png"), "image")
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first["name"], other["name"])
+        self.assertTrue(first["url"].startswith("/media/blobs/"))
+        self.assertEqual(len(self._blob_files()), 2)
+        self.assertEqual(MediaBlob.objects.get(size=4).ref_count, 2)
+        self.assertEqual(metrics.counter("media_storage.dedup_hits").value, 1)
+        self.assertFalse(
+            [n for n in os.listdir(self.location.name) if n.startswith(".upload-")]
+        )
+
+    def test_blob_removed_with_last_reference(self):
+        """A blob outlives all but its last reference"""
+        stored = self.storage.save(ContentFile(b"bytes", name="a.png"), "image")
+        self.storage.save(ContentFile(b"bytes", name="a.png"), "image")
+
+        self.assertTrue(release_media(stored["url"]))
+        self.assertEqual(len(self._blob_files()), 1)
+
+        self.assertTrue(release_media(stored["name"]))
+        self.assertEqual(self._blob_files(), [])
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(release_media(stored["name"]))
+
+    def test_rejects_disallowed_files(self):
+        """Uploads are validated the same way as on Cloudinary"""
+        with self.assertRaises(ValidationError):
+            self.storage.save(ContentFile(b"#!/bin/sh", name="run.sh"), "image")
+        self.assertEqual(self._blob_files(), [])
+
+    def test_message_media_resolves_and_is_released(self):
+        """Chat uploads go through the backend and deleting messages frees them"""
+        messages = []
+        for _ in range(2):
+            uploaded = MediaProcessor.upload_image(
+                ContentFile(jpeg_bytes((2000, 1000)), name="image.jpg")
+            )
+            messages.append(
+                Message.objects.create(
+                    room=self.room,
+                    sender=self.user,
+                    message_type="image",
+                    image=uploaded["url"],
+                    image_variants=uploaded["variants"],
+                )
+            )
+
+        data = MessageSerializer(Message.objects.get(pk=messages[0].pk)).data
+        self.assertEqual(data["image"], uploaded["url"])
+        self.assertEqual(data["image_variants"]["thumb"]["width"], 160)
+        self.assertEqual(len(self._blob_files()), 3)
+
+        messages[0].delete()
+        self.assertEqual(len(self._blob_files()), 3)
+        messages[1].delete()
+        self.assertEqual(self._blob_files(), [])
+
+    def test_other_values_resolve_to_cloudinary(self):
+        """Existing Cloudinary ids and absolute URLs keep resolving"""
+        url = "https://res.cloudinary.com/demo/image/upload/v1/a.png"
+        self.assertEqual(media_url(url), url)
+        self.assertEqual(
+            media_url(Message._meta.get_field("image").to_python(url)), url
+        )
+        self.assertIsNone(media_url(None))
+        self.assertIsNot(storage_for("app_images/abc"), self.storage)
+        self.assertFalse(release_media(url))
+
+
+class ImageVariantTests(TestCase):
+    """Test cases for responsive image variant generation"""
+
+    def _open(self, variant):
+        return Image.open(io.BytesIO(variant["data"]))
+
+    def test_renders_sizes_and_strips_exif(self):
+        """Variants are downscaled, upright and carry no EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = "CameraCo"
+        rendered = render_variants(jpeg_bytes((3000, 2000), exif=exif.tobytes()))
+
+        sizes = {
+            name: (variant["width"], variant["height"])
+            for name, variant in rendered["variants"].items()
+        }
+        self.assertEqual(
+            sizes, {"full": (1067, 1600), "medium": (427, 640), "thumb": (107, 160)}
+        )
+        for variant in rendered["variants"].values():
+            image = self._open(variant)
+            self.assertEqual(image.size, (variant["width"], variant["height"]))
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertTrue(rendered["placeholder"].startswith("data:image/jpeg;base64,"))
+        self.assertLess(len(rendered["placeholder"]), 1500)
+
+    def test_small_and_transparent_images(self):
+        """Small images are never upscaled and transparency is kept"""
+        output = io.BytesIO()
+        Image.new("RGBA", (120, 90), (0, 0, 255, 128)).save(output, format="PNG")
+        rendered = render_variants(output.getvalue())
+
+        thumb = rendered["variants"]["thumb"]
+        self.assertEqual((thumb["width"], thumb["height"]), (120, 90))
+        self.assertEqual(thumb["extension"], "png")
+        self.assertEqual(self._open(thumb).mode, "RGBA")
+
+    @override_settings(IMAGE_VARIANTS={"WORKERS": 1})
+    def test_process_pool_matches_inline_rendering(self):
+        """The pooled path returns exactly what rendering inline does"""
+        data = jpeg_bytes((1800, 1200), color=(10, 120, 30))
+        self.assertEqual(generate_variants(data), render_variants(data))
+
+    def test_serializers_pick_stored_variant(self):
+        """Requested sizes map to the smallest variant that covers them"""
+        variants = {
+            "full": {"url": "/media/full.jpg", "width": 1600, "height": 1200},
+            "medium": {"url": "/media/medium.jpg", "width": 640, "height": 480},
+            "thumb": {"url": "/media/thumb.jpg", "width": 160, "height": 120},
+        }
+        self.assertEqual(pick_variant(variants)["url"], "/media/full.jpg")
+        self.assertEqual(pick_variant(variants, 300)["url"], "/media/medium.jpg")
+        self.assertEqual(pick_variant(variants, 100, 100)["url"], "/media/thumb.jpg")
+        self.assertEqual(pick_variant(variants, 4000)["url"], "/media/full.jpg")
+        self.assertIsNone(pick_variant({}))
+
+        user = User.objects.create_user(
+            username="olga", email="olga@example.com", password="password123"
+        )
+        media_file = MediaFile.objects.create(
+            name="photo",
+            media_type="image",
+            user=user,
+            file="/media/full.jpg",
+            public_id="blobs/fu/full.jpg",
+            image_variants=variants,
+        )
+        data = MediaFileSerializer(media_file, context={"width": 200}).data
+        self.assertEqual(data["file_url"], "/media/medium.jpg")
+
+
+class MessageSearchTests(APITestCase):
+    """Test cases for full-text message search"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username="alice_s", email="alice_s@example.com", password="password123"
+        )
+        self.bob = User.objects.create_user(
+            username="bob_s", email="bob_s@example.com", password="password123"
+        )
+        self.carol = User.objects.create_user(
+            username="carol_s", email="carol_s@example.com", password="password123"
+        )
+        self.team = Room.objects.create(name="Team", room_type="group")
+        self.other = Room.objects.create(name="Other", room_type="group")
+        for user in (self.alice, self.bob):
+            Participant.objects.create(user=user, room=self.team)
+        for user in (self.bob, self.carol):
+            Participant.objects.create(user=user, room=self.other)
+
+        self.client.force_authenticate(user=self.alice)
+        self.url = reverse("message-search")
+
+    def _say(self, room, text, sender=None, **fields):
+        return Message.objects.create(
+            room=room, sender=sender or self.bob, content=text, **fields
+        )
+
+    def _search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def test_ranked_results_with_escaped_snippets(self):
+        """Better matches rank first and snippets highlight the terms safely"""
+        weak = self._say(self.team, "we should deploy at some point this week maybe")
+        strong = self._say(self.team, "deploy deploy: the <b>deploy</b> script")
+        self._say(self.team, "lunch?")
+
+        data = self._search(q="deploy")
+        self.assertEqual(
+            [r["id"] for r in data["results"]], [str(strong.id), str(weak.id)]
+        )
+        self.assertGreater(data["results"][0]["rank"], data["results"][1]["rank"])
+        snippet = data["results"][0]["snippet"]
+        self.assertIn("<mark>deploy</mark>", snippet)
+        self.assertIn("&lt;b&gt;", snippet)
+        self.assertEqual(data["results"][0]["room_name"], "Team")
+
+    def test_only_the_users_rooms_are_searched(self):
+        """Messages in rooms the user is not in never match"""
+        self._say(self.other, "secret roadmap", sender=self.carol)
+        mine = self._say(self.team, "public roadmap")
+
+        data = self._search(q="roadmap")
+        self.assertEqual([r["id"] for r in data["results"]], [str(mine.id)])
+        data = self._search(q="roadmap", room_id=str(self.other.id))
+        self.assertEqual(data["results"], [])
+
+    def test_index_follows_edits_deletes_and_bulk_inserts(self):
+        """The index is updated by inserts (including bulk), edits and deletes"""
+        message = self._say(self.team, "draft notes")
+        message.content = "final notes"
+        message.save()
+        self.assertEqual(self._search(q="draft")["results"], [])
+        self.assertEqual(len(self._search(q="final")["results"]), 1)
+
+        message.delete()
+        self.assertEqual(self._search(q="final")["results"], [])
+
+        Message.objects.bulk_create(
+            [Message(room=self.team, sender=self.bob, content="batched hello")]
+        )
+        self._say(self.team, "hello.mp4", message_type="video")
+        self.assertEqual(len(self._search(q="hello")["results"]), 1)
+
+    def test_prefix_match_and_cursor_pagination(self):
+        """The last term matches as a prefix and cursors walk every hit once"""
+        expected = {str(self._say(self.team, f"release {i}").id) for i in range(5)}
+
+        seen = []
+        params = {"q": "rele", "page_size": 2}
+        while True:
+            data = self._search(**params)
+            seen += [r["id"] for r in data["results"]]
+            if not data["cursor"]:
+                break
+            self.assertIn("cursor=", data["next"])
+            params["cursor"] = data["cursor"]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), expected)
+
+    def test_rejects_bad_input(self):
+        """Queries without words and malformed cursors are 400s"""
+        for params in (
+            {"q": "  ?!"},
+            {"q": "x", "cursor": "%%%"},
+            {"q": "x", "room_id": "nope"},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # FTS syntax in user input is treated as plain words
+        self._search(q='"unbalanced AND (')
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE={"BACKEND": "memory"}
+)
+class ConnectTicketTests(APITestCase):
+    """Test cases for signed WebSocket connect tickets"""
+
+    def setUp(self):
+        reset_presence(setting="PRESENCE")
+        cache.clear()
+        metrics.reset()
+        self.user = User.objects.create_user(
+            username="lena", email="lena@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Tickets", room_type="group")
+        self.other = Room.objects.create(name="Elsewhere", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+        self.client.force_authenticate(user=self.user)
+        self.application = ConnectTicketAuthMiddleware(
+            URLRouter(
+                [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+            )
+        )
+
+    def _ticket(self, **data):
+        response = self.client.post(reverse("connect-ticket"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    async def _connect(self, room, ticket):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/chat/{room.id}/?ticket={ticket}"
+        )
+        communicator.scope["user"] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def test_ticket_grants_only_rooms_the_user_is_in(self):
+        data = self._ticket(room_ids=[str(self.room.id), str(self.other.id)])
+        self.assertEqual(data["room_ids"], [str(self.room.id)])
+
+        ticket = verify_ticket(data["ticket"])
+        self.assertEqual(ticket.user_id, self.user.id)
+        self.assertEqual(ticket.room_ids, {str(self.room.id)})
+        self.assertEqual(self._ticket()["room_ids"], [str(self.room.id)])
+
+    def test_forged_and_expired_tickets_are_rejected(self):
+        ticket = self._ticket()["ticket"]
+        self.assertIsNone(verify_ticket(ticket[:-2] + "xx"))
+        with override_settings(CONNECT_TICKETS={"TTL": -1}):
+            self.assertIsNone(verify_ticket(ticket))
+
+    async def test_connect_with_ticket_skips_database_auth(self):
+        data = await database_sync_to_async(self._ticket)()
+        with mock.patch.object(
+            ChatConsumer, "is_room_participant", side_effect=AssertionError
+        ):
+            communicator, connected = await self._connect(self.room, data["ticket"])
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_ticket_is_single_use(self):
+        data = await database_sync_to_async(self._ticket)()
+        communicator, connected = await self._connect(self.room, data["ticket"])
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+        _, connected = await self._connect(self.room, data["ticket"])
+        self.assertFalse(connected)
+        self.assertEqual(metrics.snapshot()["connect_tickets.replayed"], 1)
+
+    async def test_invalid_ticket_is_not_authenticated(self):
+        communicator, connected = await self._connect(self.room, "bogus")
+        self.assertFalse(connected)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE={"BACKEND": "memory"}
+)
+class FanoutTests(APITestCase):
+    """Test cases for encoding room events once per fan-out"""
+
+    def setUp(self):
+        reset_presence(setting="PRESENCE")
+        cache.clear()
+        self.sender = User.objects.create_user(
+            username="mia", email="mia@example.com", password="password123"
+        )
+        self.reader = User.objects.create_user(
+            username="noah", email="noah@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Fanout", room_type="group")
+        for user in (self.sender, self.reader):
+            Participant.objects.create(user=user, room=self.room)
+        self.application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+
+    def test_sender_info_is_added_once_when_building_the_event(self):
+        message = Message.objects.create(
+            room=self.room, sender=self.sender, content="hello"
+        )
+        data = MessageSerializer(message).data
+        event = chat_message_event({"id": data["id"], "sender_id": self.sender.id})
+        self.assertEqual(
+            json.loads(event["frame"])["message"]["sender"]["username"], "mia"
+        )
+        with self.assertNumQueries(0):
+            chat_message_event({"id": data["id"], "sender_id": self.sender.id})
+
+        # Serializer data (UUIDs, datetimes) encodes as is
+        frame = json.loads(chat_message_event(data)["frame"])
+        self.assertEqual(frame["message"]["room"], str(self.room.id))
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/chat/{self.room.id}/"
+        )
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _next_frame(self, communicator, frame_type):
+        while True:
+            frame = await communicator.receive_from()
+            if json.loads(frame)["type"] == frame_type:
+                return frame
+
+    async def test_every_member_gets_the_same_pre_encoded_frame(self):
+        sender = await self._connect(self.sender)
+        reader = await self._connect(self.reader)
+
+        with mock.patch.object(
+            ChatConsumer, "get_cached_user_info", side_effect=AssertionError
+        ):
+            await sender.send_json_to({"type": "text_message", "content": "hi all"})
+            sent = await self._next_frame(sender, "chat_message")
+            received = await self._next_frame(reader, "chat_message")
+
+        self.assertEqual(sent, received)
+        self.assertEqual(json.loads(received)["message"]["sender"]["username"], "mia")
+        await sender.disconnect()
+        await reader.disconnect()
+
+
+@override_settings(SYNC={"PAGE_SIZE": 500, "SETTLE_SECONDS": 0})
+class SyncTests(APITestCase):
+    """Test cases for the delta sync endpoint"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username="olga", email="olga@example.com", password="password123"
+        )
+        self.bob = User.objects.create_user(
+            username="pete", email="pete@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Sync", room_type="group")
+        self.hidden = Room.objects.create(name="Hidden", room_type="group")
+        for user in (self.alice, self.bob):
+            Participant.objects.create(user=user, room=self.room)
+        Participant.objects.create(user=self.bob, room=self.hidden)
+        self.client.force_authenticate(user=self.alice)
+        self.token = self._sync()["sync_token"]
+
+    def _sync(self, since=None, **params):
+        if since is not None:
+            params["since"] = since
+        response = self.client.get(reverse("sync"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def test_one_request_returns_current_state_of_every_change(self):
+        first = Message.objects.create(room=self.room, sender=self.bob, content="a")
+        first.content = "a (edited)"
+        first.save()
+        gone = Message.objects.create(room=self.room, sender=self.bob, content="b")
+        gone_id = gone.id
+        gone.delete()
+        Message.objects.create(room=self.hidden, sender=self.bob, content="secret")
+        Participant.mark_room_read(self.room.id, self.alice, first)
+        carol = User.objects.create_user(
+            username="quinn", email="quinn@example.com", password="password123"
+        )
+        Participant.objects.create(user=carol, room=self.room)
+        IncomingCallNotification.objects.create(
+            caller=self.bob,
+            recipient=self.alice,
+            room=self.room,
+            call_type="audio",
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        IncomingCallNotification.expire_outdated()
+
+        data = self._sync(self.token)
+        self.assertFalse(data["has_more"])
+        self.assertEqual([m["content"] for m in data["messages"]], ["a (edited)"])
+        self.assertEqual(data["deleted_message_ids"], [str(gone_id)])
+        self.assertEqual(
+            [(m["user_id"], m["status"]) for m in data["memberships"]],
+            [(carol.id, "joined")],
+        )
+        watermarks = data["read_watermarks"]
+        self.assertEqual(
+            [(w["user_id"], w["last_read_message_id"]) for w in watermarks],
+            [(self.alice.id, first.id)],
+        )
+        self.assertEqual([c["status"] for c in data["call_notifications"]], ["expired"])
+
+        again = self._sync(data["sync_token"])
+        self.assertEqual(again["sync_token"], data["sync_token"])
+        self.assertEqual(again["messages"], [])
+
+    def test_pages_are_bounded_and_resume_from_the_token(self):
+        for i in range(5):
+            Message.objects.create(room=self.room, sender=self.bob, content=str(i))
+
+        seen, token = [], self.token
+        for expected_more in (True, True, False):
+            data = self._sync(token, limit=2)
+            self.assertEqual(data["has_more"], expected_more)
+            seen += [m["content"] for m in data["messages"]]
+            self.assertGreater(int(data["sync_token"]), int(token))
+            token = data["sync_token"]
+        self.assertEqual(seen, ["0", "1", "2", "3", "4"])
+
+    def test_removed_member_hears_about_it_but_nothing_after(self):
+        Participant.objects.get(user=self.alice, room=self.room).delete()
+        Message.objects.create(room=self.room, sender=self.bob, content="after")
+
+        data = self._sync(self.token)
+        self.assertEqual(data["messages"], [])
+        self.assertEqual(
+            data["memberships"],
+            [
+                {
+                    "room_id": str(self.room.id),
+                    "user_id": self.alice.id,
+                    "status": "left",
+                }
+            ],
+        )
+
+    def test_new_direct_room_is_announced_before_its_messages(self):
+        """The other user learns it joined a direct room someone opened"""
+        room, created = DirectRoomKey.get_or_create_room(self.bob, self.alice)
+        self.assertTrue(created)
+        Message.objects.create(room=room, sender=self.bob, content="hello")
+
+        data = self._sync(self.token)
+        self.assertCountEqual(
+            [(m["room_id"], m["user_id"], m["status"]) for m in data["memberships"]],
+            [
+                (str(room.id), self.alice.id, "joined"),
+                (str(room.id), self.bob.id, "joined"),
+            ],
+        )
+        self.assertEqual([m["content"] for m in data["messages"]], ["hello"])
+
+    @override_settings(CHAT_WRITE_BEHIND={"ENABLED": True})
+    def test_write_behind_messages_are_logged(self):
+        message = Message(
+            id=uuid.uuid4(), room=self.room, sender=self.bob, content="buffered"
+        )
+        write_behind._buffer.append((message, time.monotonic()))
+        write_behind.flush_sync()
+
+        data = self._sync(self.token)
+        self.assertEqual([m["id"] for m in data["messages"]], [str(message.id)])
+
+    def test_event_committed_late_under_a_lower_id_is_not_skipped(self):
+        early = Message.objects.create(room=self.room, sender=self.bob, content="1")
+        Message.objects.create(room=self.room, sender=self.bob, content="2")
+        # The first event's transaction has not committed yet
+        in_flight = SyncEvent.objects.get(object_id=str(early.id))
+        in_flight.delete()
+
+        with self.settings(SYNC={"SETTLE_SECONDS": 60}):
+            data = self._sync(self.token)
+            self.assertEqual(data["sync_token"], self.token)
+            self.assertEqual(data["messages"], [])
+
+            # It commits with the lower id, and both settle
+            in_flight.save(force_insert=True)
+            SyncEvent.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+            data = self._sync(self.token)
+        self.assertEqual([m["content"] for m in data["messages"]], ["1", "2"])
+
+    def test_bad_and_expired_tokens(self):
+        response = self.client.get(reverse("sync"), {"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        Message.objects.create(room=self.room, sender=self.bob, content="old")
+        SyncEvent.objects.all().delete()
+        Message.objects.create(room=self.room, sender=self.bob, content="new")
+        response = self.client.get(reverse("sync"), {"since": "1"})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(self._sync(response.data["sync_token"])["messages"], [])
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    ROOM_TAIL={"BACKEND": "memory", "SIZE": 10, "TTL": 60},
+)
+class RoomTailCacheTests(APITestCase):
+    """Test cases for serving the first page of history from the tail cache"""
+
+    def setUp(self):
+        metrics.reset()
+        self.alice = User.objects.create_user(
+            username="quinn", email="quinn@example.com", password="password123"
+        )
+        self.bob = User.objects.create_user(
+            username="rosa", email="rosa@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Hot", room_type="group")
+        for user in (self.alice, self.bob):
+            Participant.objects.create(user=user, room=self.room)
+        self.messages = [
+            Message.objects.create(room=self.room, sender=self.bob, content=str(i))
+            for i in range(15)
+        ]
+        self.client.force_authenticate(user=self.alice)
+        self.url = reverse("room-messages", args=[f"{self.room.id}/"])
+
+    def test_first_page_is_served_without_message_queries(self):
+        params = {"page_size": 5}
+        uncached = self.client.get(self.url, params).data
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url, params).data
+
+        self.assertEqual(cached["count"], 15)
+        self.assertEqual(
+            [m["content"] for m in cached["results"]],
+            [m["content"] for m in uncached["results"]],
+        )
+        self.assertEqual(json.loads(json.dumps(uncached, default=str)), cached)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["room_tail.misses"], 1)
+        self.assertEqual(snapshot["room_tail.hits"], 1)
+
+    def test_cursor_from_a_cached_page_walks_into_the_database(self):
+        self.client.get(self.url, {"pagination": "cursor", "page_size": 5})
+        first = self.client.get(self.url, {"pagination": "cursor", "page_size": 5})
+        self.assertEqual(metrics.snapshot()["room_tail.hits"], 1)
+
+        older = self.client.get(self.url, {"before": first.data["before"]})
+        self.assertEqual(
+            [m["content"] for m in older.data["results"]],
+            [str(i) for i in reversed(range(10))],
+        )
+
+    def test_pages_larger_than_the_tail_use_the_database(self):
+        self.client.get(self.url, {"page_size": 20})
+        self.client.get(self.url, {"page_size": 20})
+        self.assertNotIn("room_tail.hits", metrics.snapshot())
+
+    def test_new_messages_are_appended(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(user=self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {"content": "fresh"})
+
+        self.client.force_authenticate(user=self.alice)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"page_size": 3})
+        self.assertEqual(response.data["count"], 16)
+        self.assertEqual(
+            [m["content"] for m in response.data["results"]], ["fresh", "14", "13"]
+        )
+
+    def test_edits_and_deletes_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.messages[-1].content = "edited"
+            self.messages[-1].save()
+        response = self.client.get(self.url, {"page_size": 1})
+        self.assertEqual(response.data["results"][0]["content"], "edited")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.messages[-1].delete()
+        response = self.client.get(self.url, {"page_size": 1})
+        self.assertEqual(response.data["results"][0]["content"], "13")
+        self.assertEqual(response.data["count"], 14)
+        self.assertEqual(metrics.snapshot()["room_tail.invalidations"], 2)
+
+    def test_fill_racing_a_save_is_discarded(self):
+        tail = get_room_tail()
+        generation = tail.generation(self.room.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(room=self.room, sender=self.bob, content="racer")
+        self.assertFalse(tail.fill(self.room.id, ["{}"], 1, generation))
+        self.assertIsNone(tail.get(self.room.id, 1))
+
+    def test_read_state_is_computed_per_request(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url, {"page_size": 1})
+        self.assertFalse(response.data["results"][0]["is_read"])
+
+        Participant.mark_room_read(self.room.id, self.alice, self.messages[-1])
+        response = self.client.get(self.url, {"page_size": 1})
+        self.assertTrue(response.data["results"][0]["is_read"])
+        self.assertEqual(metrics.snapshot()["room_tail.hits"], 2)
+
+    @override_settings(
+        ROOM_TAIL={
+            "BACKEND": "redis",
+            "REDIS_URL": "redis://127.0.0.1:1/0",
+            "SIZE": 10,
+            "TTL": 60,
+        }
+    )
+    def test_cache_outage_falls_back_to_the_database(self):
+        """With Redis unreachable, writes succeed and reads use SQL"""
+        self.client.force_authenticate(user=self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {"content": "fresh"})
+            self.messages[0].delete()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(self.url, {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [m["content"] for m in response.data["results"]], ["fresh", "14"]
+        )
+        self.assertGreaterEqual(metrics.snapshot()["room_tail.errors"], 4)
+
+    def test_tail_missing_an_update_is_dropped_once_the_cache_is_back(self):
+        self.client.get(self.url)
+        with mock.patch.object(
+            InMemoryRoomTail, "append", side_effect=redis.ConnectionError("down")
+        ), self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(room=self.room, sender=self.bob, content="lost")
+
+        response = self.client.get(self.url, {"page_size": 1})
+        self.assertEqual(response.data["results"][0]["content"], "lost")
+        self.assertEqual(metrics.snapshot()["room_tail.errors"], 1)
+
+    def test_non_members_get_404(self):
+        self.client.get(self.url)
+        outsider = User.objects.create_user(
+            username="sam", email="sam@example.com", password="password123"
+        )
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE={"BACKEND": "memory"}
+)
+class MembershipCacheTests(APITestCase):
+    """Test cases for the cached room membership sets"""
+
+    def setUp(self):
+        reset_presence(setting="PRESENCE")
+        cache.clear()
+        get_membership_cache().clear()
+        self.alice = User.objects.create_user(
+            username="tess", email="tess@example.com", password="password123"
+        )
+        self.bob = User.objects.create_user(
+            username="uma", email="uma@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Members", room_type="group")
+        Participant.objects.create(user=self.alice, room=self.room)
+
+    def test_checks_after_the_first_are_free(self):
+        self.assertTrue(is_room_member(self.alice, self.room.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_room_member(self.alice, self.room.id))
+            self.assertFalse(is_room_member(self.bob, str(self.room.id)))
+            self.assertFalse(is_room_member(self.alice, "not-a-room"))
+
+    def test_joins_and_leaves_invalidate(self):
+        self.assertFalse(is_room_member(self.bob, self.room.id))
+        participant = Participant.objects.create(user=self.bob, room=self.room)
+        self.assertTrue(is_room_member(self.bob, self.room.id))
+
+        participant.delete()
+        self.assertFalse(is_room_member(self.bob, self.room.id))
+
+    def test_other_processes_see_changes_through_the_shared_cache(self):
+        room_members(self.room.id)
+        Participant.objects.create(user=self.bob, room=self.room)
+        # A worker whose LRU was just emptied reads the shared cache
+        get_membership_cache().clear()
+        with self.assertNumQueries(1):
+            self.assertTrue(is_room_member(self.bob, self.room.id))
+
+    def test_webcall_rooms_are_cached_separately(self):
+        call_room = WebcallRoom.objects.create(name="Standup")
+        WebcallParticipant.objects.create(user=self.bob, room=call_room)
+        self.assertTrue(is_room_member(self.bob, call_room.id, WebcallParticipant))
+        self.assertFalse(is_room_member(self.bob, call_room.id))
+
+    async def test_connect_checks_use_the_cache(self):
+        await database_sync_to_async(room_members)(self.room.id)
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.alice
+        with mock.patch.object(
+            Participant.objects, "filter", side_effect=AssertionError
+        ):
+            connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+
+class RateLimiterTests(TestCase):
+    """Test cases for the per-connection and per-user token buckets"""
+
+    LIMITS = {"messages": {"RATE": 1, "BURST": 2, "USER_RATE": 1, "USER_BURST": 3}}
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_bursts_then_throttles(self):
+        limiter = RateLimiter(1, self.LIMITS)
+        self.assertIsNone(limiter.check("text_message"))
+        self.assertIsNone(limiter.check("image_message"))
+        retry_after = limiter.check("text_message")
+        self.assertGreater(retry_after, 0)
+        self.assertLessEqual(retry_after, 1)
+        self.assertEqual(metrics.snapshot()["chat.throttled.messages"], 1)
+
+        # Unconfigured classes and unknown frames are not limited
+        for _ in range(10):
+            self.assertIsNone(limiter.check("typing"))
+            self.assertIsNone(limiter.check("heartbeat"))
+
+    def test_user_bucket_is_shared_by_connections(self):
+        first, second = RateLimiter(2, self.LIMITS), RateLimiter(2, self.LIMITS)
+        self.assertIsNone(first.check("text_message"))
+        self.assertIsNone(first.check("text_message"))
+        self.assertIsNone(second.check("text_message"))
+        self.assertIsNotNone(second.check("text_message"))
+        self.assertIsNone(RateLimiter(3, self.LIMITS).check("text_message"))
+
+    def test_tokens_refill(self):
+        limiter = RateLimiter(4, self.LIMITS)
+        limiter.check("text_message")
+        limiter.check("text_message")
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 1.5):
+            self.assertIsNone(limiter.check("text_message"))
+
+    def test_zero_rate_blocks_the_class(self):
+        limits = {"typing": {"RATE": 0, "BURST": 1, "USER_RATE": 0, "USER_BURST": 1}}
+        limiter = RateLimiter(5, limits)
+        self.assertIsNone(limiter.check("typing"))
+        self.assertEqual(limiter.check("typing"), math.inf)
+
+
+class OutboundQueueTests(TestCase):
+    """Test cases for the bounded per-client outbound queue"""
+
+    def setUp(self):
+        metrics.reset()
+
+    async def _stalled_queue(self, max_size):
+        sent = []
+        gate = asyncio.Event()
+
+        async def send(message):
+            await gate.wait()
+            sent.append(message["text"])
+
+        queue = OutboundQueue(send, max_size)
+        # The writer takes the first frame and blocks on the client
+        await queue.put({"text": "first"})
+        await asyncio.sleep(0)
+        return queue, gate, sent
+
+    async def test_low_priority_frames_are_shed_first(self):
+        queue, gate, sent = await self._stalled_queue(2)
+        self.assertTrue(await queue.put({"text": "typing-1"}, low_priority=True))
+        self.assertTrue(await queue.put({"text": "message-1"}))
+        self.assertFalse(await queue.put({"text": "typing-2"}, low_priority=True))
+        # A full queue makes room for an important frame by dropping typing-1
+        self.assertTrue(await queue.put({"text": "message-2"}))
+        self.assertEqual(metrics.snapshot()["chat.outbound.dropped"], 2)
+
+        gate.set()
+        while len(queue):
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(sent, ["first", "message-1", "message-2"])
+        await queue.close()
+
+    async def test_important_frames_wait_for_room(self):
+        queue, gate, sent = await self._stalled_queue(1)
+        await queue.put({"text": "message-1"})
+        blocked = asyncio.ensure_future(queue.put({"text": "message-2"}))
+        await asyncio.sleep(0)
+        self.assertFalse(blocked.done())
+
+        gate.set()
+        self.assertTrue(await blocked)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(sent, ["first", "message-1", "message-2"])
+        await queue.close()
+        self.assertFalse(await queue.put({"text": "late"}))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE={"BACKEND": "memory"},
+    CHAT_FLOW_CONTROL={
+        "RATE_LIMITS": {
+            "messages": {"RATE": 0.01, "BURST": 2, "USER_RATE": 1, "USER_BURST": 10},
+            "receipts": {"RATE": 20, "BURST": 1, "USER_RATE": 20, "USER_BURST": 1},
+        }
+    },
+)
+class ChatRateLimitTests(TestCase):
+    """Test cases for rate limiting frames received by ChatConsumer"""
+
+    def setUp(self):
+        reset_presence(setting="PRESENCE")
+        metrics.reset()
+        self.user = User.objects.create_user(
+            username="vera", email="vera@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Flood", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+
+    async def test_flooding_client_is_throttled(self):
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        for i in range(3):
+            await communicator.send_json_to({"type": "text_message", "content": str(i)})
+        frames = []
+        while not any(frame["type"] == "error" for frame in frames):
+            frames.append(await communicator.receive_json_from())
+
+        self.assertEqual(frames[-1]["code"], "rate_limited")
+        self.assertEqual(metrics.snapshot()["chat.throttled.messages"], 1)
+        count = await database_sync_to_async(
+            Message.objects.filter(room=self.room).count
+        )()
+        self.assertEqual(count, 2)
+        await communicator.disconnect()
+
+    async def test_blocked_class_is_refused_without_a_retry_time(self):
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.user
+        blocked = {"RATE": 0, "BURST": 0, "USER_RATE": 0, "USER_BURST": 0}
+        with self.settings(
+            CHAT_FLOW_CONTROL={"RATE_LIMITS": {"signaling": blocked}}
+        ):
+            connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({"type": "ice_candidate", "candidate": {}})
+        while True:
+            frame = await communicator.receive_json_from()
+            if frame["type"] == "error":
+                break
+        self.assertEqual(frame["code"], "rate_limited")
+        self.assertIsNone(frame["retry_after"])
+        await communicator.disconnect()
+
+    async def test_throttled_mark_read_is_applied_late(self):
+        first = await database_sync_to_async(Message.objects.create)(
+            room=self.room, sender=self.user, content="one"
+        )
+        second = await database_sync_to_async(Message.objects.create)(
+            room=self.room,
+            sender=self.user,
+            content="two",
+            sent_at=first.sent_at + timedelta(seconds=1),
+        )
+        application = URLRouter(
+            [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+        )
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        for message in (first, second):
+            await communicator.send_json_to(
+                {"type": "mark_read", "message_id": str(message.id)}
+            )
+        receipts = []
+        while len(receipts) < 2:
+            frame = await communicator.receive_json_from()
+            self.assertNotEqual(frame["type"], "error")
+            if frame["type"] == "read_receipt":
+                receipts.append(frame["receipt"]["last_read_message_id"])
+
+        self.assertEqual(receipts, [str(first.id), str(second.id)])
+        self.assertEqual(metrics.snapshot()["chat.throttled.receipts"], 1)
+        participant = await database_sync_to_async(Participant.objects.get)(
+            user=self.user, room=self.room
+        )
+        self.assertEqual(participant.last_read_message_id, second.id)
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class CallExpiryTests(APITestCase):
+    """Test cases for the call notification and invitation expiry sweeper"""
+
+    def setUp(self):
+        metrics.reset()
+        self.caller = User.objects.create_user(
+            username="wade", email="wade@example.com", password="password123"
+        )
+        self.callee = User.objects.create_user(
+            username="xena", email="xena@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Ring", room_type="direct")
+
+    def _notification(self, seconds, status="pending"):
+        return IncomingCallNotification.objects.create(
+            caller=self.caller,
+            recipient=self.callee,
+            room=self.room,
+            call_type="audio",
+            status=status,
+            expires_at=timezone.now() + timedelta(seconds=seconds),
+        )
+
+    def _invitation(self, seconds):
+        return CallInvitation.objects.create(
+            inviter=self.caller,
+            invitee=self.callee,
+            room=self.room,
+            call_type="video",
+            expires_at=timezone.now() + timedelta(seconds=seconds),
+        )
+
+    def test_sweep_expires_overdue_calls_and_tells_both_parties(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"user_{self.callee.id}", channel)
+        overdue = self._notification(-5)
+        seen = self._notification(-5, status="seen")
+        answered = self._notification(-5, status="accepted")
+        ringing = self._notification(60)
+        invitation = self._invitation(-5)
+        SyncEvent.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            totals = sweep(batch_size=1)
+
+        self.assertEqual(totals, {"expired": 3, "purged": 0})
+        statuses = dict(IncomingCallNotification.objects.values_list("id", "status"))
+        self.assertEqual(statuses[overdue.id], "expired")
+        self.assertEqual(statuses[seen.id], "expired")
+        self.assertEqual(statuses[answered.id], "accepted")
+        self.assertEqual(statuses[ringing.id], "pending")
+        invitation.refresh_from_db()
+        self.assertEqual(invitation.status, "expired")
+        # One sync event per party and call
+        self.assertEqual(SyncEvent.objects.count(), 6)
+
+        events = [async_to_sync(layer.receive)(channel) for _ in range(3)]
+        updates = [e for e in events if e["type"] == "call_notification_update"]
+        self.assertEqual(
+            {e["notification"]["id"] for e in updates},
+            {str(overdue.id), str(seen.id)},
+        )
+        self.assertTrue(all(e["notification"]["status"] == "expired" for e in updates))
+        (invite,) = [e for e in events if e["type"] == "call_invitation_update"]
+        self.assertEqual(invite["invitation"]["status"], "expired")
+        self.assertEqual(metrics.snapshot()["call_expiry.expired"], 3)
+
+    def test_listing_notifications_does_not_write(self):
+        overdue = self._notification(-5)
+        ringing = self._notification(60)
+        self.client.force_authenticate(user=self.callee)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("incoming-call-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            all(q["sql"].startswith("SELECT") for q in queries.captured_queries)
+        )
+        active = [n["id"] for n in response.data["data"]["active"]]
+        self.assertEqual(active, [str(ringing.id)])
+        overdue.refresh_from_db()
+        self.assertEqual(overdue.status, "pending")
+
+    def test_sweep_purges_long_expired_calls(self):
+        old = [self._notification(-10 * 86400, status="expired") for _ in range(3)]
+        recent = self._notification(-60, status="expired")
+
+        totals = sweep(batch_size=2, purge_after_days=7)
+
+        self.assertEqual(totals["purged"], 3)
+        self.assertFalse(
+            IncomingCallNotification.objects.filter(id__in=[n.id for n in old]).exists()
+        )
+        self.assertTrue(IncomingCallNotification.objects.filter(id=recent.id).exists())
+
+    def test_worker_command_sweeps_once(self):
+        overdue = self._invitation(-5)
+        output = io.StringIO()
+
+        call_command("expire_calls", "--once", stdout=output)
+
+        overdue.refresh_from_db()
+        self.assertEqual(overdue.status, "expired")
+        self.assertIn("Expired 1", output.getvalue())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class GroupCallFanoutTests(APITestCase):
+    """Test cases for ringing every member of a group call at once"""
+
+    def setUp(self):
+        self.caller = User.objects.create_user(
+            username="yara", email="yara@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Standup", room_type="group")
+        Participant.objects.create(user=self.caller, room=self.room)
+        self.layer = get_channel_layer()
+        self.channels = {}
+        self._add_members(3)
+        self.client.force_authenticate(user=self.caller)
+
+    def _add_members(self, count):
+        start = len(self.channels)
+        for i in range(start, start + count):
+            user = User.objects.create_user(
+                username=f"member{i}", email=f"member{i}@example.com"
+            )
+            Participant.objects.create(user=user, room=self.room)
+            channel = async_to_sync(self.layer.new_channel)()
+            async_to_sync(self.layer.group_add)(f"user_{user.id}", channel)
+            self.channels[user.id] = channel
+
+    def _received(self, event_type):
+        events = {}
+        for user_id, channel in self.channels.items():
+            event = async_to_sync(self.layer.receive)(channel)
+            self.assertEqual(event["type"], event_type)
+            events[user_id] = event
+        return events
+
+    def _room_call(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("incoming-call-create-room-call"),
+                {"room_id": str(self.room.id), "call_type": "audio"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response, len(queries.captured_queries)
+
+    def test_create_room_call_rings_every_member(self):
+        stale = IncomingCallNotification.objects.create(
+            caller=self.caller,
+            recipient_id=next(iter(self.channels)),
+            room=self.room,
+            call_type="audio",
+            expires_at=timezone.now() + timedelta(seconds=60),
+        )
+        SyncEvent.objects.all().delete()
+
+        response, _ = self._room_call()
+
+        self.assertEqual(response.data["meta"]["count"], 3)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "expired")
+        events = self._received("incoming_call")
+        for user_id, event in events.items():
+            self.assertEqual(event["notification"]["recipient"]["id"], user_id)
+        # Two sync events per new notification, two for the expired one
+        self.assertEqual(SyncEvent.objects.count(), 8)
+
+    def test_room_call_queries_do_not_grow_with_the_room(self):
+        # Each measured call also cancels the previous call's notifications
+        self._room_call()
+        self._received("incoming_call")
+        _, small = self._room_call()
+        self._received("incoming_call")
+        self._add_members(7)
+        room_members(self.room.id)  # refill the membership cache the joins emptied
+
+        _, large = self._room_call()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(self._received("incoming_call")), 10)
+
+    def test_start_call_invites_every_member(self):
+        SyncEvent.objects.all().delete()
+
+        response = self.client.post(
+            reverse("room-start-call", args=[self.room.id]),
+            {"call_type": "video"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["invitations"]), 3)
+        self.assertEqual(CallInvitation.objects.filter(room=self.room).count(), 3)
+        events = self._received("call_invitation")
+        for user_id, event in events.items():
+            self.assertEqual(event["invitation"]["invitee"]["id"], user_id)
+        self.assertEqual(
+            SyncEvent.objects.filter(kind=SyncEvent.CALL_INVITATION).count(), 6
+        )
+
+
+def push_settings(url, **overrides):
+    return dict(
+        {
+            "DEFAULT_PROVIDER": "fake",
+            "PROVIDERS": {"fake": {"URL": url, "BATCH_SIZE": 500}},
+            "MAX_CONNECTIONS": 1,
+            "MAX_ATTEMPTS": 3,
+            "RETRY_DELAY_SECONDS": 0,
+        },
+        **overrides,
+    )
+
+
+class PushDispatcherTests(TestCase):
+    """Test cases for the push notification outbox and dispatcher"""
+
+    def setUp(self):
+        metrics.reset()
+        self.provider = FakePushProvider(
+            fail_tokens={"gone"}, retry_tokens={"flaky"}
+        ).start()
+        self.addCleanup(self.provider.stop)
+        self.settings_override = override_settings(
+            PUSH_NOTIFICATIONS=push_settings(self.provider.url)
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_ringing_only_queues_the_push(self):
+        caller = User.objects.create_user(username="zane", email="zane@example.com")
+        recipient = User.objects.create_user(username="ayla", email="ayla@example.com")
+
+        queued = NotificationService.send_incoming_call_notification(
+            "device-1", caller, recipient, "audio", "Ring", uuid.uuid4()
+        )
+
+        self.assertTrue(queued)
+        delivery = PushDelivery.objects.get()
+        self.assertEqual(delivery.status, "pending")
+        self.assertEqual(delivery.payload["data"]["caller_username"], "zane")
+        self.assertEqual(self.provider.batches, [])
+
+    async def test_a_burst_is_sent_in_batches_over_one_connection(self):
+        payload = {"title": "Incoming Call", "body": "hi", "data": {}}
+        await database_sync_to_async(enqueue)(
+            (f"device-{i}", payload) for i in range(1000)
+        )
+
+        await PushDispatcher("test").run(once=True)
+
+        self.assertEqual([len(batch) for batch in self.provider.batches], [500, 500])
+        self.assertEqual(len(set(self.provider.delivered)), 1000)
+        self.assertEqual(self.provider.connections, 1)
+        sent = await database_sync_to_async(
+            PushDelivery.objects.filter(status="sent").count
+        )()
+        self.assertEqual(sent, 1000)
+
+    async def test_failures_are_retried_with_backoff_then_dead_lettered(self):
+        self.provider.fail_statuses = [503]
+        payload = {"title": "Incoming Call", "body": "hi", "data": {}}
+        await database_sync_to_async(enqueue)(
+            (token, payload) for token in ("ok", "gone", "flaky")
+        )
+
+        await PushDispatcher("test").run(once=True)
+
+        deliveries = await database_sync_to_async(
+            lambda: {d.device_token: d for d in PushDelivery.objects.all()}
+        )()
+        self.assertEqual(
+            {token: (d.status, d.attempts) for token, d in deliveries.items()},
+            {"ok": ("sent", 2), "gone": ("dead", 2), "flaky": ("dead", 3)},
+        )
+        self.assertIn("UNREGISTERED", deliveries["gone"].last_error)
+        self.assertEqual(self.provider.delivered, ["ok"])
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["push.dead"], 2)
+        self.assertEqual(snapshot["push.retried"], 4)
+
+    def test_old_finished_deliveries_are_purged_in_batches(self):
+        payload = {"title": "Incoming Call", "body": "hi", "data": {}}
+        long_ago = timezone.now() - timedelta(days=8)
+        for token, delivery_status, available_at in (
+            ("old-sent-1", "sent", long_ago),
+            ("old-sent-2", "sent", long_ago),
+            ("old-dead", "dead", long_ago),
+            ("old-pending", "pending", long_ago),
+            ("new-sent", "sent", timezone.now()),
+        ):
+            PushDelivery.objects.create(
+                provider="fake",
+                device_token=token,
+                payload=payload,
+                status=delivery_status,
+                available_at=available_at,
+            )
+        older_than = timezone.now() - timedelta(days=7)
+
+        self.assertEqual(purge_deliveries(older_than, batch_size=2), 2)
+        self.assertEqual(purge_deliveries(older_than, batch_size=2), 1)
+        self.assertEqual(purge_deliveries(older_than, batch_size=2), 0)
+
+        self.assertEqual(
+            set(PushDelivery.objects.values_list("device_token", flat=True)),
+            {"old-pending", "new-sent"},
+        )
+        self.assertEqual(metrics.snapshot()["push.purged"], 3)
+
+    async def test_idle_dispatcher_purges_old_deliveries(self):
+        await database_sync_to_async(PushDelivery.objects.create)(
+            provider="fake",
+            device_token="old",
+            payload={},
+            status="sent",
+            available_at=timezone.now() - timedelta(days=8),
+        )
+
+        await PushDispatcher("test").run(once=True)
+
+        count = await database_sync_to_async(PushDelivery.objects.count)()
+        self.assertEqual(count, 0)
+
+
+def coturn_accepts(secret, username, password, now):
+    """
+    The check coturn makes with use-auth-secret: the timestamp before the
+    ":" in the username must not have passed, and the password must be the
+    base64 HMAC-SHA1 of the whole username under the shared secret
+    """
+    timestamp = username.split(":", 1)[0]
+    if not timestamp.isdigit() or int(timestamp) < now:
+        return False
+    digest = hmac.new(secret.encode(), username.encode(), hashlib.sha1).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), password)
+
+
+TURN = {
+    "URLS": ["turn:turn.example.com:3478?transport=udp"],
+    "SECRET": "coturn-secret",
+    "TTL": 3600,
+    "REFRESH_BEFORE": 600,
+    "CACHE": "default",
+}
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE={"BACKEND": "memory"},
+    WEBRTC_TURN=TURN,
+)
+class TurnCredentialTests(APITestCase):
+    """Test cases for minted TURN credentials and their per-user cache"""
+
+    def setUp(self):
+        reset_presence(setting="PRESENCE")
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="turner", email="turner@example.com", password="password123"
+        )
+        self.room = Room.objects.create(name="Calls", room_type="group")
+        Participant.objects.create(user=self.user, room=self.room)
+        self.client.force_authenticate(user=self.user)
+
+    def _turn_server(self, ice_servers):
+        [server] = [s for s in ice_servers if "credential" in s]
+        return server
+
+    def test_credentials_verify_like_coturn(self):
+        # Known answer from coturn's documented recipe:
+        # echo -n 1700086400:42 | openssl dgst -sha1 -hmac coturn-secret -binary
+        #     | base64
+        username, credential, expiry = mint_turn_credentials(
+            42, "coturn-secret", 86400, now=1700000000
+        )
+        self.assertEqual(username, "1700086400:42")
+        self.assertEqual(credential, "XFHcqbiwwYplx08uwS3NeUJ34U0=")
+        self.assertEqual(expiry, 1700086400)
+
+        server = self._turn_server(WebRTCConfig.get_ice_servers(self.user))
+        username, credential = server["username"], server["credential"]
+        now = time.time()
+        self.assertTrue(username.endswith(f":{self.user.pk}"))
+        self.assertTrue(coturn_accepts("coturn-secret", username, credential, now))
+        self.assertFalse(coturn_accepts("other-secret", username, credential, now))
+        self.assertFalse(
+            coturn_accepts("coturn-secret", username, credential, now + 3601)
+        )
+
+    def test_credentials_are_cached_per_user(self):
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="password123"
+        )
+        with mock.patch(
+            "communication.webrtc_config.mint_turn_credentials",
+            wraps=mint_turn_credentials,
+        ) as mint:
+            first = WebRTCConfig.get_ice_config(self.user)
+            self.assertEqual(WebRTCConfig.get_ice_config(self.user), first)
+            self.assertEqual(mint.call_count, 1)
+
+            WebRTCConfig.get_ice_config(other)
+            self.assertEqual(mint.call_count, 2)
+
+            # Not cached when the credentials would be due for refresh at once
+            with override_settings(WEBRTC_TURN={**TURN, "REFRESH_BEFORE": 3600}):
+                cache.clear()
+                WebRTCConfig.get_ice_config(self.user)
+                WebRTCConfig.get_ice_config(self.user)
+            self.assertEqual(mint.call_count, 4)
+
+    def test_only_stun_without_a_secret(self):
+        with override_settings(WEBRTC_TURN={**TURN, "SECRET": ""}):
+            ice_config = WebRTCConfig.get_ice_config(self.user)
+        self.assertIsNone(ice_config["expires_at"])
+        self.assertTrue(
+            all(s["urls"].startswith("stun:") for s in ice_config["ice_servers"])
+        )
+
+    async def test_room_join_carries_ice_servers(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(
+                [re_path(r"^ws/chat/(?P<room_id>[^/]+)/$", ChatConsumer.as_asgi())]
+            ),
+            f"/ws/chat/{self.room.id}/",
+        )
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        frame = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual(frame["type"], "room_joined")
+        self.assertEqual(frame["room_id"], str(self.room.id))
+        server = self._turn_server(frame["ice_servers"])
+        self.assertEqual(server["urls"], TURN["URLS"])
+        self.assertGreater(frame["ice_servers_expires_at"], time.time())
+
+        # The REST config serves the same cached credentials
+        response = await database_sync_to_async(self.client.get)(
+            reverse("room-webrtc-config", kwargs={"pk": self.room.id})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._turn_server(response.data["ice_servers"]), server)
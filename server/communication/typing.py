@@ -0,0 +1,150 @@
+import asyncio
+import os
+import socket
+import time
+
+from django.conf import settings
+
+from .metrics import metrics
+
+# Tags this process's typing_users frames, so receivers can merge the typers
+# that every worker reports for a room
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class RoomTypingAggregator:
+    """
+    Collects typing start/stop events for one room and broadcasts the set of
+    users currently typing at most once per interval, and only when it
+    changed. Typers that stop sending updates expire after ``ttl`` seconds.
+
+    State is per process: each worker reports the typers connected to it,
+    in frames tagged with its origin that receivers merge (see TypingView).
+    An unchanged set of typers is re-sent every ttl / 2 so receivers can
+    tell a quiet worker from a dead one.
+    """
+
+    def __init__(
+        self, room_group_name, channel_layer, interval, ttl, on_idle, origin=WORKER_ID
+    ):
+        self.room_group_name = room_group_name
+        self.channel_layer = channel_layer
+        self.interval = interval
+        self.ttl = ttl
+        self.on_idle = on_idle
+        self.origin = origin
+        self.typers = {}  # user_id -> (username, expires_at)
+        self._last_sent = frozenset()
+        self._last_sent_at = 0.0
+        self._task = None
+
+    def update(self, user_id, username, is_typing):
+        metrics.counter("typing.events_in").inc()
+        if is_typing:
+            self.typers[user_id] = (username, time.monotonic() + self.ttl)
+        else:
+            self.typers.pop(user_id, None)
+
+        loop = asyncio.get_running_loop()
+        running = (
+            self._task is not None
+            and not self._task.done()
+            and self._task.get_loop() is loop
+        )
+        if not running:
+            self._task = loop.create_task(self._run())
+
+    def _expire(self):
+        now = time.monotonic()
+        for user_id, (_, expires_at) in list(self.typers.items()):
+            if expires_at <= now:
+                del self.typers[user_id]
+
+    async def _run(self):
+        # Runs while anyone is typing, or a final "nobody" frame is owed
+        while True:
+            await asyncio.sleep(self.interval)
+            self._expire()
+
+            current = frozenset(self.typers)
+            now = time.monotonic()
+            refresh = current and now - self._last_sent_at >= self.ttl / 2
+            if current != self._last_sent or refresh:
+                self._last_sent = current
+                self._last_sent_at = now
+                metrics.counter("typing.frames_out").inc()
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        "type": "typing_users",
+                        "origin": self.origin,
+                        "ttl": self.ttl,
+                        "users": [
+                            {"user_id": user_id, "username": username}
+                            for user_id, (username, _) in sorted(self.typers.items())
+                        ],
+                    },
+                )
+
+            # Typers who left while the last frame was being sent are still
+            # owed the empty frame on the next tick
+            if not self.typers and not self._last_sent:
+                self.on_idle(self.room_group_name)
+                return
+
+
+class TypingView:
+    """
+    One connection's view of a room's typers: the latest typing_users frame
+    from each origin, merged. An origin not heard from for its ttl is
+    dropped, so the typers of a worker that went away do not linger.
+    """
+
+    def __init__(self):
+        self._origins = {}  # origin -> (users, expires_at)
+
+    def apply(self, event):
+        """Fold in a typing_users event; the room's typers, by user id"""
+        now = time.monotonic()
+        origin = event.get("origin", "")
+        if event["users"]:
+            self._origins[origin] = (event["users"], now + event.get("ttl", 6))
+        else:
+            self._origins.pop(origin, None)
+
+        typers = {}
+        for origin, (users, expires_at) in list(self._origins.items()):
+            if expires_at <= now:
+                del self._origins[origin]
+                continue
+            for user in users:
+                typers.setdefault(user["user_id"], user)
+        return [typers[user_id] for user_id in sorted(typers)]
+
+
+class TypingAggregators:
+    """Per-process registry of room aggregators, created on demand"""
+
+    def __init__(self):
+        self._rooms = {}
+
+    def update(self, channel_layer, room_group_name, user_id, username, is_typing):
+        aggregator = self._rooms.get(room_group_name)
+        if aggregator is None:
+            if not is_typing:
+                return
+            config = getattr(settings, "TYPING_INDICATORS", {})
+            aggregator = self._rooms[room_group_name] = RoomTypingAggregator(
+                room_group_name,
+                channel_layer,
+                interval=config.get("INTERVAL_MS", 500) / 1000,
+                ttl=config.get("TTL_MS", 6000) / 1000,
+                on_idle=self._discard,
+            )
+        aggregator.update(user_id, username, is_typing)
+
+    def _discard(self, room_group_name):
+        self._rooms.pop(room_group_name, None)
+
+
+typing_aggregators = TypingAggregators()
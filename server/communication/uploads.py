@@ -0,0 +1,90 @@
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+
+# Binary upload frames are the 16 raw bytes of the upload id followed by data
+UPLOAD_ID_BYTES = 16
+
+# Data beyond this stays on disk instead of in memory while spooling
+SPOOL_MEMORY_LIMIT = 256 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChunkedUpload:
+    """
+    A media upload received over WebSocket in binary chunks. Chunks are
+    written straight to a spooled temp file and the running size is
+    checked against MAX_UPLOAD_SIZE as they arrive, so a payload is never
+    held in memory as one string.
+    """
+
+    media_types = ("image", "video", "audio")
+
+    def __init__(self, media_type, filename, size=None, caption=""):
+        if media_type not in self.media_types:
+            raise UploadError(f"Unsupported media type: {media_type}")
+
+        ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+        allowed_extensions = settings.ALLOWED_UPLOAD_EXTENSIONS.get(media_type, [])
+        if ext not in allowed_extensions:
+            raise UploadError(
+                f"File extension '{ext}' not allowed. Allowed extensions: {', '.join(allowed_extensions)}"
+            )
+
+        if size is not None:
+            if not isinstance(size, int) or size <= 0:
+                raise UploadError("size must be a positive integer")
+            self._check_limit(size)
+
+        self.id = uuid.uuid4()
+        self.media_type = media_type
+        self.filename = f"{media_type}.{ext}"
+        self.declared_size = size
+        self.caption = caption
+        self.received = 0
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+
+    @staticmethod
+    def _check_limit(size):
+        if size > settings.MAX_UPLOAD_SIZE:
+            raise UploadError(
+                f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE/1024/1024}MB"
+            )
+
+    def write(self, chunk):
+        """Append a chunk (a memoryview of the frame, not a copy)"""
+        self.received += len(chunk)
+        self._check_limit(self.received)
+        if self.declared_size is not None and self.received > self.declared_size:
+            raise UploadError("Upload is larger than its declared size")
+        self.spool.write(chunk)
+
+    def finish(self):
+        """The completed upload as a Django File positioned at the start"""
+        if not self.received:
+            raise UploadError("Upload is empty")
+        if self.declared_size is not None and self.received != self.declared_size:
+            raise UploadError(
+                f"Upload incomplete: received {self.received} of {self.declared_size} bytes"
+            )
+        self.spool.seek(0)
+        upload = File(self.spool, name=self.filename)
+        upload.size = self.received
+        return upload
+
+    def discard(self):
+        self.spool.close()
+
+
+def split_frame(frame):
+    """Split a binary frame into (upload id, chunk view) without copying"""
+    if len(frame) <= UPLOAD_ID_BYTES:
+        raise UploadError("Binary frame too short")
+    view = memoryview(frame)
+    return uuid.UUID(bytes=bytes(view[:UPLOAD_ID_BYTES])), view[UPLOAD_ID_BYTES:]
@@ -6,8 +6,14 @@ from .views import (
     MediaFileViewSet,
     DirectRoomView,
     RoomMessagesView,
+    MarkRoomReadView,
     UsernameLoginView,
     WebRTCConfigView,
+    MetricsView,
+    PresenceView,
+    MessageSearchView,
+    ConnectTicketView,
+    SyncView,
     # Remove this line:
     # IncomingCallNotificationView,
     # Use the ViewSet instead:
@@ -20,6 +26,7 @@ from .room_finders import (
     FindGroupRoomsView,
     FindRoomByNameView,
     UserRoomsView,
+    InboxView,
 )
 from django.urls import re_path
 from django.urls.converters import UUIDConverter
@@ -65,6 +72,11 @@ urlpatterns = [
         RoomMessagesView.as_view(),
         name="room-messages",
     ),
+    path(
+        "rooms/<uuid:room_id>/read/",
+        MarkRoomReadView.as_view(),
+        name="room-mark-read",
+    ),
     # Replace the problematic line with a more specific ViewSet method
     path(
         "rooms/<uuid:pk>/",
@@ -83,6 +95,7 @@ urlpatterns = [
     path("find-group-rooms/", FindGroupRoomsView.as_view(), name="find-group-rooms"),
     path("find-room-by-name/", FindRoomByNameView.as_view(), name="find-room-by-name"),
     path("my-rooms/", UserRoomsView.as_view(), name="my-rooms"),
+    path("inbox/", InboxView.as_view(), name="inbox"),
     # Removed the redundant send_message path
     path(
         "rooms/create_direct_chat/", DirectRoomView.as_view(), name="create-direct-chat"
@@ -93,6 +106,11 @@ urlpatterns = [
         WebRTCConfigView.as_view(),
         name="room-webrtc-config",
     ),
+    path("presence/", PresenceView.as_view(), name="presence"),
+    path("search/messages/", MessageSearchView.as_view(), name="message-search"),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path("ws-ticket/", ConnectTicketView.as_view(), name="connect-ticket"),
+    path("metrics/", MetricsView.as_view(), name="communication-metrics"),
     # REMOVE THESE CONFLICTING PATHS:
     # path("incoming-calls/", IncomingCallNotificationView.as_view(), name="incoming-calls"),
     # path("incoming-calls/<uuid:notification_id>/", IncomingCallNotificationView.as_view(), name="update-incoming-call"),
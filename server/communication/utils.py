@@ -3,10 +3,9 @@ import cloudinary.uploader
 import cloudinary.api
 from django.conf import settings
 import logging
-import os
 from django.core.exceptions import ValidationError
-from io import BytesIO
-from PIL import Image
+from .image_variants import store_image
+from .media_storage import get_media_storage, validate_media_file
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -34,24 +33,7 @@ class CloudinaryHelper:
         """
         Validate file size and type
         """
-        # Check file size
-        if hasattr(file, "size") and file.size > settings.MAX_UPLOAD_SIZE:
-            raise ValidationError(
-                f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE/1024/1024}MB"
-            )
-
-        # Check file extension
-        if hasattr(file, "name"):
-            ext = os.path.splitext(file.name)[1].lower().replace(".", "")
-            allowed_extensions = settings.ALLOWED_UPLOAD_EXTENSIONS.get(media_type, [])
-
-            if ext not in allowed_extensions:
-                raise ValidationError(
-                    f"File extension '{ext}' not allowed. Allowed extensions: {', '.join(allowed_extensions)}"
-                )
-
-            return ext
-        return None
+        return validate_media_file(file, media_type)
 
     @staticmethod
     def upload_image(file, folder="app_images", **kwargs):
@@ -59,29 +41,8 @@ class CloudinaryHelper:
         Upload image to Cloudinary with advanced options
         """
         try:
-            # Validate file
-            ext = CloudinaryHelper.validate_file(file, "image")
-
-            # Optimize image before upload if it's a common format
-            if hasattr(file, "content_type") and file.content_type.lower() in [
-                "image/jpeg",
-                "image/png",
-            ]:
-                try:
-                    img = Image.open(file)
-                    output = BytesIO()
-
-                    # Preserve format
-                    format = (
-                        "JPEG" if file.content_type.lower() == "image/jpeg" else "PNG"
-                    )
-
-                    # Save with optimized quality
-                    img.save(output, format=format, quality=85, optimize=True)
-                    output.seek(0)
-                    file = output
-                except Exception as e:
-                    logger.warning(f"Image optimization failed: {str(e)}")
+            # Validate file (resizing and re-encoding happen in image_variants)
+            CloudinaryHelper.validate_file(file, "image")
 
             upload_options = {
                 "folder": folder,
@@ -109,49 +70,6 @@ class CloudinaryHelper:
             logger.error(f"Unexpected error during image upload: {str(e)}")
             raise Exception(f"Failed to upload image: {str(e)}")
 
-    @staticmethod
-    def upload_video(file, folder="app_videos", **kwargs):
-        """
-        Upload video to Cloudinary with advanced options
-        """
-        try:
-            # Validate file
-            CloudinaryHelper.validate_file(file, "video")
-
-            upload_options = {
-                "folder": folder,
-                "resource_type": "video",
-                "transformation": [
-                    {"width": 640, "crop": "limit"},  # Maximum width
-                    {"quality": "auto:good"},  # Quality optimization
-                ],
-                "eager": [
-                    # Generate thumbnail
-                    {"width": 320, "height": 180, "crop": "fill", "format": "jpg"}
-                ],
-                **kwargs,
-            }
-
-            result = cloudinary.uploader.upload(file, **upload_options)
-            return {
-                "video_url": result["secure_url"],
-                "public_id": result["public_id"],
-                "thumbnail_url": (
-                    result.get("eager", [{}])[0].get("secure_url", None)
-                    if result.get("eager")
-                    else None
-                ),
-            }
-        except cloudinary.exceptions.Error as e:
-            logger.error(f"Cloudinary Video Upload Error: {e}")
-            raise Exception(f"Cloudinary Video Upload Error: {e}")
-        except ValidationError as e:
-            logger.error(f"Validation Error: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during video upload: {str(e)}")
-            raise Exception(f"Failed to upload video: {str(e)}")
-
     @staticmethod
     def upload_audio(file, folder="app_audio", **kwargs):
         """
@@ -285,21 +203,33 @@ class CloudinaryHelper:
 
 class MediaProcessor:
     """
-    Utility class for media processing
+    Utility class for media processing. Uploads go to the configured media
+    storage backend (MEDIA_STORAGE), Cloudinary unless set to local.
     """
 
     @staticmethod
     def upload_image(file):
-        return CloudinaryHelper.upload_image(file)
+        """
+        Store the image's thumb/medium/full variants; returns the full
+        variant's url and public_id plus "variants" and "placeholder"
+        """
+        return store_image(file)
 
     @staticmethod
     def upload_video(file):
-        return CloudinaryHelper.upload_video(file)
+        stored = get_media_storage().save(file, "video")
+        return stored and {
+            "video_url": stored["url"],
+            "public_id": stored["name"],
+            "thumbnail_url": stored.get("thumbnail_url"),
+        }
 
     @staticmethod
     def upload_audio(file):
-        return CloudinaryHelper.upload_audio(file)
+        stored = get_media_storage().save(file, "audio")
+        return stored and stored["url"]
 
     @staticmethod
     def upload_document(file):
-        return CloudinaryHelper.upload_document(file)
+        stored = get_media_storage().save(file, "document")
+        return stored and stored["url"]
@@ -4,9 +4,9 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from channels.db import database_sync_to_async
 import logging
 from django.db import transaction
+from django.core.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 from django.utils import timezone
@@ -19,7 +19,16 @@ from django.db import transaction
 from django.db.models import Q
 from rest_framework.decorators import action
 
-from .models import Room, Message, Participant, CallLog, CallInvitation, MediaFile
+from .models import (
+    Room,
+    Message,
+    Participant,
+    CallLog,
+    CallInvitation,
+    MediaFile,
+    DirectRoomKey,
+    SyncEvent,
+)
 from .serializers import (
     RoomSerializer,
     MessageSerializer,
@@ -27,6 +36,8 @@ from .serializers import (
     CallInvitationSerializer,
     ParticipantSerializer,
     MediaFileSerializer,
+    MessageSearchResultSerializer,
+    read_watermarks_for,
 )
 
 from django.contrib.auth import get_user_model
@@ -46,6 +57,16 @@ from .serializers import MessageSerializer
 
 # Import WebRTCConfig from the right location
 from .webrtc_config import WebRTCConfig
+from .pagination import MessageCursorPagination
+from .metrics import metrics
+from .presence import get_presence
+from .search import SearchError, search_messages
+from .connect_tickets import grantable_room_ids, issue_ticket, ticket_ttl
+from .fanout import chat_message_event, send_to_groups
+from .membership import is_room_member
+from . import call_expiry, room_tail
+from .sync import SyncError, SyncTokenExpired, changes_since, head_token
+from rest_framework.utils.urls import replace_query_param
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -56,6 +77,20 @@ class MessagePagination(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
 
+    def is_first_page(self, request):
+        return request.query_params.get(self.page_query_param, "1") == "1"
+
+    def paginate_first_page(self, entries, count, request):
+        """
+        Paginate an already serialized first page out of count rows in total,
+        without a query
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        # Only the count and the links are read from the page
+        self.page = self.django_paginator_class(range(count), page_size).page(1)
+        return entries[:page_size]
+
 
 class UsernameLoginView(APIView):
     authentication_classes = []
@@ -113,9 +148,15 @@ class DirectRoomView(APIView):
         Get direct message rooms for the current user
         """
         # Get all direct message rooms the user is part of
-        direct_rooms = Room.objects.filter(
-            room_type="direct", communication_participants__user=request.user
-        ).distinct()
+        direct_rooms = (
+            Room.objects.filter(
+                room_type="direct", communication_participants__user=request.user
+            )
+            .select_related("last_message__sender", "last_message__room")
+            .prefetch_related("communication_participants__user")
+            .order_by("-last_activity_at", "-id")
+            .distinct()
+        )
 
         serializer = RoomSerializer(direct_rooms, many=True)
         return Response(serializer.data)
@@ -181,35 +222,14 @@ class DirectRoomView(APIView):
                 f"Direct room request: sender={request.user.username}, recipient={recipient.username}"
             )
 
-            # Check for existing direct message room
-            existing_room = (
-                Room.objects.filter(
-                    room_type="direct", communication_participants__user=request.user
-                )
-                .filter(communication_participants__user=recipient)
-                .first()
-            )
+            # Single indexed lookup on the canonical user pair
+            room, created = DirectRoomKey.get_or_create_room(request.user, recipient)
 
-            if existing_room:
-                logger.info(f"Existing room found: {existing_room.id}")
-                serializer = RoomSerializer(existing_room)
+            if not created:
+                logger.info(f"Existing room found: {room.id}")
+                serializer = RoomSerializer(room)
                 return Response(serializer.data)
 
-            # Ensure consistent room naming by sorting usernames
-            sorted_names = sorted([request.user.username, recipient.username])
-            room_name = f"Chat between {sorted_names[0]} and {sorted_names[1]}"
-
-            # Create new room with a valid UUID
-            room = Room.objects.create(
-                id=uuid.uuid4(),
-                name=room_name,
-                room_type="direct",
-            )
-
-            # Add participants
-            Participant.objects.create(user=request.user, room=room)
-            Participant.objects.create(user=recipient, room=room)
-
             logger.info(f"Created new direct room: {room.id}")
 
             serializer = RoomSerializer(room)
@@ -237,13 +257,15 @@ class RoomMessagesView(APIView):
 
     def get(self, request, room_id):
         """
-        Get messages for a specific room with pagination
+        Get messages for a specific room with pagination. The first page of a
+        hot room is served from the tail cache: the participants query (access
+        check and read watermarks) is the only one.
         """
-        try:
-            room = Room.objects.get(
-                id=room_id, communication_participants__user=request.user
-            )
-        except Room.DoesNotExist:
+        participants = Participant.objects.filter(room_id=room_id).only(
+            "room_id", "user_id", "last_read_at"
+        )
+        watermarks = read_watermarks_for(participants)
+        if request.user.pk not in watermarks:
             return Response(
                 {
                     "error": f"Room with id {room_id} does not exist or you don't have access"
@@ -251,10 +273,29 @@ class RoomMessagesView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        messages = Message.objects.filter(room=room).order_by("-sent_at")
-        paginator = self.pagination_class()
+        # Keyset pagination when the client passes a before/after cursor or
+        # ?pagination=cursor; page-number pagination otherwise
+        if MessageCursorPagination.is_requested(request):
+            paginator = MessageCursorPagination()
+        else:
+            paginator = self.pagination_class()
+
+        if paginator.is_first_page(request):
+            page_size = paginator.get_page_size(request)
+            tail = room_tail.first_page(room_id, page_size, watermarks)
+            if tail is not None:
+                page = paginator.paginate_first_page(tail.entries, tail.count, request)
+                return paginator.get_paginated_response(page)
+            room_tail.load(room_id)
+
+        messages = (
+            Message.objects.filter(room_id=room_id)
+            .select_related("sender", "room")
+            .order_by("-sent_at")
+        )
         paginated_messages = paginator.paginate_queryset(messages, request)
-        serializer = MessageSerializer(paginated_messages, many=True)
+        context = {"read_watermarks": watermarks}
+        serializer = MessageSerializer(paginated_messages, many=True, context=context)
         return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, room_id):
@@ -276,7 +317,6 @@ class RoomMessagesView(APIView):
         # Prepare message data
         message_data = {
             "room": str(room.id),
-            "sender": request.user.id,
             "content": request.data.get("content", ""),
             "message_type": request.data.get("message_type", "text"),
         }
@@ -297,13 +337,13 @@ class RoomMessagesView(APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            message = serializer.save()
+            message = serializer.save(sender=request.user)
 
             # Notify via WebSocket
             channel_layer = get_channel_layer()
             async_to_sync(channel_layer.group_send)(
                 f"room_{room.id}",
-                {"type": "chat_message", "message": serializer.data},
+                chat_message_event(serializer.data),
             )
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -311,6 +351,77 @@ class RoomMessagesView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MarkRoomReadView(APIView):
+    """Advance the current user's read watermark in a room"""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, room_id):
+        """
+        Mark every message up to message_id (default: the newest) as read.
+        Costs one UPDATE however many messages are being marked.
+        """
+        message = None
+        message_id = request.data.get("message_id")
+        if message_id:
+            try:
+                message = Message.objects.only("id", "sent_at").get(
+                    id=message_id, room_id=room_id
+                )
+            except (Message.DoesNotExist, ValueError, ValidationError):
+                return Response(
+                    {"error": f"Message {message_id} not found in room {room_id}"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+        watermark = Participant.mark_room_read(room_id, request.user, message)
+        if watermark is None:
+            # Either nothing to advance or the user is not in the room
+            try:
+                participant = Participant.objects.get(
+                    room_id=room_id, user=request.user
+                )
+            except Participant.DoesNotExist:
+                return Response(
+                    {
+                        "error": f"Room with id {room_id} does not exist or you don't have access"
+                    },
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            return Response(
+                {
+                    "room_id": str(room_id),
+                    "last_read_message_id": (
+                        str(participant.last_read_message_id)
+                        if participant.last_read_message_id
+                        else None
+                    ),
+                    "last_read_at": participant.last_read_at,
+                    "updated": False,
+                }
+            )
+
+        receipt = {
+            "room_id": str(room_id),
+            "user_id": str(request.user.id),
+            "last_read_message_id": str(watermark.id),
+            "last_read_at": watermark.sent_at.isoformat(),
+        }
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            f"room_{room_id}", {"type": "read_receipt", "receipt": receipt}
+        )
+
+        return Response(
+            {
+                "room_id": str(room_id),
+                "last_read_message_id": str(watermark.id),
+                "last_read_at": watermark.sent_at,
+                "updated": True,
+            }
+        )
+
+
 class RoomViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     queryset = Room.objects.all()
@@ -383,7 +494,7 @@ class RoomViewSet(viewsets.ModelViewSet):
                 )
 
             # Check if user is already in the room
-            if Participant.objects.filter(room=room, user=target_user).exists():
+            if is_room_member(target_user, room.id):
                 return Response(
                     {"message": "User is already a participant in this room"},
                     status=status.HTTP_200_OK,
@@ -440,47 +551,56 @@ class RoomViewSet(viewsets.ModelViewSet):
         expires_at = timezone.now() + timedelta(seconds=60)
 
         # Get other participants
-        other_participants = room.communication_participants.exclude(user=request.user)
+        other_participants = room.communication_participants.exclude(
+            user=request.user
+        ).select_related("user")
+
+        # One transaction and one batched dispatch however large the room is
+        with transaction.atomic():
+            invitations = CallInvitation.objects.bulk_create(
+                [
+                    CallInvitation(
+                        inviter=request.user,
+                        invitee=participant.user,
+                        room=room,
+                        call_type=call_type,
+                        expires_at=expires_at,
+                    )
+                    for participant in other_participants
+                ]
+            )
+            # bulk_create skips post_save, which logs these for sync
+            SyncEvent.record_calls(invitations)
 
-        invitations = []
-        for participant in other_participants:
-            invitation = CallInvitation.objects.create(
-                inviter=request.user,
-                invitee=participant.user,
+            # Also notify the room
+            message = Message.objects.create(
                 room=room,
+                sender=request.user,
+                message_type="call",
                 call_type=call_type,
-                expires_at=expires_at,
+                call_status="initiated",
             )
-            invitations.append(invitation)
 
-            # Notify each participant via WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{participant.user.id}",
-                {
-                    "type": "call_invitation",
-                    "invitation": CallInvitationSerializer(invitation).data,
-                },
+        invitation_data = CallInvitationSerializer(invitations, many=True).data
+        sends = [
+            (
+                f"user_{invitation.invitee_id}",
+                {"type": "call_invitation", "invitation": data},
+            )
+            for invitation, data in zip(invitations, invitation_data)
+        ]
+        sends.append(
+            (
+                f"room_{room.id}",
+                {"type": "call_notification", "call": MessageSerializer(message).data},
             )
-
-        # Also notify the room
-        message = Message.objects.create(
-            room=room,
-            sender=request.user,
-            message_type="call",
-            call_type=call_type,
-            call_status="initiated",
-        )
-
-        async_to_sync(channel_layer.group_send)(
-            f"room_{room.id}",
-            {"type": "call_notification", "call": MessageSerializer(message).data},
         )
+        send_to_groups(sends)
 
         return Response(
             {
                 "message": f"Call initiated in room {room.id}",
-                "invitations": CallInvitationSerializer(invitations, many=True).data,
+                "invitations": invitation_data,
             },
             status=status.HTTP_201_CREATED,
         )
@@ -489,6 +609,7 @@ class RoomViewSet(viewsets.ModelViewSet):
     def webrtc_config(self, request, pk=None):
         """Get WebRTC configuration for a room"""
         room = self.get_object()
+        ice_config = WebRTCConfig.get_ice_config(request.user)
 
         # Generate WebRTC configuration
         config = {
@@ -497,7 +618,8 @@ class RoomViewSet(viewsets.ModelViewSet):
                 "name": room.name,
                 "type": room.room_type,
             },
-            "ice_servers": WebRTCConfig.get_ice_servers(),
+            "ice_servers": ice_config["ice_servers"],
+            "ice_servers_expires_at": ice_config["expires_at"],
             "media_constraints": WebRTCConfig.get_media_constraints(),
             "token": request.auth.key if request.auth else None,
         }
@@ -534,10 +656,38 @@ class MessageViewSet(viewsets.ModelViewSet):
             return Message.objects.none()
 
         # Verify that the user has access to this room
-        return Message.objects.filter(
-            room_id=validated_room_id,
-            room__communication_participants__user=self.request.user,
-        ).order_by("-sent_at")
+        return (
+            Message.objects.filter(
+                room_id=validated_room_id,
+                room__communication_participants__user=self.request.user,
+            )
+            .select_related("sender", "room")
+            .order_by("-sent_at")
+        )
+
+    def get_serializer_context(self):
+        """Preload the room's read watermarks so is_read costs no queries"""
+        context = super().get_serializer_context()
+        room_id = self.request.query_params.get("room_id")
+        if self.action == "list" and room_id:
+            try:
+                participants = Participant.objects.filter(
+                    room_id=self.validate_room_id(room_id)
+                )
+                context["read_watermarks"] = read_watermarks_for(participants)
+            except serializers.ValidationError:
+                pass
+        return context
+
+    @property
+    def paginator(self):
+        """Use keyset pagination when the client asks for a cursor"""
+        if not hasattr(self, "_paginator"):
+            if MessageCursorPagination.is_requested(self.request):
+                self._paginator = MessageCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def create(self, request, *args, **kwargs):
         """Override create to ensure room_id is valid and user has access"""
@@ -580,7 +730,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             channel_layer = get_channel_layer()
             async_to_sync(channel_layer.group_send)(
                 f"room_{room_id}",
-                {"type": "chat_message", "message": serializer.data},
+                chat_message_event(serializer.data),
             )
 
         headers = self.get_success_headers(serializer.data)
@@ -640,13 +790,7 @@ class FindDirectRoomView(APIView):
             other_user = User.objects.get(username=other_username)
 
             # Find direct room between current user and other user
-            room = (
-                Room.objects.filter(
-                    room_type="direct", communication_participants__user=request.user
-                )
-                .filter(communication_participants__user=other_user)
-                .first()
-            )
+            room = DirectRoomKey.find_room(request.user, other_user)
 
             if not room:
                 return Response(
@@ -680,31 +824,10 @@ class FindDirectRoomView(APIView):
             user1 = User.objects.get(username=username1)
             user2 = User.objects.get(username=username2)
 
-            # Find rooms where both users are participants
-            # and the room type is "direct"
-            room = (
-                Room.objects.filter(
-                    room_type="direct", communication_participants__user=user1
-                )
-                .filter(communication_participants__user=user2)
-                .first()
-            )
-
-            # If room doesn't exist, create it
-            if not room:
-                # Create room name using alphabetically sorted usernames
-                sorted_names = sorted([username1, username2])
-                room_name = f"Chat between {sorted_names[0]} and {sorted_names[1]}"
-
-                # Create the room
-                room = Room.objects.create(name=room_name, room_type="direct")
-
-                # Add participants
-                from .models import Participant
-
-                Participant.objects.create(user=user1, room=room)
-                Participant.objects.create(user=user2, room=room)
+            # Find or create the pair's room through its canonical key
+            room, created = DirectRoomKey.get_or_create_room(user1, user2)
 
+            if created:
                 logger.info(
                     f"Created new direct room between {username1} and {username2}"
                 )
@@ -806,6 +929,7 @@ class WebRTCConfigView(APIView):
             room = Room.objects.get(
                 id=room_id, communication_participants__user=request.user
             )
+            ice_config = WebRTCConfig.get_ice_config(request.user)
 
             # Generate WebRTC configuration
             config = {
@@ -814,7 +938,8 @@ class WebRTCConfigView(APIView):
                     "name": room.name,
                     "type": room.room_type,
                 },
-                "ice_servers": WebRTCConfig.get_ice_servers(),
+                "ice_servers": ice_config["ice_servers"],
+                "ice_servers_expires_at": ice_config["expires_at"],
                 "media_constraints": WebRTCConfig.get_media_constraints(),
                 "token": request.auth.key if request.auth else None,
             }
@@ -836,6 +961,210 @@ class WebRTCConfigView(APIView):
             )
 
 
+class PresenceView(APIView):
+    """
+    Bulk online lookup for a room (?room_id=) or a contact list
+    (?user_ids=1,2,3), answered with one presence-store round trip. Only
+    users who share a room with the caller are reported; other ids are
+    left out of the response.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        room_id = request.query_params.get("room_id")
+        user_ids = request.query_params.get("user_ids")
+
+        if room_id:
+            try:
+                user_ids = list(
+                    Participant.objects.filter(room_id=room_id)
+                    .filter(room__communication_participants__user=request.user)
+                    .values_list("user_id", flat=True)
+                )
+            except ValidationError:
+                return Response(
+                    {"error": "Invalid room ID format"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not user_ids:
+                return Response(
+                    {
+                        "error": f"Room with id {room_id} does not exist or you don't have access"
+                    },
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+        elif user_ids:
+            try:
+                user_ids = [int(user_id) for user_id in user_ids.split(",") if user_id]
+            except ValueError:
+                return Response(
+                    {"error": "user_ids must be a comma-separated list of ids"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            visible = set(
+                Participant.objects.filter(
+                    user_id__in=user_ids,
+                    room__communication_participants__user=request.user,
+                ).values_list("user_id", flat=True)
+            )
+            visible.add(request.user.id)
+            user_ids = [user_id for user_id in user_ids if user_id in visible]
+        else:
+            return Response(
+                {"error": "room_id or user_ids parameter is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            online = get_presence().online_users_sync(user_ids)
+        except Exception as e:
+            logger.error(f"Error querying presence: {str(e)}")
+            return Response(
+                {"error": f"Failed to query presence: {str(e)}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        return Response(
+            {
+                "online": sorted(online),
+                "offline": sorted(set(user_ids) - online),
+            }
+        )
+
+
+class MessageSearchView(APIView):
+    """
+    Full-text search over the messages of every room the user is in.
+    ?q= is required; ?room_id= narrows it to one room. Results come best
+    match first with a highlighted snippet; pass ?cursor= from the previous
+    page to continue.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    page_size = 20
+    max_page_size = 50
+
+    def get(self, request):
+        try:
+            page_size = int(request.query_params.get("page_size", self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        page_size = max(1, min(page_size, self.max_page_size))
+
+        try:
+            results = search_messages(
+                request.user,
+                request.query_params.get("q", ""),
+                room_id=request.query_params.get("room_id"),
+                cursor=request.query_params.get("cursor"),
+                limit=page_size,
+            )
+        except SearchError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = None
+        if results.next_cursor:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", results.next_cursor
+            )
+        return Response(
+            {
+                "next": next_url,
+                "cursor": results.next_cursor,
+                "results": MessageSearchResultSerializer(
+                    results.messages, many=True
+                ).data,
+            }
+        )
+
+
+class SyncView(APIView):
+    """
+    Catch up on everything that changed across the user's rooms since a sync
+    token, in one request: ?since=<sync_token>[&limit=]. Without ?since the
+    current token is returned, to start syncing from now. Keep requesting
+    with the returned sync_token while has_more is true; a 410 means the
+    token is too old and the client must refetch its rooms.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get("since")
+        if since is None:
+            return Response({"sync_token": head_token(), "has_more": False})
+
+        try:
+            limit = int(request.query_params.get("limit", 0)) or None
+        except ValueError:
+            limit = None
+
+        try:
+            return Response(changes_since(request.user, since, limit=limit))
+        except SyncTokenExpired as e:
+            return Response(
+                {"error": str(e), "sync_token": head_token()},
+                status=status.HTTP_410_GONE,
+            )
+        except SyncError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ConnectTicketView(APIView):
+    """
+    Issue a short-lived, single-use signed ticket for opening a WebSocket
+    as ?ticket=<ticket>. The WebSocket middleware verifies it without a
+    database query, and joining a room the ticket grants skips the
+    participant check. Pass "room_ids" to grant specific rooms; by default
+    the user's most recently active rooms are granted.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        room_ids = request.data.get("room_ids")
+        if room_ids is not None and not isinstance(room_ids, list):
+            return Response(
+                {"error": "room_ids must be a list of room ids"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            room_ids = grantable_room_ids(request.user, room_ids)
+        except ValidationError:
+            return Response(
+                {"error": "Invalid room ID format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "ticket": issue_ticket(request.user, room_ids),
+                "expires_in": ticket_ttl(),
+                "room_ids": room_ids,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class MetricsView(APIView):
+    """
+    In-process communication metrics (write-behind batches, caches, ...)
+    for the worker that serves the request
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "started_at": metrics.started_at,
+                "metrics": metrics.snapshot(),
+            }
+        )
+
+
 # Add to views.py
 
 from rest_framework.views import APIView
@@ -910,7 +1239,7 @@ class IncomingCallNotificationView(APIView):
                 )
 
             # Verify user has access to this room
-            if not Participant.objects.filter(room=room, user=request.user).exists():
+            if not is_room_member(request.user, room.id):
                 logger.warning(
                     f"User {request.user.id} does not have access to room {room_id}"
                 )
@@ -920,7 +1249,7 @@ class IncomingCallNotificationView(APIView):
                 )
 
             # Check if recipient is a participant in the room
-            if not Participant.objects.filter(room=room, user=recipient).exists():
+            if not is_room_member(recipient, room.id):
                 logger.warning(
                     f"Recipient {recipient_id} is not a participant in room {room_id}"
                 )
@@ -1097,10 +1426,8 @@ class IncomingCallNotificationView(APIView):
         # Add debug logging
         logger.debug(f"Retrieving call notifications for user {request.user.id}")
 
-        # First, expire any outdated notifications
-        self._expire_outdated_notifications(request.user)
-
-        # Get active notifications (not expired and not ended)
+        # Get active notifications (not expired and not ended); overdue ones
+        # are marked expired by the expire_calls worker, not here
         active_notifications = IncomingCallNotification.objects.filter(
             recipient=request.user,
             status__in=["pending", "seen"],
@@ -1138,25 +1465,6 @@ class IncomingCallNotificationView(APIView):
             }
         )
 
-    @database_sync_to_async
-    def _expire_outdated_notifications(self):
-        """Efficiently expire outdated notifications with index-optimized query"""
-        now = timezone.now()
-
-        try:
-            # Use a more efficient query with proper indexing
-            expired_count = IncomingCallNotification.objects.filter(
-                status__in=["pending", "seen"], expires_at__lte=now
-            ).update(status="expired")
-
-            if expired_count > 0:
-                logger.info(f"Expired {expired_count} outdated notifications")
-
-            return expired_count
-        except Exception as e:
-            logger.error(f"Error expiring notifications: {str(e)}")
-            return 0
-
     # Add these methods to IncomingCallNotificationView class
 
     def delete(self, request, notification_id=None):
@@ -1289,9 +1597,6 @@ class IncomingCallNotificationViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         """Get active and recent incoming call notifications for the current user"""
-        # First, expire any outdated notifications
-        self._expire_outdated_notifications()
-
         # Get active notifications
         active_notifications = IncomingCallNotification.objects.filter(
             recipient=request.user,
@@ -1390,7 +1695,7 @@ class IncomingCallNotificationViewSet(viewsets.ModelViewSet):
                 )
 
             # Verify user has access to this room
-            if not Participant.objects.filter(room=room, user=request.user).exists():
+            if not is_room_member(request.user, room.id):
                 logger.warning(
                     f"User {request.user.id} does not have access to room {room_id}"
                 )
@@ -1400,7 +1705,7 @@ class IncomingCallNotificationViewSet(viewsets.ModelViewSet):
                 )
 
             # Check if recipient is a participant in the room
-            if not Participant.objects.filter(room=room, user=recipient).exists():
+            if not is_room_member(recipient, room.id):
                 logger.warning(
                     f"Recipient {recipient_id} is not a participant in room {room_id}"
                 )
@@ -1652,25 +1957,6 @@ class IncomingCallNotificationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-    @database_sync_to_async
-    def _expire_outdated_notifications(self):
-        """Efficiently expire outdated notifications with index-optimized query"""
-        now = timezone.now()
-
-        try:
-            # Use a more efficient query with proper indexing
-            expired_count = IncomingCallNotification.objects.filter(
-                status__in=["pending", "seen"], expires_at__lte=now
-            ).update(status="expired")
-
-            if expired_count > 0:
-                logger.info(f"Expired {expired_count} outdated notifications")
-
-            return expired_count
-        except Exception as e:
-            logger.error(f"Error expiring notifications: {str(e)}")
-            return 0
-
     # In apps.py or a management command
     @classmethod
     def cleanup_expired_notifications(cls):
@@ -1680,9 +1966,15 @@ class IncomingCallNotificationViewSet(viewsets.ModelViewSet):
         try:
             # Delete notifications that have been expired for more than 7 days
             seven_days_ago = timezone.now() - timedelta(days=7)
-            deleted_count = IncomingCallNotification.objects.filter(
-                status="expired", updated_at__lt=seven_days_ago
-            ).delete()[0]
+            batch_size = 500
+            deleted_count = 0
+            while True:
+                deleted = call_expiry.purge_expired(
+                    IncomingCallNotification, seven_days_ago, batch_size
+                )
+                deleted_count += deleted
+                if deleted < batch_size:
+                    break
 
             logger.info(f"Deleted {deleted_count} old expired notifications")
             return deleted_count
@@ -1815,85 +2107,77 @@ class IncomingCallNotificationViewSet(viewsets.ModelViewSet):
             room = Room.objects.get(id=room_id)
 
             # Verify user has access to this room
-            if not Participant.objects.filter(room=room, user=request.user).exists():
+            if not is_room_member(request.user, room.id):
                 return Response(
                     {"error": "You do not have access to this room"},
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
             # Get all participants except caller
-            participants = Participant.objects.filter(room=room).exclude(
-                user=request.user
+            participants = list(
+                Participant.objects.filter(room=room)
+                .exclude(user=request.user)
+                .select_related("user")
             )
 
-            if not participants.exists():
+            if not participants:
                 return Response(
                     {"error": "No other participants found in this room"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Create notifications for all participants
-            notifications = []
+            # Create notifications for all participants, in one transaction
             expires_at = timezone.now() + timedelta(seconds=60)
-
-            for participant in participants:
+            with transaction.atomic():
                 # Cancel any existing pending notifications
                 IncomingCallNotification.objects.filter(
-                    caller=request.user,
-                    recipient=participant.user,
-                    room=room,
-                    status="pending",
+                    caller=request.user, room=room, status="pending"
                 ).update(status="expired")
 
-                # Create new notification
-                notification = IncomingCallNotification.objects.create(
-                    caller=request.user,
-                    recipient=participant.user,
-                    room=room,
-                    call_type=call_type,
-                    expires_at=expires_at,
-                    device_token=device_token,
+                notifications = IncomingCallNotification.objects.bulk_create(
+                    [
+                        IncomingCallNotification(
+                            caller=request.user,
+                            recipient=participant.user,
+                            room=room,
+                            call_type=call_type,
+                            expires_at=expires_at,
+                            device_token=device_token,
+                        )
+                        for participant in participants
+                    ]
                 )
-                notifications.append(notification)
-
-            # Send notifications via WebSocket to each recipient
-            channel_layer = get_channel_layer()
-            for notification in notifications:
-                serializer = self.get_serializer(notification)
-
-                # Send to user's personal channel
-                user_group_name = f"user_{notification.recipient.id}"
-                async_to_sync(channel_layer.group_send)(
-                    user_group_name,
-                    {"type": "incoming_call", "notification": serializer.data},
+                # bulk_create skips post_save, which logs these for sync
+                SyncEvent.record_calls(notifications)
+
+            # Send each recipient its notification on its personal channel, and
+            # the first one to the room as room_call_announcement, in one batch
+            notification_data = self.get_serializer(notifications, many=True).data
+            sends = [
+                (
+                    f"user_{notification.recipient_id}",
+                    {"type": "incoming_call", "notification": data},
                 )
-
-            # Also send as room_call_announcement
-            room_group_name = f"room_{room.id}"
-            primary_notification = notifications[0] if notifications else None
-            if primary_notification:
-                primary_serializer = self.get_serializer(primary_notification)
-                async_to_sync(channel_layer.group_send)(
-                    room_group_name,
+                for notification, data in zip(notifications, notification_data)
+            ]
+            sends.append(
+                (
+                    f"room_{room.id}",
                     {
                         "type": "room_call_announcement",
-                        "notification": primary_serializer.data,
+                        "notification": notification_data[0],
                     },
                 )
+            )
+            send_to_groups(sends)
 
             # Return info about the created notifications
             return Response(
                 {
                     "success": True,
                     "data": {
-                        "notifications": self.get_serializer(
-                            notifications, many=True
-                        ).data,
-                        "primaryNotification": (
-                            self.get_serializer(notifications[0]).data
-                            if notifications
-                            else None
-                        ),
+                        "notifications": notification_data,
+                        "primaryNotification": notification_data[0],
                     },
                     "meta": {
                         "count": len(notifications),
@@ -3,6 +3,8 @@ from channels.exceptions import DenyConnection
 from channels.db import database_sync_to_async
 import logging
 
+from .membership import is_room_member_async
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
@@ -138,11 +140,8 @@ class WebRTCSignalingConsumer(AsyncJsonWebsocketConsumer):
             )
 
     # Database Sync Methods
-    @database_sync_to_async
-    def is_room_participant(self):
-        from .models import Participant
-
-        return Participant.objects.filter(room_id=self.room_id, user=self.user).exists()
+    async def is_room_participant(self):
+        return await is_room_member_async(self.user, self.room_id)
 
     # WebSocket Event Handlers
     async def webrtc_offer(self, event):
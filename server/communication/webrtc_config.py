@@ -1,24 +1,91 @@
+import base64
+import hashlib
+import hmac
+import time
+
 from django.conf import settings
+from django.core.cache import caches
 from django.utils import timezone
 
+from .metrics import metrics
+
+STUN_SERVERS = [
+    # Public STUN servers
+    {"urls": "stun:stun.l.google.com:19302"},
+    {"urls": "stun:stun1.l.google.com:19302"},
+]
+
+
+def _turn_config():
+    return getattr(settings, "WEBRTC_TURN", {})
+
+
+def mint_turn_credentials(user_id, secret, ttl, now=None):
+    """
+    TURN REST credentials for user_id, as coturn verifies them with
+    use-auth-secret: the username "<expiry>:<user_id>" (expiry in Unix
+    seconds) and the base64 HMAC-SHA1 of that username under secret.
+    Returns (username, credential, expiry).
+    """
+    expiry = int(now if now is not None else time.time()) + ttl
+    username = f"{expiry}:{user_id}"
+    digest = hmac.new(secret.encode(), username.encode(), hashlib.sha1).digest()
+    return username, base64.b64encode(digest).decode(), expiry
+
 
 class WebRTCConfig:
     @staticmethod
-    def get_ice_servers():
+    def get_ice_servers(user=None):
         """
-        Generate ICE server configuration for WebRTC
+        Generate ICE server configuration for WebRTC: STUN, and with a user
+        and WEBRTC_TURN configured, the TURN relays with credentials for them
         """
-        ice_servers = [
-            # Public STUN servers
-            {"urls": "stun:stun.l.google.com:19302"},
-            {"urls": "stun:stun1.l.google.com:19302"},
-        ]
+        return WebRTCConfig.get_ice_config(user)["ice_servers"]
 
-        # Optional: Add TURN servers from settings
-        turn_servers = getattr(settings, "WEBRTC_TURN_SERVERS", [])
-        ice_servers.extend(turn_servers)
+    @staticmethod
+    def get_ice_config(user=None):
+        """
+        {"ice_servers": [...], "expires_at": <Unix seconds or None>} for
+        user. Minted TURN credentials are cached per user until
+        REFRESH_BEFORE seconds before they expire, so clients joining rooms
+        repeatedly get the same ones without an HMAC or a query.
+        """
+        config = _turn_config()
+        if user is None or not config.get("URLS") or not config.get("SECRET"):
+            return {"ice_servers": WebRTCConfig._static_servers(), "expires_at": None}
+
+        cache = caches[config.get("CACHE", "default")]
+        key = f"webrtc:ice:{user.pk}"
+        ice_config = cache.get(key)
+        if ice_config is not None:
+            metrics.counter("webrtc.ice_cache.hits").inc()
+            return ice_config
 
-        return ice_servers
+        ttl = config.get("TTL", 86400)
+        username, credential, expiry = mint_turn_credentials(
+            user.pk, config["SECRET"], ttl
+        )
+        metrics.counter("webrtc.turn_credentials.minted").inc()
+        ice_config = {
+            "ice_servers": WebRTCConfig._static_servers()
+            + [
+                {
+                    "urls": list(config["URLS"]),
+                    "username": username,
+                    "credential": credential,
+                }
+            ],
+            "expires_at": expiry,
+        }
+        timeout = ttl - config.get("REFRESH_BEFORE", 3600)
+        if timeout > 0:
+            cache.set(key, ice_config, timeout)
+        return ice_config
+
+    @staticmethod
+    def _static_servers():
+        # Optional: Add fixed TURN servers from settings
+        return STUN_SERVERS + list(getattr(settings, "WEBRTC_TURN_SERVERS", []))
 
     @staticmethod
     def get_media_constraints():
@@ -0,0 +1,255 @@
+import asyncio
+import atexit
+import logging
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .metrics import metrics
+from .models import Message, Room, SyncEvent
+from .room_tail import append_messages
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBehind:
+    """
+    Write-behind buffer for chat messages.
+
+    Consumers hand over fully built, unsaved Message instances (the id and
+    sent_at are assigned up front, so the fan-out can happen immediately).
+    An asyncio flusher persists them with bulk_create in micro-batches,
+    bounded by ``max_batch_size`` rows and ``max_delay`` seconds.
+
+    Failed batches go back to the front of the buffer and are retried with
+    backoff. A batch rejected by a constraint is replayed row by row: rows
+    that already exist (a retried batch that did commit) are skipped, and
+    rows that still fail (e.g. their room was deleted) are dropped rather
+    than blocking the rest. Each row is saved in one transaction with its
+    room pointer update and SyncEvent, so a failure never leaves a message
+    without them. The buffer is flushed on consumer disconnect and,
+    synchronously, at interpreter exit and on SIGTERM.
+
+    The buffer lives in process memory only: messages already broadcast to
+    the room but still buffered are lost if the process is killed outright
+    (SIGKILL, the OOM killer). The window is at most ``max_delay`` plus the
+    time to write a batch, or longer while the database is failing.
+
+    At most ``max_buffered`` rows wait at once; past that (the database is
+    down or falling behind) enqueue refuses new rows and callers save them
+    inline instead.
+    """
+
+    def __init__(
+        self, max_batch_size=200, max_delay=0.05, max_backoff=5.0, max_buffered=10000
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_backoff = max_backoff
+        self.max_buffered = max_buffered
+        self._buffer = []
+        self._inflight = []
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._full = None
+        self._flush_lock = None
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, "CHAT_WRITE_BEHIND", {})
+        return cls(
+            max_batch_size=config.get("MAX_BATCH_SIZE", 200),
+            max_delay=config.get("MAX_DELAY_MS", 50) / 1000,
+            max_buffered=config.get("MAX_BUFFERED", 10000),
+        )
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, "CHAT_WRITE_BEHIND", {}).get("ENABLED", False)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def has_pending(self, room_id, message_id=None):
+        """
+        Whether a message of room_id (the one with message_id, if given) is
+        buffered or being written, i.e. not yet readable from the database
+        """
+        for message, _ in (*self._buffer, *self._inflight):
+            if str(message.room_id) != str(room_id):
+                continue
+            if message_id is None or str(message.id) == str(message_id):
+                return True
+        return False
+
+    def enqueue(self, message):
+        """
+        Queue an unsaved Message for persistence (call from the event loop).
+        Returns False, queueing nothing, when the buffer is full.
+        """
+        if len(self._buffer) >= self.max_buffered:
+            metrics.counter("write_behind.overflow").inc()
+            return False
+        self._ensure_flusher()
+        self._buffer.append((message, time.monotonic()))
+        self._wakeup.set()
+        if len(self._buffer) >= self.max_batch_size:
+            self._full.set()
+        return True
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        backoff = self.max_delay
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            # Let the batch fill up until it is full or the oldest row is due
+            while self._buffer and len(self._buffer) < self.max_batch_size:
+                remaining = self._buffer[0][1] + self.max_delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            self._full.clear()
+
+            try:
+                await self.flush()
+                backoff = self.max_delay
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, retrying: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self._wakeup.set()
+
+    async def flush(self):
+        """Persist everything buffered so far"""
+        if not self._buffer and not self._inflight:
+            return
+        self._ensure_flusher()
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[: self.max_batch_size]
+                del self._buffer[: len(batch)]
+                self._inflight = batch
+                try:
+                    await database_sync_to_async(self._persist)(batch)
+                except Exception:
+                    # Keep ordering: failed rows go back in front of newer ones
+                    self._buffer[:0] = batch
+                    metrics.counter("write_behind.failed_flushes").inc()
+                    raise
+                finally:
+                    self._inflight = []
+
+    def flush_sync(self):
+        """Persist the buffer from synchronous code (interpreter shutdown)"""
+        while self._buffer:
+            batch = self._buffer[: self.max_batch_size]
+            del self._buffer[: len(batch)]
+            try:
+                self._persist(batch)
+            except Exception as e:
+                logger.error(
+                    f"Write-behind lost {len(batch)} messages at shutdown: {str(e)}"
+                )
+
+    def _persist(self, batch):
+        messages = [message for message, _ in batch]
+        try:
+            with transaction.atomic():
+                self._save(messages)
+        except IntegrityError:
+            messages = self._persist_one_by_one(messages)
+
+        now = time.monotonic()
+        metrics.summary("write_behind.batch_size").observe(len(batch))
+        metrics.summary("write_behind.lag_ms").observe((now - batch[0][1]) * 1000)
+        metrics.counter("write_behind.persisted").inc(len(messages))
+
+    def _persist_one_by_one(self, messages):
+        persisted = []
+        existing = set(
+            Message.objects.filter(id__in=[m.id for m in messages]).values_list(
+                "id", flat=True
+            )
+        )
+        for message in messages:
+            if message.id in existing:
+                continue
+            try:
+                with transaction.atomic():
+                    self._save([message])
+                persisted.append(message)
+            except IntegrityError as e:
+                metrics.counter("write_behind.dropped").inc()
+                logger.error(f"Dropping unpersistable message {message.id}: {str(e)}")
+        return persisted
+
+    def _save(self, messages):
+        """Insert messages with their side effects; call inside a transaction"""
+        Message.objects.bulk_create(messages)
+        self._record_room_activity(messages)
+        SyncEvent.record_messages(messages)
+        # Deferred by append_messages until the transaction commits
+        append_messages(messages)
+
+    def _record_room_activity(self, messages):
+        # bulk_create skips Message.save, so move each room's pointer here
+        newest = OrderedDict()
+        for message in messages:
+            current = newest.get(message.room_id)
+            if current is None or message.sent_at >= current.sent_at:
+                newest[message.room_id] = message
+        for room_id, message in newest.items():
+            Room.record_message_for(room_id, message)
+
+
+def _flush_on_sigterm(signum, frame):
+    """
+    Flush the buffer, then die of the signal as the default handler would.
+    The flush runs in its own thread: this one may be running the event
+    loop, where the ORM refuses synchronous queries.
+    """
+    flusher = threading.Thread(target=write_behind.flush_sync)
+    flusher.start()
+    flusher.join()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+def install_signal_handlers():
+    """
+    Flush on SIGTERM unless the server handles it already (a server that
+    does shuts down cleanly, and the atexit flush runs)
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _flush_on_sigterm)
+
+
+write_behind = MessageWriteBehind.from_settings()
+atexit.register(write_behind.flush_sync)
+install_signal_handlers()
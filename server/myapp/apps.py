@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myapp"
+
+    def ready(self):
+        """
+        Import signals when the app is ready.
+        This ensures the signal handlers are registered.
+        """
+        import myapp.signals
@@ -2,6 +2,8 @@ from django.core.mail import send_mail
 from django.conf import settings
 import logging
 
+from authen.email_outbox import render_email
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,62 +21,21 @@ def send_join_request_notification(join_request):
         return False
 
     subject = f"New join request for your project: {project.name}"
-
-    # Plain text email content
-    plain_message = f"""
-    Hi {owner.get_full_name() or owner.username},
-    
-    {requester.get_full_name() or requester.username} ({requester.username}) has requested to join your project "{project.name}".
-    
-    Their message: {join_request.message}
-    
-    To respond to this request, please visit: {settings.FRONTEND_URL}/projects/{project.id}/join-requests
-    
-    Thank you,
-    Startup Hub Team
-    """
-
-    html_message = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background-color: #4a86e8; color: white; padding: 10px; text-align: center; }}
-            .content {{ padding: 20px; }}
-            .button {{ display: inline-block; background-color: #4a86e8; color: white; 
-                     padding: 10px 20px; text-decoration: none; border-radius: 5px; }}
-            .message-box {{ background-color: #f5f5f5; padding: 10px; border-left: 4px solid #4a86e8; }}
-            .footer {{ font-size: 12px; color: #666; text-align: center; margin-top: 20px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h2>New Join Request</h2>
-            </div>
-            <div class="content">
-                <p>Hi {owner.get_full_name() or owner.username},</p>
-                
-                <p><strong>{requester.get_full_name() or requester.username}</strong> ({requester.username}) has requested to join your project <strong>"{project.name}"</strong>.</p>
-                
-                {"<p><strong>Their message:</strong></p><p class='message-box'>" + join_request.message + "</p>" if join_request.message else ""}
-                
-                <p style="text-align: center; margin-top: 30px;">
-                    <a href="{settings.FRONTEND_URL}/projects/{project.id}/join-requests" class="button">View Join Requests</a>
-                </p>
-            </div>
-            <div class="footer">
-                <p>This is an automated message from Startup Hub. Please do not reply to this email.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+    requests_url = f"{settings.FRONTEND_URL}/projects/{project.id}/join-requests"
+    plain_message, html_message = render_email(
+        "myapp/email/join_request",
+        {
+            "owner_name": owner.get_full_name() or owner.username,
+            "requester_name": requester.get_full_name() or requester.username,
+            "requester_username": requester.username,
+            "project_name": project.name,
+            "message": join_request.message,
+            "requests_url": requests_url,
+        },
+    )
 
     try:
-        # Send the email
+        # Queued by the outbox backend; the email worker delivers it
         send_mail(
             subject=subject,
             message=plain_message,
@@ -84,7 +45,7 @@ def send_join_request_notification(join_request):
             fail_silently=False,
         )
         logger.info(
-            f"Join request notification sent to {owner.email} for project {project.name}"
+            f"Join request notification queued for {owner.email} for project {project.name}"
         )
         return True
     except Exception as e:
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-17 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_joinrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='startupimage',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='startupimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -126,6 +126,9 @@ class StartupImage(models.Model):
         transformation={"width": 800, "height": 600, "crop": "fill"},
     )
     caption = models.CharField(max_length=200, blank=True)
+    # name -> {"url", "width", "height"} for the generated image sizes
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_placeholder = models.TextField(blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
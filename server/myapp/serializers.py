@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from communication.image_variants import pick_variant
+from communication.media_storage import media_url
 from .models import JoinRequest, StartupIdea, StartupImage
 from django.contrib.auth import get_user_model
 from dotenv import load_dotenv
@@ -47,13 +49,24 @@ class StartupImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = StartupImage
-        fields = ["id", "image", "image_url", "caption", "created_at"]
+        fields = [
+            "id",
+            "image",
+            "image_url",
+            "image_variants",
+            "image_placeholder",
+            "caption",
+            "created_at",
+        ]
+        read_only_fields = ["image_variants", "image_placeholder"]
         extra_kwargs = {"image": {"write_only": True}}
 
     def get_image_url(self, obj):
-        if obj.image:
-            return obj.image.url
-        return None
+        # Pick a stored size instead of asking Cloudinary for a transformation
+        variant = pick_variant(
+            obj.image_variants, self.context.get("width"), self.context.get("height")
+        )
+        return variant["url"] if variant else media_url(obj.image)
 
 
 class StartupIdeaSerializer(serializers.ModelSerializer):
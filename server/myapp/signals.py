@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from communication.media_storage import release_image_variants, release_media
+from .models import StartupImage
+
+
+@receiver(post_delete, sender=StartupImage)
+def release_startup_image(sender, instance, **kwargs):
+    """Drop the deleted image's reference to its stored file"""
+    release_media(instance.image)
+    release_image_variants(instance.image_variants)
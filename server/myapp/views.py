@@ -9,6 +9,7 @@ from django.db.models import Q
 import cloudinary
 from django.contrib.auth import get_user_model
 
+from communication.image_variants import store_image
 from .models import JoinRequest, StartupIdea, StartupImage
 from .serializers import (
     JoinRequestSerializer,
@@ -200,8 +201,17 @@ class StartupIdeaViewSet(viewsets.ModelViewSet):
                 {"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        try:
+            stored = store_image(image, folder="startup_hub/startup_images")
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         startup_image = StartupImage.objects.create(
-            startup_idea=idea, image=image, caption=caption
+            startup_idea=idea,
+            image=stored["url"],
+            image_variants=stored["variants"],
+            image_placeholder=stored["placeholder"],
+            caption=caption,
         )
 
         return Response(
@@ -22,6 +22,7 @@ from channels.auth import AuthMiddlewareStack
 import message.routing
 import webcall.routing
 import communication.routing
+from communication.middleware import ConnectTicketAuthMiddleware
 
 # Initialize Django ASGI application
 django_asgi_app = get_asgi_application()
@@ -34,7 +35,10 @@ application = ProtocolTypeRouter(
             #     message.routing.websocket_urlpatterns
             #     + webcall.routing.websocket_urlpatterns
             # )
-            URLRouter(communication.routing.websocket_urlpatterns)
+            # Signed connect tickets authenticate without touching the database
+            ConnectTicketAuthMiddleware(
+                URLRouter(communication.routing.websocket_urlpatterns)
+            )
         ),
     }
 )
@@ -78,6 +78,17 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 10,
 }
 
+# Token -> user lookups for HTTP and WebSocket auth: an in-process LRU of
+# LOCAL_SIZE entries kept LOCAL_TIMEOUT seconds, in front of the CACHE alias
+# (TIMEOUT seconds). CACHE should be shared by all workers in production so
+# logout and password changes reach every process
+TOKEN_CACHE = {
+    "CACHE": os.getenv("TOKEN_CACHE_ALIAS", "default"),
+    "TIMEOUT": 300,
+    "LOCAL_SIZE": 10000,
+    "LOCAL_TIMEOUT": 5,
+}
+
 # Updated CORS settings for better frontend integration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -196,6 +207,20 @@ CLOUDINARY_STORAGE = {
 # Use Cloudinary for media storage
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
+# Backend for chat and startup media: "cloudinary", or "local" to keep
+# content-addressed, deduplicated files under LOCATION (served at BASE_URL)
+MEDIA_STORAGE = {
+    "BACKEND": os.getenv("MEDIA_STORAGE_BACKEND", "cloudinary"),
+    "LOCATION": os.getenv("MEDIA_STORAGE_LOCATION", str(MEDIA_ROOT)),
+    "BASE_URL": MEDIA_URL,
+}
+
+# Image sizes are rendered in a process pool of this many workers (0 renders
+# inline on the calling thread)
+IMAGE_VARIANTS = {
+    "WORKERS": int(os.getenv("IMAGE_VARIANT_WORKERS", 2)),
+}
+
 # CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 
 CHANNEL_LAYERS = {
@@ -212,8 +237,169 @@ CHANNEL_LAYERS = {
     }
 }
 
-# Email settings
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# Delta sync (GET communication/sync/?since=): at most PAGE_SIZE change events
+# per response; `manage.py prune_sync_events` drops events older than
+# RETENTION_DAYS, after which older tokens get 410 and clients refetch. Events
+# younger than SETTLE_SECONDS are held back, so an event whose transaction
+# commits after a later one's (within that time) is still delivered
+SYNC = {
+    "PAGE_SIZE": 500,
+    "RETENTION_DAYS": 30,
+    "SETTLE_SECONDS": 2,
+}
+
+# Signed WebSocket connect tickets (POST communication/ws-ticket/): valid for
+# TTL seconds and one connect, granting at most MAX_ROOMS rooms each. Used
+# tickets are remembered in the CACHE alias, which the ASGI servers must share
+CONNECT_TICKETS = {
+    "TTL": int(os.getenv("CONNECT_TICKET_TTL", 60)),
+    "MAX_ROOMS": 50,
+    "CACHE": os.getenv("CONNECT_TICKET_CACHE_ALIAS", "default"),
+}
+
+# Room membership sets for participant checks: an in-process LRU of LOCAL_SIZE
+# rooms kept LOCAL_TIMEOUT seconds, in front of the CACHE alias (TIMEOUT
+# seconds), dropped whenever a participant joins or leaves
+MEMBERSHIP_CACHE = {
+    "CACHE": os.getenv("MEMBERSHIP_CACHE_ALIAS", "default"),
+    "TIMEOUT": 300,
+    "LOCAL_SIZE": 10000,
+    "LOCAL_TIMEOUT": 5,
+}
+
+# Presence (who is online): per-device TTL keys on the channel-layer Redis,
+# refreshed by WebSocket heartbeats. "auto" falls back to an in-process store
+# when the channel layer is not Redis (tests, local development)
+PRESENCE = {
+    "BACKEND": os.getenv("PRESENCE_BACKEND", "auto"),
+    "REDIS_URL": f"redis://{os.environ.get('REDIS_HOST', 'redis')}:"
+    f"{int(os.environ.get('REDIS_PORT', 6379))}/0",
+    "TTL": int(os.getenv("PRESENCE_TTL", 60)),
+}
+
+# Hot-room tail cache: the newest SIZE serialized messages of each room read
+# recently, kept TTL seconds, so the first page of history skips the message
+# query. "auto" uses the channel-layer Redis like PRESENCE
+ROOM_TAIL = {
+    "BACKEND": os.getenv("ROOM_TAIL_BACKEND", "auto"),
+    "REDIS_URL": f"redis://{os.environ.get('REDIS_HOST', 'redis')}:"
+    f"{int(os.environ.get('REDIS_PORT', 6379))}/0",
+    "SIZE": 100,
+    "TTL": int(os.getenv("ROOM_TAIL_TTL", 3600)),
+}
+
+# Background media pipeline (opt-in): media messages are created right away in
+# the "processing" state and uploaded by `manage.py process_media_jobs`.
+# STAGING_DIR must be shared between the ASGI servers and the workers. While
+# idle the worker deletes done and failed jobs older than PURGE_AFTER_DAYS,
+# at most PURGE_BATCH_SIZE per query and once every PURGE_INTERVAL seconds
+MEDIA_JOBS = {
+    "ENABLED": os.getenv("MEDIA_JOBS", "False") == "True",
+    "STAGING_DIR": os.getenv("MEDIA_JOBS_STAGING_DIR"),
+    "WORKERS": int(os.getenv("MEDIA_JOBS_WORKERS", 4)),
+    "POOL": os.getenv("MEDIA_JOBS_POOL", "thread"),
+    "MAX_ATTEMPTS": 3,
+    "RETRY_DELAY_SECONDS": 5,
+    "LEASE_SECONDS": 300,
+    "PURGE_AFTER_DAYS": 7,
+    "PURGE_BATCH_SIZE": 1000,
+    "PURGE_INTERVAL": 60,
+}
+
+# Call expiry worker (manage.py expire_calls): every INTERVAL seconds, marks
+# unanswered call notifications and invitations past expires_at as expired
+# and deletes those expired over PURGE_AFTER_DAYS ago, BATCH_SIZE rows a time
+CALL_EXPIRY = {
+    "INTERVAL": 2.0,
+    "BATCH_SIZE": 500,
+    "PURGE_AFTER_DAYS": 7,
+}
+
+# TURN relays with time-limited REST credentials (coturn use-auth-secret and
+# static-auth-secret=SECRET): each user gets the username "<expiry>:<user id>"
+# and its HMAC-SHA1 under SECRET, valid TTL seconds. A user's ICE servers are
+# cached in the CACHE alias until REFRESH_BEFORE seconds before they expire.
+# Without URLS or SECRET only STUN is served
+WEBRTC_TURN = {
+    "URLS": [url for url in os.getenv("TURN_URLS", "").split(",") if url],
+    "SECRET": os.getenv("TURN_SECRET", ""),
+    "TTL": int(os.getenv("TURN_TTL", 86400)),
+    "REFRESH_BEFORE": 3600,
+    "CACHE": os.getenv("WEBRTC_CACHE_ALIAS", "default"),
+}
+
+# Push notifications: requests queue PushDelivery rows and the dispatcher
+# (manage.py dispatch_push) posts them to each provider's batch endpoint,
+# BATCH_SIZE messages per request over at most MAX_CONNECTIONS keep-alive
+# connections. Failed sends are retried after RETRY_DELAY_SECONDS, doubling
+# each time, and dead-lettered after MAX_ATTEMPTS. While idle the dispatcher
+# deletes sent and dead deliveries older than PURGE_AFTER_DAYS, at most
+# PURGE_BATCH_SIZE per query and once every PURGE_INTERVAL seconds
+PUSH_NOTIFICATIONS = {
+    "DEFAULT_PROVIDER": "fcm",
+    "PROVIDERS": {
+        "fcm": {
+            "URL": os.getenv("PUSH_FCM_URL", ""),
+            "API_KEY": os.getenv("PUSH_FCM_API_KEY", ""),
+            "BATCH_SIZE": 500,
+        },
+    },
+    "CLAIM_SIZE": 1000,
+    "POLL_INTERVAL": 0.25,
+    "MAX_CONNECTIONS": 10,
+    "TIMEOUT": 10,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY_SECONDS": 2,
+    "LEASE_SECONDS": 60,
+    "PURGE_AFTER_DAYS": 7,
+    "PURGE_BATCH_SIZE": 1000,
+    "PURGE_INTERVAL": 60,
+}
+
+# Typing indicators: per-room aggregation of typing events into at most one
+# typing_users frame per INTERVAL_MS; typers silent for TTL_MS are dropped.
+# Each worker reports its own typers (re-sent every TTL_MS / 2 while
+# unchanged) and receiving connections merge the reports per worker
+TYPING_INDICATORS = {
+    "INTERVAL_MS": 500,
+    "TTL_MS": 6000,
+}
+
+# Flow control for chat WebSockets. RATE_LIMITS are token buckets per class of
+# client frame: RATE frames per second with bursts of BURST per connection,
+# and USER_RATE/USER_BURST across one user's connections on a worker; a RATE of
+# 0 blocks a class once its BURST is spent. A throttled mark_read is not
+# dropped: the newest one is applied once the limit allows. Frames to a client
+# queue up to OUTBOUND_QUEUE_SIZE deep before typing and presence updates are
+# dropped
+CHAT_FLOW_CONTROL = {
+    "OUTBOUND_QUEUE_SIZE": 256,
+    "RATE_LIMITS": {
+        "messages": {"RATE": 5, "BURST": 20, "USER_RATE": 10, "USER_BURST": 40},
+        # Trickled ICE candidates arrive in bursts at call setup
+        "signaling": {"RATE": 20, "BURST": 100, "USER_RATE": 40, "USER_BURST": 200},
+        "typing": {"RATE": 2, "BURST": 5, "USER_RATE": 4, "USER_BURST": 10},
+        "receipts": {"RATE": 2, "BURST": 5, "USER_RATE": 4, "USER_BURST": 10},
+    },
+}
+
+# Write-behind chat persistence (opt-in): ChatConsumer broadcasts text messages
+# immediately and inserts them in micro-batches of up to MAX_BATCH_SIZE rows,
+# waiting at most MAX_DELAY_MS for a batch to fill. Once MAX_BUFFERED rows are
+# waiting (the database is down or behind), new messages are inserted inline.
+# The buffer is flushed on disconnect, exit and SIGTERM, but it is held in
+# memory: a worker killed outright (SIGKILL, OOM) loses messages it has
+# broadcast but not yet written, normally at most the last MAX_DELAY_MS
+CHAT_WRITE_BEHIND = {
+    "ENABLED": os.getenv("CHAT_WRITE_BEHIND", "False") == "True",
+    "MAX_BATCH_SIZE": int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", 200)),
+    "MAX_DELAY_MS": int(os.getenv("CHAT_WRITE_BEHIND_DELAY_MS", 50)),
+    "MAX_BUFFERED": 10000,
+}
+
+# Email settings. Mail is queued in the outbox (authen.QueuedEmail) and
+# delivered over SMTP by the worker (manage.py send_queued_email)
+EMAIL_BACKEND = "authen.email_outbox.OutboxEmailBackend"
 
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
@@ -222,6 +408,23 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "Your App <noreply@yourapp.com>")
 
+# Email worker: claims up to BATCH_SIZE queued emails per round and sends
+# them over one SMTP connection; failures are retried after
+# RETRY_DELAY_SECONDS, doubling each time, up to MAX_ATTEMPTS. Sent emails
+# keep no body; while idle the worker deletes sent and dead ones older than
+# PURGE_AFTER_DAYS, at most PURGE_BATCH_SIZE per query and once every
+# PURGE_INTERVAL seconds
+EMAIL_OUTBOX = {
+    "BATCH_SIZE": 100,
+    "POLL_INTERVAL": 1.0,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY_SECONDS": 30,
+    "LEASE_SECONDS": 300,
+    "PURGE_AFTER_DAYS": 7,
+    "PURGE_BATCH_SIZE": 1000,
+    "PURGE_INTERVAL": 60,
+}
+
 RESET_PASSWORD_FRONTEND_URL = os.getenv("RESET_PASSWORD_FRONTEND_URL")
 
 # File upload settings
@@ -43,3 +43,6 @@ urlpatterns = [
 # Add media URL configuration for profile pictures if needed
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    urlpatterns += static(
+        settings.MEDIA_URL, document_root=settings.MEDIA_STORAGE["LOCATION"]
+    )
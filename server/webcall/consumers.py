@@ -4,7 +4,12 @@ from channels.db import database_sync_to_async
 from .models import Room, Participant
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from communication.membership import is_room_member_async
+from communication.presence import get_presence
 import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -15,6 +20,7 @@ class VideoCallConsumer(AsyncJsonWebsocketConsumer):
         self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
         self.room_group_name = f"call_{self.room_id}"
         self.user_specific_group = f"user_{self.user.id}"
+        self.presence_scope = f"call:{self.room_id}"
 
         # Check if user is authenticated
         if self.user.is_anonymous:
@@ -22,7 +28,9 @@ class VideoCallConsumer(AsyncJsonWebsocketConsumer):
             return
 
         # Check if user is a participant in the room
-        is_participant = await self.is_room_participant(self.user.id, self.room_id)
+        is_participant = await is_room_member_async(
+            self.user, self.room_id, Participant
+        )
         if not is_participant:
             await self.close()
             return
@@ -163,6 +171,11 @@ class VideoCallConsumer(AsyncJsonWebsocketConsumer):
             # End the call for everyone
             await self.end_call()
 
+        elif message_type == "heartbeat":
+            # Keep this connection counted as present in the call
+            await self.update_presence(True)
+            await self.send_json({"type": "heartbeat_ack"})
+
     # WebRTC signaling handlers
     async def user_joined(self, event):
         # Notify WebSocket about a user joining
@@ -240,11 +253,6 @@ class VideoCallConsumer(AsyncJsonWebsocketConsumer):
         )
 
     # Database access methods
-    @database_sync_to_async
-    def is_room_participant(self, user_id, room_id):
-        """Check if the user is a participant in the room"""
-        return Participant.objects.filter(user_id=user_id, room_id=room_id).exists()
-
     @database_sync_to_async
     def update_audio_status(self, is_muted):
         """Update audio mute status in database"""
@@ -269,33 +277,27 @@ class VideoCallConsumer(AsyncJsonWebsocketConsumer):
 
     # Presence methods
     async def update_presence(self, is_online):
-        """Update user presence in Redis"""
-        # Use Redis channel layer to track presence
-        presence_key = f"presence:{self.room_id}:{self.user.id}"
-
-        if is_online:
-            # Store presence with 30-second expiration
-            await self.update_participant_last_active()
-
-    @database_sync_to_async
-    def update_participant_last_active(self):
-        """Update the last_active timestamp for the participant"""
+        """Update user presence in Redis (per connection, scoped to this call)"""
         try:
-            participant = Participant.objects.get(user=self.user, room_id=self.room_id)
-            participant.last_active = timezone.now()
-            participant.save(update_fields=["last_active"])
-        except Participant.DoesNotExist:
-            pass
-
-    @database_sync_to_async
-    def get_active_participants(self):
-        """Get list of active participants in the room"""
-        # Consider participants active if they've been active in the last 30 seconds
-        thirty_sec_ago = timezone.now() - timezone.timedelta(seconds=30)
-        participants = Participant.objects.filter(
-            room_id=self.room_id, last_active__gte=thirty_sec_ago
-        ).select_related("user")
-
+            presence = get_presence()
+            if is_online:
+                await presence.touch(
+                    self.user.id, self.channel_name, scope=self.presence_scope
+                )
+            else:
+                await presence.leave(
+                    self.user.id, self.channel_name, scope=self.presence_scope
+                )
+        except Exception as e:
+            logger.error(f"Error updating presence: {str(e)}")
+
+    async def get_active_participants(self):
+        """Get list of participants currently connected to the call"""
+        participants = await self.get_room_participants()
+        online = await get_presence().online_users(
+            [participant.user_id for participant in participants],
+            scope=self.presence_scope,
+        )
         return [
             {
                 "user_id": participant.user.id,
@@ -305,8 +307,16 @@ class VideoCallConsumer(AsyncJsonWebsocketConsumer):
                 "is_video_muted": participant.is_video_muted,
             }
             for participant in participants
+            if participant.user_id in online
         ]
 
+    @database_sync_to_async
+    def get_room_participants(self):
+        """Get the room's participants with their users"""
+        return list(
+            Participant.objects.filter(room_id=self.room_id).select_related("user")
+        )
+
     @database_sync_to_async
     def end_call(self):
         """End the call for all participants"""
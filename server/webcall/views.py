@@ -7,6 +7,7 @@ from .models import Room, Participant
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from django.utils import timezone
+from communication.membership import room_members
 
 
 @api_view(["POST"])
@@ -54,9 +55,9 @@ def join_room(request, room_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    # Check if room is at capacity
-    current_participants = Participant.objects.filter(room=room).count()
-    if current_participants >= room.max_participants:
+    # Check if room is at capacity (members already in it may rejoin)
+    members = room_members(room.id, Participant)
+    if request.user.pk not in members and len(members) >= room.max_participants:
         return Response(
             {"success": False, "error": "Room is at maximum capacity"},
             status=status.HTTP_400_BAD_REQUEST,